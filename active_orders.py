@@ -0,0 +1,211 @@
+# active_orders.py
+"""
+Vista en memoria, compartida por todas las sesiones del proceso, de las órdenes
+activas (todas las que no están pagadas ni anuladas), indexadas por estado, mesa,
+mesero y estación de despacho.
+
+Se carga una vez y se mantiene al día con una sola suscripción al feed '_changes'
+de las particiones 'ordenes' y 'despachos', de modo que cocina, bar y los monitores
+leen de memoria en lugar de descargar la partición en cada rerun. Los eventos de
+despacho (dispatch_events) se combinan con cada orden al leerla.
+
+Se obtiene con couchdb_utils.get_active_orders_store(db).
+"""
+
+import copy
+import threading
+import couchdb
+import changes_feed
+import dispatch_events
+import order_lifecycle
+
+ORDENES_PARTITION_KEY = "ordenes"
+
+# Estados con los que una orden sale de la vista
+ESTADOS_CERRADOS = order_lifecycle.ESTADOS_FINALES
+
+
+def es_activa(orden):
+    """True si la orden debe estar en la vista de órdenes activas."""
+    return orden.get('estado') not in ESTADOS_CERRADOS
+
+
+def _generacion(rev):
+    """Número de generación de un '_rev' ('3-abc...' -> 3)."""
+    try:
+        return int(str(rev).split('-', 1)[0])
+    except ValueError:
+        return 0
+
+
+class OrdenesActivas:
+    """
+    Órdenes activas indexadas por _id, con índices secundarios por 'estado', 'mesa_id',
+    'mesero_id' y estación. Las lecturas devuelven copias, ordenadas por fecha_creacion.
+    estacion_de_plato(plato_id) -> nombre de estación o None; define el índice por estación.
+    """
+
+    def __init__(self, db, estacion_de_plato=None):
+        self._lock = threading.RLock()
+        self._ordenes = {}
+        self._indices = {'estado': {}, 'mesa_id': {}, 'mesero_id': {}, 'estacion': {}}
+        self._claves = {}  # _id -> claves indexadas de la orden, para poder quitarla
+        self._despachos = {}  # orden_id -> {evento_id: evento de despacho}
+        self._estacion_de_plato = estacion_de_plato or (lambda plato_id: None)
+        self._version = 0
+
+        # Se toma el seq antes de cargar para no perder cambios ocurridos durante la carga
+        since = changes_feed.seq_actual(db)
+        _, _, data = db.resource('_partition', ORDENES_PARTITION_KEY, '_find').post_json(body={
+            "selector": {"estado": {"$nin": ESTADOS_CERRADOS}},
+            "limit": 100000,
+        })
+        with self._lock:
+            for orden in data.get('docs', []):
+                self._indexar(couchdb.Document(orden))
+        if self._ordenes:
+            _, _, data = db.resource('_partition', dispatch_events.DESPACHOS_PARTITION_KEY, '_find').post_json(body={
+                "selector": {"orden_id": {"$in": list(self._ordenes)}},
+                "limit": 100000,
+            })
+            with self._lock:
+                for evento in data.get('docs', []):
+                    self._registrar_evento(evento)
+
+        self._feed = changes_feed.SuscriptorCambios(
+            db, [ORDENES_PARTITION_KEY, dispatch_events.DESPACHOS_PARTITION_KEY], since,
+            self._aplicar_cambios, nombre="ordenes-activas"
+        )
+        self._feed.start()
+
+    def ordenes(self, estados=None, mesa_id=None, mesero_id=None, estacion=None):
+        """
+        Retorna copias de las órdenes activas que cumplen todos los filtros dados.
+        estados: lista de estados; estacion: órdenes con al menos un item no anulado de esa estación.
+        """
+        with self._lock:
+            candidatos = None
+            filtros = [
+                ('estado', estados),
+                ('mesa_id', [mesa_id] if mesa_id is not None else None),
+                ('mesero_id', [mesero_id] if mesero_id is not None else None),
+                ('estacion', [estacion] if estacion is not None else None),
+            ]
+            for indice, valores in filtros:
+                if valores is None:
+                    continue
+                ids = set()
+                for valor in valores:
+                    ids |= self._indices[indice].get(valor, set())
+                candidatos = ids if candidatos is None else candidatos & ids
+
+            ids = self._ordenes.keys() if candidatos is None else candidatos
+            ordenes = [self._ordenes[orden_id] for orden_id in ids]
+            ordenes.sort(key=lambda o: o.get('fecha_creacion', ''))
+            return [self._copia(orden) for orden in ordenes]
+
+    def obtener(self, orden_id):
+        """Retorna una copia de la orden activa, o None si no está en la vista."""
+        with self._lock:
+            orden = self._ordenes.get(orden_id)
+            return self._copia(orden) if orden is not None else None
+
+    def version(self):
+        """Contador que aumenta con cada cambio aplicado (útil para saber si hay que redibujar)."""
+        with self._lock:
+            return self._version
+
+    def registrar_documento(self, doc):
+        """Aplica de inmediato una orden o un evento de despacho recién guardado (sin esperar al feed)."""
+        self._aplicar_cambios([{'id': doc['_id'], 'doc': dict(doc), 'deleted': doc.get('_deleted', False)}])
+
+    def reindexar_estaciones(self, estacion_de_plato):
+        """Cambia la función de ruteo plato -> estación y recalcula el índice por estación."""
+        with self._lock:
+            self._estacion_de_plato = estacion_de_plato
+            for orden in list(self._ordenes.values()):
+                self._indexar(orden)
+            self._version += 1
+
+    def estado(self):
+        """Información de diagnóstico: órdenes por estado y estado del feed."""
+        with self._lock:
+            return {
+                'ordenes': len(self._ordenes),
+                'por_estado': {estado: len(ids) for estado, ids in self._indices['estado'].items()},
+                'since': self._feed.since,
+                'feed_activo': self._feed.is_alive(),
+                'ultimo_error': self._feed.ultimo_error,
+            }
+
+    def _copia(self, orden):
+        """Copia de la orden con sus eventos de despacho aplicados a los items."""
+        return dispatch_events.aplicar_eventos(
+            copy.deepcopy(orden), list(self._despachos.get(orden['_id'], {}).values())
+        )
+
+    def _registrar_evento(self, evento):
+        # Solo interesan los despachos de órdenes que siguen activas
+        if evento.get('orden_id') in self._ordenes:
+            self._despachos.setdefault(evento['orden_id'], {})[evento['_id']] = evento
+
+    def _claves_de(self, orden):
+        estaciones = {
+            self._estacion_de_plato(item.get('plato_id'))
+            for item in orden.get('items', [])
+            if not item.get('anulado', False)
+        }
+        estaciones.discard(None)
+        return {
+            'estado': {orden.get('estado')},
+            'mesa_id': {orden.get('mesa_id')},
+            'mesero_id': {orden.get('mesero_id')},
+            'estacion': estaciones,
+        }
+
+    def _quitar(self, orden_id, con_despachos=True):
+        self._ordenes.pop(orden_id, None)
+        if con_despachos:
+            self._despachos.pop(orden_id, None)
+        for indice, valores in self._claves.pop(orden_id, {}).items():
+            for valor in valores:
+                ids = self._indices[indice].get(valor)
+                if ids is not None:
+                    ids.discard(orden_id)
+                    if not ids:
+                        del self._indices[indice][valor]
+
+    def _indexar(self, orden):
+        self._quitar(orden['_id'], con_despachos=False)
+        claves = self._claves_de(orden)
+        self._ordenes[orden['_id']] = orden
+        self._claves[orden['_id']] = claves
+        for indice, valores in claves.items():
+            for valor in valores:
+                self._indices[indice].setdefault(valor, set()).add(orden['_id'])
+
+    def _es_anterior(self, orden_id, orden):
+        """True si la vista ya tiene una revisión más nueva de la orden (p. ej. registrada antes de llegar el feed)."""
+        actual = self._ordenes.get(orden_id)
+        if actual is None or orden is None:
+            return False
+        return _generacion(orden.get('_rev')) < _generacion(actual.get('_rev'))
+
+    def _aplicar_cambios(self, resultados):
+        with self._lock:
+            for cambio in resultados:
+                if changes_feed.particion_de(cambio['id']) == dispatch_events.DESPACHOS_PARTITION_KEY:
+                    if cambio.get('deleted'):
+                        for eventos in self._despachos.values():
+                            eventos.pop(cambio['id'], None)
+                    elif cambio.get('doc') is not None:
+                        self._registrar_evento(cambio['doc'])
+                    continue
+                orden = cambio.get('doc')
+                if self._es_anterior(cambio['id'], orden):
+                    continue
+                if cambio.get('deleted') or orden is None or not es_activa(orden):
+                    self._quitar(cambio['id'])
+                else:
+                    self._indexar(couchdb.Document(orden))
+            self._version += 1
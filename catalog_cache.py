@@ -0,0 +1,104 @@
+# catalog_cache.py
+"""
+Caché en memoria, compartida por todas las sesiones del proceso, de las
+particiones de catálogo (platos, menús, mesas, usuarios, promociones,
+ingredientes, relaciones plato-ingrediente y la configuración del sistema). Se carga una vez y se mantiene al día con el feed '_changes',
+aplicando solo los documentos modificados.
+
+Se obtiene con couchdb_utils.get_catalog_documents(db, particion).
+"""
+
+import copy
+import threading
+import couchdb
+import changes_feed
+
+# Particiones de datos de referencia que se leen en casi todas las páginas
+PARTICIONES_CATALOGO = ["platos", "menus", "menu", "mesas", "Usuario", "promociones", "ingredientes", "plato_ingrediente", "configuracion"]
+
+
+class CatalogoCache:
+    """
+    Documentos de catálogo indexados por partición y _id.
+    Las lecturas devuelven copias, por lo que las páginas pueden modificarlas sin alterar la caché.
+    """
+
+    def __init__(self, db, particiones=PARTICIONES_CATALOGO):
+        self._lock = threading.RLock()
+        self._particiones = list(particiones)
+        self._docs = {p: {} for p in self._particiones}
+        self._versiones = {p: 0 for p in self._particiones}
+        self._suscriptores = []
+
+        # Se toma el seq antes de cargar para no perder cambios ocurridos durante la carga
+        since = changes_feed.seq_actual(db)
+        for particion in self._particiones:
+            rows = db.view(f'_partition/{particion}/_all_docs', include_docs=True)
+            self._docs[particion] = {row.id: row.doc for row in rows}
+
+        self._feed = changes_feed.SuscriptorCambios(
+            db, self._particiones, since, self._aplicar_cambios, nombre="catalogo-cache"
+        )
+        self._feed.start()
+
+    def obtener(self, particion):
+        """Retorna copias de los documentos de la partición, ordenados por _id."""
+        with self._lock:
+            docs = [self._docs[particion][doc_id] for doc_id in sorted(self._docs[particion])]
+            return [copy.deepcopy(doc) for doc in docs]
+
+    def obtener_documento(self, doc_id):
+        """Retorna una copia de un documento de catálogo por _id, o None si no existe."""
+        particion = changes_feed.particion_de(doc_id)
+        with self._lock:
+            doc = self._docs.get(particion, {}).get(doc_id)
+            return copy.deepcopy(doc) if doc is not None else None
+
+    def version(self, particion):
+        """Contador que aumenta cada vez que cambia algún documento de la partición."""
+        with self._lock:
+            return self._versiones.get(particion, 0)
+
+    def suscribir(self, callback):
+        """
+        Registra `callback(particiones_modificadas)` para recibir avisos después de cada lote aplicado.
+        Corre en el hilo del feed: no debe usar funciones de Streamlit.
+        """
+        with self._lock:
+            self._suscriptores.append(callback)
+
+    def registrar_documento(self, doc):
+        """Aplica de inmediato un documento recién guardado (sin esperar al feed)."""
+        self._aplicar_cambios([{'id': doc['_id'], 'doc': dict(doc), 'deleted': doc.get('_deleted', False)}])
+
+    def estado(self):
+        """Información de diagnóstico: cantidad de documentos por partición y estado del feed."""
+        with self._lock:
+            return {
+                'documentos': {p: len(docs) for p, docs in self._docs.items()},
+                'since': self._feed.since,
+                'feed_activo': self._feed.is_alive(),
+                'ultimo_error': self._feed.ultimo_error,
+            }
+
+    def _aplicar_cambios(self, resultados):
+        modificadas = set()
+        with self._lock:
+            for cambio in resultados:
+                particion = changes_feed.particion_de(cambio['id'])
+                if particion not in self._docs:
+                    continue
+                if cambio.get('deleted'):
+                    self._docs[particion].pop(cambio['id'], None)
+                elif cambio.get('doc') is not None:
+                    self._docs[particion][cambio['id']] = couchdb.Document(cambio['doc'])
+                self._versiones[particion] += 1
+                modificadas.add(particion)
+            suscriptores = list(self._suscriptores)
+
+        if modificadas:
+            for callback in suscriptores:
+                try:
+                    callback(modificadas)
+                except Exception as e:
+                    print(f"Error en suscriptor de la caché de catálogo: {e}")
@@ -0,0 +1,90 @@
+# changes_feed.py
+"""
+Lectura del feed '_changes' de CouchDB limitada a un conjunto de particiones.
+
+Lo usan las cachés en memoria del proceso (catálogo, órdenes activas, etc.) para
+aplicar solo los documentos que cambiaron en lugar de volver a descargar
+particiones completas en cada rerun de Streamlit.
+"""
+
+import threading
+import time
+import couchdb
+
+# Tiempo máximo (ms) que CouchDB mantiene abierta una petición longpoll sin cambios
+LONGPOLL_TIMEOUT_MS = 25000
+
+# Espera entre reintentos cuando el feed falla (CouchDB caído, red, etc.)
+REINTENTO_SEGUNDOS = 3
+
+
+def abrir_conexion_feed(db):
+    """
+    Retorna una instancia de Database con sesión HTTP propia para el longpoll,
+    de modo que las peticiones bloqueadas no ocupen conexiones de la sesión principal.
+    """
+    sesion = couchdb.http.Session(timeout=LONGPOLL_TIMEOUT_MS / 1000 + 30)
+    feed_db = couchdb.Database(db.resource.url, session=sesion)
+    feed_db.resource.credentials = db.resource.credentials
+    return feed_db
+
+
+def seq_actual(db):
+    """Retorna el update_seq actual de la base de datos (punto de partida del feed)."""
+    return db.info()['update_seq']
+
+
+def particion_de(doc_id):
+    """Extrae la clave de partición de un _id con formato '<particion>:<sufijo>'."""
+    return doc_id.split(':', 1)[0] if ':' in doc_id else None
+
+
+def leer_cambios(db, since, particiones, timeout_ms=LONGPOLL_TIMEOUT_MS, include_docs=True):
+    """
+    Ejecuta una petición longpoll a '_changes' filtrada (con '_selector') a las particiones dadas.
+    Retorna (resultados, last_seq). Cada resultado trae 'id', 'deleted' y, si include_docs, 'doc'.
+    """
+    patron = "^(" + "|".join(particiones) + "):"
+    _, _, data = db.resource.post_json(
+        '_changes',
+        body={"selector": {"_id": {"$regex": patron}}},
+        filter='_selector',
+        feed='longpoll',
+        since=since,
+        timeout=timeout_ms,
+        include_docs='true' if include_docs else 'false'
+    )
+    return data.get('results', []), data.get('last_seq', since)
+
+
+class SuscriptorCambios(threading.Thread):
+    """
+    Hilo en segundo plano que sigue el feed '_changes' de las particiones indicadas
+    y entrega cada lote de resultados a `callback(resultados)`.
+    El callback no debe llamar funciones de Streamlit (corre fuera de la sesión).
+    """
+
+    def __init__(self, db, particiones, since, callback, nombre="changes-feed"):
+        super().__init__(name=nombre, daemon=True)
+        self._db = abrir_conexion_feed(db)
+        self._particiones = list(particiones)
+        self._callback = callback
+        self._detener = threading.Event()
+        self.since = since
+        self.ultimo_error = None
+
+    def detener(self):
+        self._detener.set()
+
+    def run(self):
+        while not self._detener.is_set():
+            try:
+                resultados, last_seq = leer_cambios(self._db, self.since, self._particiones)
+                if resultados:
+                    self._callback(resultados)
+                self.since = last_seq
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = str(e)
+                print(f"Error en el feed de cambios ({self.name}): {e}")
+                self._detener.wait(REINTENTO_SEGUNDOS)
@@ -0,0 +1,222 @@
+# consumption_forecast.py
+"""
+Pronóstico de consumo de ingredientes y sugerencias de compra por proveedor.
+
+Las órdenes pagadas se acumulan en una matriz densa día x plato (unidades
+vendidas por fecha local). El consumo día x ingrediente se obtiene multiplicando
+esa matriz por la matriz de recetas plato x ingrediente (recipe_engine), de modo
+que un cambio de receta se aplica a toda la historia sin volver a leer órdenes.
+Sobre el consumo se ajustan, para todos los ingredientes a la vez, un perfil por
+día de la semana y un factor de tendencia (promedio móvil de 7 días contra el de
+28 días).
+
+La matriz llega hasta ayer (el día en curso está incompleto y sesgaría el perfil
+y la tendencia hacia abajo) y se actualiza de forma incremental: cada
+actualización lee solo las órdenes de los días nuevos (más los últimos
+REPROCESAR_DIAS, que aún pueden recibir pagos). El último proveedor de cada
+ingrediente también se mantiene en memoria y solo se leen las compras nuevas.
+Se obtienen con couchdb_utils.get_consumption_forecast(db) y
+get_supplier_history(db).
+"""
+
+import threading
+from datetime import datetime, time, timedelta
+import numpy as np
+import pandas as pd
+import pytz
+
+ZONA_HORARIA = pytz.timezone('America/El_Salvador')
+
+# Días de historia que se conservan y usan para el perfil semanal
+DIAS_HISTORIA = 56
+
+# Días recientes que se vuelven a leer en cada actualización (órdenes pagadas después de creadas)
+REPROCESAR_DIAS = 2
+
+# Ventanas de los promedios móviles del factor de tendencia
+VENTANA_CORTA = 7
+VENTANA_LARGA = 28
+
+# Límites del factor de tendencia (evita extrapolar picos o caídas de una sola semana)
+TENDENCIA_MIN = 0.5
+TENDENCIA_MAX = 2.0
+
+# Las cantidades sugeridas se redondean hacia arriba a este paso (el del formulario de compras)
+PASO_COMPRA = 0.5
+
+# Las compras se vuelven a leer desde un poco antes de la última registrada (escrituras simultáneas)
+MARGEN_COMPRAS = timedelta(minutes=5)
+
+SIN_PROVEEDOR = "Sin proveedor"
+
+
+def _hoy():
+    return datetime.now(ZONA_HORARIA).date()
+
+
+def matriz_ventas(ordenes, dias):
+    """
+    DataFrame día x plato_id con las unidades vendidas de los items no anulados,
+    por fecha local de creación de la orden. dias: DatetimeIndex de las filas.
+    """
+    filas = [
+        (orden['fecha_creacion'], item['plato_id'], item.get('cantidad', 1))
+        for orden in ordenes if orden.get('fecha_creacion')
+        for item in orden.get('items', [])
+        if item.get('plato_id') and not item.get('anulado', False)
+    ]
+    if not filas:
+        return pd.DataFrame(0.0, index=dias, columns=pd.Index([], name='plato_id'))
+    ventas = pd.DataFrame(filas, columns=['fecha', 'plato_id', 'cantidad'])
+    ventas['dia'] = (pd.to_datetime(ventas['fecha'], utc=True, format='ISO8601')
+                     .dt.tz_convert(ZONA_HORARIA).dt.tz_localize(None).dt.normalize())
+    matriz = ventas.pivot_table(index='dia', columns='plato_id', values='cantidad', aggfunc='sum', fill_value=0)
+    return matriz.reindex(dias, fill_value=0).astype(float)
+
+
+def matriz_recetas(plato_ids, receta):
+    """
+    DataFrame plato x ingrediente con la cantidad de cada ingrediente por unidad de plato.
+    receta(plato_id) -> ((ingrediente_id, cantidad), ...) o None.
+    """
+    recetas = {plato_id: dict(receta(plato_id) or ()) for plato_id in plato_ids}
+    ingrediente_ids = sorted({ingrediente_id for r in recetas.values() for ingrediente_id in r})
+    return pd.DataFrame.from_dict(recetas, orient='index', columns=ingrediente_ids).reindex(plato_ids).fillna(0.0)
+
+
+def pronosticar(consumo, dias_futuros):
+    """
+    Consumo previsto por ingrediente (Series) para los días futuros (DatetimeIndex).
+    Cada día se estima con el promedio de su día de la semana, escalado por la tendencia
+    reciente (promedio de VENTANA_CORTA días / promedio de VENTANA_LARGA días).
+    """
+    if consumo.empty or consumo.shape[1] == 0:
+        return pd.Series(dtype=float)
+    perfil = consumo.groupby(consumo.index.dayofweek).mean().reindex(range(7), fill_value=0.0)
+    corta = consumo.tail(VENTANA_CORTA).mean()
+    larga = consumo.tail(VENTANA_LARGA).mean()
+    tendencia = (corta / larga.where(larga > 0)).fillna(1.0).clip(TENDENCIA_MIN, TENDENCIA_MAX)
+    return perfil.loc[dias_futuros.dayofweek].sum() * tendencia
+
+
+def sugerir_compras(previsto, stocks, ingredientes, proveedores):
+    """
+    DataFrame con la cantidad sugerida por ingrediente: consumo previsto menos el stock
+    actual, redondeado hacia arriba a PASO_COMPRA. Solo incluye sugerencias positivas.
+    stocks: {ingrediente_id: stock}; ingredientes: {ingrediente_id: documento};
+    proveedores: {ingrediente_id: {'proveedor', 'proveedor_id', 'precio_unitario'}}.
+    """
+    columnas = ['Proveedor', 'Descripción', 'Unidad', 'Stock', 'Consumo previsto', 'Sugerido', 'Precio Unitario', 'ingrediente_id', 'proveedor_id']
+    previsto = previsto[previsto.index.isin(list(ingredientes))]
+    if previsto.empty:
+        return pd.DataFrame(columns=columnas)
+    stock = pd.Series(stocks, dtype=float).reindex(previsto.index).fillna(0.0).clip(lower=0)
+    sugerido = np.ceil((previsto - stock).clip(lower=0) / PASO_COMPRA) * PASO_COMPRA
+    tabla = pd.DataFrame({
+        'ingrediente_id': previsto.index,
+        'Descripción': [ingredientes[i].get('descripcion', i) for i in previsto.index],
+        'Unidad': [ingredientes[i].get('unidad', 'unidad') for i in previsto.index],
+        'Stock': stock.values,
+        'Consumo previsto': previsto.values,
+        'Sugerido': sugerido.values,
+        'Proveedor': [proveedores.get(i, {}).get('proveedor', SIN_PROVEEDOR) for i in previsto.index],
+        'proveedor_id': [proveedores.get(i, {}).get('proveedor_id') for i in previsto.index],
+        'Precio Unitario': [float(proveedores.get(i, {}).get('precio_unitario', 0.0)) for i in previsto.index],
+    })
+    tabla = tabla[tabla['Sugerido'] > 0]
+    return tabla.sort_values(['Proveedor', 'Descripción'])[columnas].reset_index(drop=True)
+
+
+class PronosticoConsumo:
+    """
+    Matriz día x plato de las ventas de los últimos DIAS_HISTORIA días, actualizada de
+    forma incremental, y el pronóstico de consumo por ingrediente calculado sobre ella.
+    leer_ordenes(desde_iso, hasta_iso) -> órdenes pagadas creadas en [desde, hasta) UTC (con 'fecha_creacion' e 'items').
+    receta(plato_id) -> ((ingrediente_id, cantidad), ...) o None.
+    """
+
+    def __init__(self, leer_ordenes, receta):
+        self._leer_ordenes = leer_ordenes
+        self._receta = receta
+        self._lock = threading.Lock()
+        self._ventas = pd.DataFrame(index=pd.DatetimeIndex([]), dtype=float)
+        self._ultimo_dia = None
+
+    def actualizar(self, hoy=None):
+        """
+        Lee solo las órdenes de los días completos que faltan (y de los últimos REPROCESAR_DIAS)
+        y las agrega a la matriz, que termina ayer.
+        """
+        ayer = (hoy or _hoy()) - timedelta(days=1)
+        with self._lock:
+            primer_dia = ayer - timedelta(days=DIAS_HISTORIA - 1)
+            desde = primer_dia if self._ultimo_dia is None else max(primer_dia, self._ultimo_dia - timedelta(days=REPROCESAR_DIAS))
+            inicio_utc = ZONA_HORARIA.localize(datetime.combine(desde, time.min)).astimezone(pytz.utc)
+            fin_utc = ZONA_HORARIA.localize(datetime.combine(ayer + timedelta(days=1), time.min)).astimezone(pytz.utc)
+
+            dias = pd.date_range(desde, ayer, freq='D')
+            nuevas = matriz_ventas(self._leer_ordenes(inicio_utc.isoformat(), fin_utc.isoformat()), dias)
+            anteriores = self._ventas[(self._ventas.index >= pd.Timestamp(primer_dia)) & (self._ventas.index < pd.Timestamp(desde))]
+            self._ventas = pd.concat([anteriores, nuevas]).fillna(0.0)
+            self._ultimo_dia = ayer
+
+    def consumo_diario(self):
+        """DataFrame día x ingrediente con el consumo según las recetas actuales."""
+        with self._lock:
+            ventas = self._ventas.copy()
+        recetas = matriz_recetas(list(ventas.columns), self._receta)
+        return pd.DataFrame(ventas.to_numpy() @ recetas.to_numpy(), index=ventas.index, columns=recetas.columns)
+
+    def pronostico(self, dias, hoy=None):
+        """Consumo previsto por ingrediente (Series) para los próximos `dias` días."""
+        hoy = hoy or _hoy()
+        return pronosticar(self.consumo_diario(), pd.date_range(hoy + timedelta(days=1), periods=dias, freq='D'))
+
+
+class UltimosProveedores:
+    """
+    Último proveedor y precio unitario de cada artículo comprado, por descripción (como relaciona
+    compras.py los items con los ingredientes). La primera actualización lee todas las compras; las
+    siguientes, solo las registradas desde la última vista (menos MARGEN_COMPRAS).
+    leer_compras(desde_iso) -> compras con 'fecha_registro' >= desde_iso, o todas si desde_iso es None.
+    """
+
+    def __init__(self, leer_compras):
+        self._leer_compras = leer_compras
+        self._lock = threading.Lock()
+        self._por_descripcion = {}  # descripción en minúsculas -> {'proveedor', 'proveedor_id', 'precio_unitario', 'orden'}
+        self._ultimo_registro = None
+
+    def actualizar(self):
+        """Aplica las compras nuevas. Volver a aplicar una compra ya vista no cambia nada."""
+        with self._lock:
+            desde = self._ultimo_registro
+        if desde is not None:
+            desde = (datetime.fromisoformat(desde.replace('Z', '+00:00')) - MARGEN_COMPRAS).isoformat()
+        compras = list(self._leer_compras(desde))
+        with self._lock:
+            for compra in compras:
+                orden = (compra.get('fecha_compra', ''), compra.get('fecha_registro', ''))
+                for item in compra.get('items', []):
+                    descripcion = str(item.get('Descripción', '')).lower()
+                    actual = self._por_descripcion.get(descripcion)
+                    if descripcion and (actual is None or orden >= actual['orden']):
+                        self._por_descripcion[descripcion] = {
+                            'proveedor': compra.get('proveedor_nombre', SIN_PROVEEDOR),
+                            'proveedor_id': compra.get('proveedor_id'),
+                            'precio_unitario': item.get('Precio Unitario', 0.0),
+                            'orden': orden,
+                        }
+                if compra.get('fecha_registro') and (self._ultimo_registro is None or compra['fecha_registro'] > self._ultimo_registro):
+                    self._ultimo_registro = compra['fecha_registro']
+
+    def por_ingrediente(self, ingredientes):
+        """{ingrediente_id: {'proveedor', 'proveedor_id', 'precio_unitario'}} de los ingredientes {_id: documento}."""
+        with self._lock:
+            por_descripcion = dict(self._por_descripcion)
+        proveedores = {}
+        for ingrediente_id, ingrediente in ingredientes.items():
+            ultimo = por_descripcion.get(ingrediente.get('descripcion', '').lower())
+            if ultimo:
+                proveedores[ingrediente_id] = {k: v for k, v in ultimo.items() if k != 'orden'}
+        return proveedores
@@ -8,12 +8,31 @@ import pytz
 import streamlit as st
 import couchdb
 import json
+import itertools
 import uuid
 from datetime import datetime, timezone
 import pandas as pd
 from streamlit_cookies_controller import CookieController
 import bcrypt # Importar la librería bcrypt para hashing de contraseñas
 import menu_utils # Importar el nuevo módulo de utilidades de menú
+import db_bootstrap # Vistas e índices Mango requeridos por la aplicación
+import catalog_cache # Caché de catálogos mantenida con el feed _changes
+import secuencias # Contadores de numeración (órdenes, tickets, cierres)
+import log_writer # Escritura por lotes de los registros de actividad
+import active_orders # Vista compartida de órdenes activas mantenida con el feed _changes
+import station_routing # Índice plato -> estación de despacho (cocina, bar, otros)
+import dispatch_events # Despacho de items como documentos de evento (partición 'despachos')
+import prep_times # Percentiles de tiempos de preparación y hora estimada de listo
+import order_lifecycle # Estados y transiciones de las órdenes
+import render_queue # Generación de PDFs en segundo plano, guardados como adjuntos
+import escpos_tickets # Tickets ESC/POS para impresora térmica
+import doc_cache # Caché LRU de documentos por _id/_rev (get_many)
+import recipe_engine # Recetas compiladas de los platos (plato_ingrediente)
+import inventory_ledger # Saldos de inventario proyectados desde los movimientos (con fotos periódicas)
+import stock_alerts # Alertas de stock bajo reevaluadas por cada movimiento de inventario
+import consumption_forecast # Pronóstico de consumo de ingredientes y sugerencias de compra
+import copy
+import base64
 from fpdf import FPDF
 from fpdf.enums import XPos, YPos
 from auth import get_controller, initialize_auth
@@ -34,6 +53,8 @@ PARTITION_KEY = "Usuario" # Asegúrate de que coincida con la partición real de
 
 # NUEVA CLAVE DE PARTICIÓN PARA LOGS
 LOGS_PARTITION_KEY = "logs" # Clave de partición para los registros de logs
+# Zona horaria con la que se arma el _id de los logs (logs:<YYYYMMDDHHMMSSmmm>-...)
+LOGS_TIMEZONE = 'America/El_Salvador'  # Ajusta a tu zona
 # Definir la constante de partición
 CURRENT_PARTITION_KEY = "ordenes"
 
@@ -95,9 +116,11 @@ def logout_user():
 def log_action(db_instance, user_who_performed_action, description):
     """
     Guarda un registro de actividad en la colección de logs.
+    El documento se encola y lo guarda en segundo plano el escritor de logs (log_writer),
+    así la acción del usuario no espera a CouchDB. Retorna False si no se pudo encolar.
     """
     utc_now = datetime.now(timezone.utc)
-    local_tz = pytz.timezone('America/El_Salvador')  # Ajusta a tu zona
+    local_tz = pytz.timezone(LOGS_TIMEZONE)
     local_now = utc_now.astimezone(local_tz)
     # print(f"DEBUG: log_action called. db_instance is None: {db_instance is None}, user: {user_who_performed_action}, desc: {description}")
     if not db_instance:
@@ -105,17 +128,60 @@ def log_action(db_instance, user_who_performed_action, description):
         return False # Cannot log if db is not available
 
     log_doc = {
+        # Mismo formato de _id que save_document_with_partition con el sufijo 'fecha':
+        # logs:<YYYYMMDDHHMMSSmmm>-<uuid_corto>, ordenado cronológicamente
+        "_id": f"{LOGS_PARTITION_KEY}:{local_now.strftime('%Y%m%d%H%M%S%f')[:-3]}-{str(uuid.uuid4())[:8]}",
         "usuario": user_who_performed_action,
         "descripcion": description,
         "fecha": local_now.isoformat(timespec='milliseconds') #datetime.now(timezone.utc).isoformat(timespec='milliseconds')
     }
-    # print(f"DEBUG: log_action - log_doc to save: {log_doc}")
-    
-    # Usamos 'fecha' como id_field_for_suffix para la partición 'logs'
-    # Esto generará _id como logs:<fecha_sanitizada>-<uuid_corto>
-    result = save_document_with_partition(db_instance, log_doc, LOGS_PARTITION_KEY, 'fecha')
-    # print(f"DEBUG: log_action - save_document_with_partition returned: {result}")
-    return result
+    return get_log_writer(db_instance).encolar(log_doc)
+
+@st.cache_resource
+def get_log_writer(_db):
+    """Escritor de logs en segundo plano, compartido por todas las sesiones del proceso."""
+    escritor = log_writer.EscritorLogs(_db)
+    escritor.start()
+    return escritor
+
+def query_logs(db, desde=None, hasta=None, usuario=None, descending=True, limit=None):
+    """
+    Consulta logs por rango de fechas usando el _id cronológico (logs:<YYYYMMDDHHMMSSmmm>-...),
+    sin recorrer la partición completa.
+    desde / hasta: date (día completo) o datetime, en hora de LOGS_TIMEZONE si no traen zona.
+    usuario: filtro exacto resuelto con el índice Mango (usuario, _id).
+    descending: más recientes primero. limit: máximo de registros.
+    """
+    inicio = _clave_log(desde, fin=False) if desde else f"{LOGS_PARTITION_KEY}:"
+    fin = _clave_log(hasta, fin=True) if hasta else f"{LOGS_PARTITION_KEY}:\ufff0"
+    try:
+        if usuario:
+            direccion = "desc" if descending else "asc"
+            return find_in_partition(
+                db, LOGS_PARTITION_KEY,
+                selector={"usuario": usuario, "_id": {"$gte": inicio, "$lte": fin}},
+                sort=[{"usuario": direccion}, {"_id": direccion}],
+                limit=limit
+            )
+
+        opciones = {'include_docs': True, 'descending': descending}
+        opciones['startkey'], opciones['endkey'] = (fin, inicio) if descending else (inicio, fin)
+        if limit:
+            opciones['limit'] = limit
+        return [row.doc for row in db.view(f'_partition/{LOGS_PARTITION_KEY}/_all_docs', **opciones)]
+    except Exception as e:
+        st.error(f"Error al consultar los registros de actividad: {e}")
+        return []
+
+def _clave_log(momento, fin):
+    if isinstance(momento, datetime):
+        if momento.tzinfo is not None:
+            momento = momento.astimezone(pytz.timezone(LOGS_TIMEZONE))
+        clave = momento.strftime('%Y%m%d%H%M%S%f')[:-3]
+    else:
+        clave = momento.strftime('%Y%m%d') + ('235959999' if fin else '000000000')
+    # El sufijo '\ufff0' incluye los _id del último milisegundo (llevan '-<uuid>' después)
+    return f"{LOGS_PARTITION_KEY}:{clave}" + ('\ufff0' if fin else '')
 
 class PDF(FPDF):
     def header(self):
@@ -287,9 +353,11 @@ def generar_ticket_pdf(ticket, orden, mesa, mesero):
 
     # Items
     pdf.set_font('Helvetica', '', 8)
-    subtotal = sum(item.get('cantidad', 0) * item.get('precio_unitario', 0) for item in orden.get('items', []))
+    # Solo productos activos (los anulados no se cobran)
+    items_activos = [item for item in orden.get('items', []) if not item.get('anulado', False)]
+    subtotal = sum(item.get('cantidad', 0) * item.get('precio_unitario', 0) for item in items_activos)
     
-    for item in orden.get('items', []):
+    for item in items_activos:
         cantidad = item.get('cantidad', 0)
         precio = item.get('precio_unitario', 0)
         total_item = cantidad * precio
@@ -324,24 +392,129 @@ def generar_ticket_pdf(ticket, orden, mesa, mesero):
     pdf.cell(30, 8, f"${total_final:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='R')
 
     return bytes(pdf.output())
+
+@st.cache_resource
+def get_render_queue(_db):
+    """Cola de generación de PDFs compartida por todas las sesiones del proceso."""
+    return render_queue.ColaRender(_db)
+
+def encolar_pdf(db, doc_id, nombre, generador, *args, **kwargs):
+    """
+    Encola la generación de un PDF que se guardará como adjunto `nombre` del documento `doc_id`.
+    Retorna de inmediato el identificador del trabajo (para mostrar_pdf_encolado o reimprimir).
+    """
+    return get_render_queue(db).encolar(doc_id, nombre, generador, *args, **kwargs)
+
+def obtener_pdf(db, handle_pdf):
+    """Bytes de un PDF encolado (de la cola o del adjunto del documento), o None si aún no está listo."""
+    return get_render_queue(db).resultado(handle_pdf)
+
+@st.cache_resource
+def get_print_queue():
+    """Cola de envíos a la impresora térmica (un solo hilo) compartida por todas las sesiones del proceso."""
+    return escpos_tickets.ColaImpresion()
+
+def imprimir_ticket_termico(db, generador, *args):
+    """
+    Imprime en la impresora térmica configurada ('impresora_termica' de la configuración del sistema)
+    el ticket ESC/POS generador(*args) (funciones de escpos_tickets). Los bytes se arman al instante y
+    el envío se hace en la cola de impresión, uno a la vez, para no bloquear la página si la impresora
+    no responde. El envío queda en la sesión para que mostrar_impresiones_termicas() avise si falla.
+    Retorna (True, destino) o (False, mensaje) si no hay impresora activa o falla el armado del ticket.
+    """
+    impresora = obtener_configuracion_sistema(db).get('impresora_termica', {})
+    if not impresora.get('activa') or not impresora.get('destino'):
+        return False, "No hay impresora térmica activa"
+    try:
+        datos = generador(*args)
+    except Exception as e:
+        return False, f"Error al armar el ticket ESC/POS: {e}"
+    envio_id = get_print_queue().enviar(datos, impresora['destino'])
+    st.session_state.setdefault('impresiones_termicas', []).append(envio_id)
+    return True, impresora['destino']
+
+@st.fragment(run_every=0.5)
+def _esperar_impresiones(envio_ids):
+    # Mientras haya tickets en la cola de la impresora solo se repite este fragmento
+    cola = get_print_queue()
+    if any(cola.estado(envio_id) == escpos_tickets.PENDIENTE for envio_id in envio_ids):
+        st.info("🖨️ Imprimiendo ticket...")
+    else:
+        st.rerun()
+
+def mostrar_impresiones_termicas():
+    """
+    Muestra el resultado de los tickets que esta sesión envió a la impresora térmica: espera (con un
+    fragmento) a los pendientes y avisa, una sola vez, de los impresos y del error de los que fallaron.
+    """
+    envio_ids = st.session_state.get('impresiones_termicas')
+    if not envio_ids:
+        return
+    cola = get_print_queue()
+    pendientes = []
+    for envio_id in envio_ids:
+        estado = cola.estado(envio_id)
+        if estado == escpos_tickets.PENDIENTE:
+            pendientes.append(envio_id)
+        elif estado == escpos_tickets.ERROR:
+            st.error(f"❌ No se pudo imprimir el ticket en la impresora térmica: {cola.error(envio_id)}")
+        else:
+            st.toast("🖨️ Ticket impreso")
+    st.session_state['impresiones_termicas'] = pendientes
+    if pendientes:
+        _esperar_impresiones(pendientes)
+
+@st.fragment(run_every=0.5)
+def _esperar_pdf(db, handle_pdf):
+    # Solo este fragmento se vuelve a ejecutar mientras el PDF se genera; al terminar, la página se redibuja
+    if get_render_queue(db).estado(handle_pdf) == render_queue.PENDIENTE:
+        st.info("⏳ Generando PDF...")
+    else:
+        st.rerun()
+
+def mostrar_pdf_encolado(db, clave, etiqueta="📄 Descargar PDF"):
+    """
+    Muestra el PDF encolado en st.session_state[clave] ({'handle', 'file_name', 'message'}).
+    Mientras se genera, la página sigue disponible y un fragmento consulta la cola; cuando está listo
+    se muestran el botón de descarga y el visor, y la entrada se elimina de la sesión.
+    """
+    info = st.session_state.get(clave)
+    if not info:
+        return
+    cola = get_render_queue(db)
+    estado = cola.estado(info['handle'])
+    st.success(info['message'])
+    if estado == render_queue.PENDIENTE:
+        _esperar_pdf(db, info['handle'])
+        return
+
+    st.session_state.pop(clave, None)
+    pdf_data = cola.resultado(info['handle'])
+    if estado == render_queue.ERROR or pdf_data is None:
+        st.error(f"❌ No se pudo generar el PDF: {cola.error(info['handle']) or 'no encontrado'}")
+        return
+
+    st.download_button(label=etiqueta, data=pdf_data, file_name=info['file_name'], mime="application/pdf")
+    base64_pdf = base64.b64encode(pdf_data).decode('utf-8')
+    pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800" type="application/pdf" style="border: none;"></iframe>'
+    st.markdown(pdf_display, unsafe_allow_html=True)
+
 #para la pantalla inicial de estadisticas
-def get_all_paid_orders(db):
+def get_all_paid_orders(db, fields=None):
     """
-    Recupera todas las órdenes con estado 'pagada'.
+    Recorre (generador) las órdenes con estado 'pagada', página por página.
+    fields: campos a proyectar para no descargar las órdenes completas.
     """
-    all_orders = get_documents_by_partition(db, "ordenes")
-    # print(f"DEBUG: get_all_paid_orders - Total orders fetched: {len(all_orders)}")
-    # Asegurarse de que 'fecha_pago' exista para las órdenes pagadas.
-    # Si no, se puede asumir que 'fecha_creacion' es el momento de pago para propósitos estadísticos.
-    return [order for order in all_orders if order.get('estado') == 'pagada']
+    # Si no existe 'fecha_pago' en una orden pagada, se puede asumir que 'fecha_creacion'
+    # es el momento de pago para propósitos estadísticos.
+    return iter_partition(db, "ordenes", selector={"estado": "pagada"}, fields=fields)
 
-def get_all_purchases(db):
+def get_all_purchases(db, fields=None):
     """
-    Recupera todos los documentos de compras.
+    Recorre (generador) todos los documentos de compras.
     Asume una partición 'compras'. Los documentos deben tener un campo 'fecha' y 'total'.
     """
-    # La función get_documents_by_partition creará la vista si no existe.
-    return get_documents_by_partition(db, "compras")
+    return iter_partition(db, "compras", fields=fields)
 
 def get_all_inventory_records(db):
     """
@@ -349,39 +522,31 @@ def get_all_inventory_records(db):
     Asume que las compras son entradas de inventario (valor = total_compra).
     Asume que las ventas son salidas de inventario (valor = total de la orden pagada).
     Esto es una simplificación y no representa el costo real de los bienes vendidos.
+    Es un generador sin orden cronológico: filtrar primero y ordenar el resultado por 'fecha'.
     """
-    inventory_movements = []
-
     # Obtener todos los registros de compras (entradas de inventario)
-    purchases = get_all_purchases(db)
-    for p in purchases:
+    for p in get_all_purchases(db, fields=['fecha_compra', 'total_compra', 'numero_compra']):
         if p.get('fecha_compra') and p.get('total_compra') is not None:
-            inventory_movements.append({
+            yield {
                 'fecha': p['fecha_compra'],
                 'tipo': 'entrada',
                 'valor_entrada': p['total_compra'],
                 'valor_salida': 0.0,
                 'descripcion': f"Compra #{p.get('numero_compra', p['_id'])}"
-            })
+            }
 
     # Obtener todas las órdenes pagadas (salidas de inventario)
-    paid_orders = get_all_paid_orders(db)
-    for o in paid_orders:
+    for o in get_all_paid_orders(db, fields=['fecha_pago', 'fecha_creacion', 'total', 'numero_orden']):
         # Usar 'fecha_pago' si existe, de lo contrario 'fecha_creacion'
         date_field = o.get('fecha_pago') or o.get('fecha_creacion')
         if date_field and o.get('total') is not None:
-            inventory_movements.append({
+            yield {
                 'fecha': date_field,
                 'tipo': 'salida',
                 'valor_entrada': 0.0,
                 'valor_salida': o['total'], # Usando el total de la venta como proxy del valor de salida
                 'descripcion': f"Venta #{o.get('numero_orden', o['_id'])}"
-            })
-    
-    # Ordenar por fecha para asegurar un procesamiento cronológico correcto en las estadísticas
-    inventory_movements.sort(key=lambda x: datetime.fromisoformat(x['fecha']))
-
-    return inventory_movements
+            }
 
 def generar_resumen_ventas_pdf(ordenes_pagadas, mesas_dict, meseros_dict, start_date=None, end_date=None):
     pdf = PDF()
@@ -464,6 +629,178 @@ def get_couchdb_server():
         st.error(f"Error al conectar a CouchDB: {e}. Asegúrate de que CouchDB esté corriendo en {COUCHDB_URL}")
         return None
 
+@st.cache_resource
+def get_catalog_cache(_db):
+    """
+    Retorna la caché de catálogos compartida por todas las sesiones del proceso.
+    Se crea una sola vez; el feed _changes la mantiene actualizada en segundo plano.
+    """
+    return catalog_cache.CatalogoCache(_db)
+
+def get_catalog_documents(db, partition_key):
+    """
+    Obtiene los documentos de una partición de catálogo (platos, menús, mesas, usuarios,
+    promociones, ingredientes, plato_ingrediente, configuracion) desde la caché en memoria, sin consultar CouchDB.
+    Para otras particiones, o si la caché no está disponible, consulta la base de datos.
+    """
+    if partition_key in catalog_cache.PARTICIONES_CATALOGO:
+        try:
+            return get_catalog_cache(db).obtener(partition_key)
+        except Exception as e:
+            print(f"Error al leer la caché de catálogo '{partition_key}': {e}")
+    return get_documents_by_partition(db, partition_key)
+
+@st.cache_resource
+def get_active_orders_store(_db):
+    """
+    Retorna la vista de órdenes activas compartida por todas las sesiones del proceso.
+    Se crea una sola vez; el feed _changes de 'ordenes' la mantiene actualizada en segundo plano.
+    """
+    ruteo = get_station_router(_db)
+    store = active_orders.OrdenesActivas(_db, estacion_de_plato=ruteo.estacion)
+    # Si cambia el ruteo de platos, se recalcula el índice por estación de la vista
+    ruteo.al_cambiar(lambda: store.reindexar_estaciones(ruteo.estacion))
+    return store
+
+def get_active_orders(db, estados=None, mesa_id=None, mesero_id=None, estacion=None):
+    """
+    Obtiene las órdenes activas (no pagadas ni anuladas) desde la vista en memoria,
+    ordenadas por fecha_creacion. Si la vista no está disponible, consulta la base de datos.
+    estacion: solo órdenes con algún item no anulado de esa estación ('cocina', 'bar', 'otros').
+    """
+    try:
+        return get_active_orders_store(db).ordenes(estados=estados, mesa_id=mesa_id, mesero_id=mesero_id, estacion=estacion)
+    except Exception as e:
+        print(f"Error al leer la vista de órdenes activas: {e}")
+    selector = {"estado": {"$in": estados} if estados else {"$nin": active_orders.ESTADOS_CERRADOS}}
+    if mesa_id is not None:
+        selector["mesa_id"] = mesa_id
+    if mesero_id is not None:
+        selector["mesero_id"] = mesero_id
+    if estacion is not None:
+        selector["items"] = {"$elemMatch": {"plato_id": {"$in": list(get_station_dish_ids(db, estacion))}, "anulado": {"$ne": True}}}
+    ordenes = find_in_partition(db, active_orders.ORDENES_PARTITION_KEY, selector)
+    return sorted(ordenes, key=lambda o: o.get('fecha_creacion', ''))
+
+@st.cache_resource
+def get_station_router(_db):
+    """
+    Retorna el índice plato -> estación compartido por todas las sesiones del proceso.
+    Se recalcula solo cuando cambian platos o menús en la caché de catálogos.
+    """
+    return station_routing.RuteoEstaciones(get_catalog_cache(_db))
+
+def get_station_dish_ids(db, estacion):
+    """Conjunto de plato_id que se despachan en la estación ('cocina', 'bar' u 'otros')."""
+    try:
+        return get_station_router(db).platos(estacion)
+    except Exception as e:
+        print(f"Error al leer el ruteo de estaciones: {e}")
+    por_plato = station_routing.clasificar_catalogo(
+        get_catalog_documents(db, "platos"),
+        get_catalog_documents(db, "menus") + get_catalog_documents(db, "menu"),
+    )
+    return frozenset(plato_id for plato_id, estacion_plato in por_plato.items() if estacion_plato == estacion)
+
+@st.cache_resource
+def get_recipe_engine(_db):
+    """
+    Retorna las recetas compiladas (plato -> ingredientes) compartidas por todas las sesiones del proceso.
+    Se recompilan solo cuando cambian las relaciones plato-ingrediente o los ingredientes en la caché de catálogos.
+    """
+    return recipe_engine.MotorRecetas(get_catalog_cache(_db))
+
+def ingredientes_de_plato(db, plato, ingredientes_activos=None):
+    """
+    Ingredientes que consume una unidad del plato, como [{'ingrediente_id', 'cantidad'}].
+    Usa la receta compilada de 'plato_ingrediente'; los platos que aún no tienen relaciones
+    cargadas usan el mapeo por nombre de obtener_ingredientes_por_plato().
+    """
+    try:
+        receta = get_recipe_engine(db).receta(plato['_id'])
+    except Exception as e:
+        print(f"Error al leer las recetas compiladas: {e}")
+        receta = None
+    if receta is not None:
+        return [{'ingrediente_id': ingrediente_id, 'cantidad': cantidad} for ingrediente_id, cantidad in receta]
+    if ingredientes_activos is None:
+        ingredientes_activos = {ing['_id']: ing for ing in get_catalog_documents(db, "ingredientes") if ing.get('activo', 0) == 1}
+    return obtener_ingredientes_por_plato(plato, ingredientes_activos)
+
+@st.cache_resource
+def get_prep_time_stats(_db):
+    """Histogramas de tiempos de preparación compartidos por todas las sesiones (se renuevan cada pocos minutos)."""
+    return prep_times.TiemposPreparacion(_db)
+
+def estimar_hora_listo(db, orden, item, estacion):
+    """Hora local (HH:MM) en que se espera tener listo un item pendiente, o None si aún no hay datos."""
+    try:
+        listo = get_prep_time_stats(db).estimar_listo(orden, item, estacion)
+    except Exception as e:
+        print(f"Error al estimar el tiempo de preparación: {e}")
+        return None
+    return listo.astimezone(prep_times.ZONA_HORARIA).strftime('%H:%M') if listo else None
+
+def transicionar_orden(db, orden_id, evento, usuario=None, campos=None):
+    """
+    Cambia el estado de una orden con un evento de order_lifecycle ('enviar_cobro', 'generar_ticket',
+    'pagar', 'anular'), registrando la transición, y la refleja en la vista de órdenes activas.
+    Retorna (orden, None) o (None, mensaje_de_error).
+    """
+    try:
+        orden = order_lifecycle.transicion(db, orden_id, evento, usuario, campos)
+    except Exception as e:
+        return None, str(e)
+    registrar_orden_activa(db, orden)
+    return orden, None
+
+def get_active_order(db, orden_id):
+    """Obtiene una orden activa (con sus despachos aplicados) desde la vista en memoria; si no está, la lee de CouchDB."""
+    try:
+        orden = get_active_orders_store(db).obtener(orden_id)
+        if orden is not None:
+            return orden
+    except Exception as e:
+        print(f"Error al leer la vista de órdenes activas: {e}")
+    return db.get(orden_id)
+
+def registrar_orden_activa(db, orden):
+    """Refleja en la vista de órdenes activas una orden (o evento de despacho) recién guardada, sin esperar al feed."""
+    try:
+        get_active_orders_store(db).registrar_documento(orden)
+    except Exception as e:
+        print(f"Error al actualizar la vista de órdenes activas: {e}")
+
+def registrar_despacho_item(db, orden_id, item_id, estacion, usuario, plato_id=None, fecha_orden=None, fecha_agregado=None):
+    """
+    Registra el despacho de un item en cocina o bar como un documento de evento propio,
+    sin reescribir la orden (no compite con las ediciones concurrentes de la misma orden).
+    Con plato_id y fecha_orden (fecha_creacion de la orden) el evento guarda además la
+    muestra de tiempo de preparación, medida desde fecha_agregado (la del item) si se indica.
+    Retorna el evento guardado; si el item ya estaba despachado retorna el evento existente.
+    Las excepciones de CouchDB (red, autenticación) se propagan.
+    """
+    fecha = datetime.now(timezone.utc)
+    muestra = prep_times.campos_muestra(plato_id, fecha_orden, fecha, fecha_agregado)
+    evento = dispatch_events.nuevo_evento(orden_id, item_id, estacion, usuario, fecha=fecha, muestra=muestra)
+    try:
+        db.save(evento)
+    except couchdb.http.ResourceConflict:
+        # Otro usuario ya lo despachó: el evento existente es el que vale
+        evento = db.get(evento['_id']) or evento
+    registrar_orden_activa(db, evento)
+    return evento
+
+def get_catalog_document(db, doc_id):
+    """Obtiene un documento de catálogo por _id desde la caché; si no está, lo lee de CouchDB."""
+    try:
+        doc = get_catalog_cache(db).obtener_documento(doc_id)
+        if doc is not None:
+            return doc
+    except Exception as e:
+        print(f"Error al leer la caché de catálogo '{doc_id}': {e}")
+    return db.get(doc_id)
+
 def get_database_instance():
     """
     Obtiene la instancia de la base de datos principal y la crea si no existe como particionada.
@@ -476,12 +813,12 @@ def get_database_instance():
         if COUCHDB_DATABASE_NAME not in server:
             server.resource.put(COUCHDB_DATABASE_NAME, body={"partitioned": True})
             st.success(f"Base de datos particionada '{COUCHDB_DATABASE_NAME}' creada exitosamente.")
-            return server[COUCHDB_DATABASE_NAME]
+            return _asegurar_esquema(server[COUCHDB_DATABASE_NAME])
         else:
             db = server[COUCHDB_DATABASE_NAME]
             db_info = db.info() 
             if db_info.get("props", {}).get("partitioned") == True:
-                return db
+                return _asegurar_esquema(db)
             else:
                 st.error(f"La base de datos '{COUCHDB_DATABASE_NAME}' existe pero NO es particionada. Para usarla como particionada, debes eliminarla y recréala con las propiedades correctas.")
                 return None
@@ -490,7 +827,7 @@ def get_database_instance():
             db = server[COUCHDB_DATABASE_NAME]
             db_info = db.info()
             if db_info.get("props", {}).get("partitioned") == True:
-                return db
+                return _asegurar_esquema(db)
             else:
                  st.error(f"La base de datos '{COUCHDB_DATABASE_NAME}' existe pero NO es particionada (manejo de error 412). Para usarla como particionada, debes eliminarla y recréala con las propiedades correctas.")
                  return None
@@ -500,16 +837,32 @@ def get_database_instance():
         st.error(f"Error inesperado al obtener/crear la DB '{COUCHDB_DATABASE_NAME}': {e}")
         return None
 
-def get_documents_by_partition(db, partition_key_filter=None):
+def _asegurar_esquema(db):
+    """
+    Instala/actualiza vistas e índices (una vez por proceso) y retorna la misma instancia.
+    Un fallo aquí no impide usar la base de datos: las consultas caen en escaneos. Una migración
+    de datos fallida sí se muestra en todas las páginas, porque deja el stock sin sus saldos iniciales.
+    """
+    try:
+        db_bootstrap.asegurar_esquema(db)
+    except db_bootstrap.MigracionFallida as e:
+        st.error(f"❌ Falló la migración de datos de la base de datos ({e}). El stock puede mostrarse incompleto; reinstale desde Configuración > Índices o reinicie la aplicación.")
+    except Exception as e:
+        print(f"Error al instalar vistas e índices de CouchDB: {e}")
+    return db
+
+def get_documents_by_partition(db, partition_key_filter=None, selector=None, fields=None, sort=None, limit=None):
     """
     Obtiene documentos filtrados por una clave de partición específica.
     Si no se proporciona partition_key_filter, obtiene todos los documentos (¡cuidado con grandes DBs!).
+    Con selector, fields, sort o limit la consulta se resuelve con '_partition/<clave>/_find';
+    sin ellos se usa '_partition/<clave>/_all_docs'. Ambos caminos quedan limitados a la partición.
     """
     try:
         if partition_key_filter:
-            start_key = f"{partition_key_filter}:"
-            end_key = f"{partition_key_filter}:\ufff0" 
-            rows = db.view('_all_docs', startkey=start_key, endkey=end_key, include_docs=True)
+            if selector is not None or fields or sort or limit:
+                return find_in_partition(db, partition_key_filter, selector, fields=fields, sort=sort, limit=limit)
+            rows = db.view(f'_partition/{partition_key_filter}/_all_docs', include_docs=True)
             return [row.doc for row in rows]
         else:
             return [row.doc for row in db.view('_all_docs', include_docs=True)]
@@ -517,6 +870,125 @@ def get_documents_by_partition(db, partition_key_filter=None):
         st.error(f"Error al obtener documentos para la partición '{partition_key_filter}': {e}")
         return []
 
+# Tamaño de página para _find cuando no se pasa 'limit' (CouchDB devuelve solo 25 por defecto)
+FIND_PAGE_SIZE = 500
+
+def find_in_partition(db, partition_key, selector=None, fields=None, sort=None, limit=None):
+    """
+    Ejecuta una consulta Mango sobre '_partition/<partition_key>/_find'.
+    selector: filtro Mango (por defecto, todos los documentos de la partición).
+    fields: campos a proyectar; '_id' y '_rev' se incluyen siempre.
+    sort: ordenamiento Mango, p. ej. [{"fecha_creacion": "desc"}] (requiere un índice).
+    limit: máximo de documentos; sin límite se pagina con 'bookmark' hasta agotar resultados.
+    Las excepciones de CouchDB se propagan para que el llamador decida cómo reportarlas.
+    """
+    return _find_paginado(db.resource('_partition', partition_key, '_find'), selector, fields, sort, limit)
+
+def find_documents(db, selector, fields=None, sort=None, limit=None):
+    """
+    Igual que find_in_partition pero con '_find' global (todas las particiones).
+    Usar solo con selectores respaldados por un índice global, como 'type'.
+    """
+    return _find_paginado(db.resource('_find'), selector, fields, sort, limit)
+
+# --- Consultas de resumen (proyección) para pantallas de listado ---
+# Campos suficientes para tarjetas, métricas y tablas: no incluyen 'items', comentarios ni datos de anulación
+ORDER_SUMMARY_FIELDS = ['numero_orden', 'estado', 'mesa_id', 'mesero_id', 'total', 'fecha_creacion', 'fecha_pago']
+TICKET_SUMMARY_FIELDS = ['numero_ticket', 'numero_orden', 'orden_id', 'estado', 'mesa_id', 'mesero_id', 'total', 'fecha_creacion', 'fecha_pago', 'pago_info']
+
+def get_order_summaries(db, selector=None, desde=None, campos_extra=None):
+    """
+    Órdenes con solo los campos de ORDER_SUMMARY_FIELDS (más campos_extra, p. ej. ['items']).
+    selector: filtro Mango adicional (estado, mesero_id, ...).
+    desde: datetime con zona horaria; solo órdenes creadas a partir de ese momento.
+    """
+    return _get_summaries(db, "ordenes", ORDER_SUMMARY_FIELDS, selector, desde, campos_extra)
+
+def get_ticket_summaries(db, selector=None, desde=None, campos_extra=None):
+    """Igual que get_order_summaries, para tickets (TICKET_SUMMARY_FIELDS, sin los items copiados de la orden)."""
+    return _get_summaries(db, "tickets", TICKET_SUMMARY_FIELDS, selector, desde, campos_extra)
+
+def get_tickets_por_orden(db, orden_ids, fields=None):
+    """
+    Tickets de las órdenes indicadas, como {orden_id: ticket}, con el índice 'orden_id' de la partición.
+    Para cruzar órdenes con sus tickets sin descargar la partición de tickets completa.
+    fields: campos a proyectar (además de 'orden_id').
+    """
+    orden_ids = [orden_id for orden_id in dict.fromkeys(orden_ids) if orden_id]
+    campos = list(dict.fromkeys(['orden_id'] + list(fields))) if fields else None
+    tickets = {}
+    try:
+        for inicio in range(0, len(orden_ids), FIND_PAGE_SIZE):
+            lote = orden_ids[inicio:inicio + FIND_PAGE_SIZE]
+            for ticket in find_in_partition(db, "tickets", {"orden_id": {"$in": lote}}, fields=campos):
+                tickets.setdefault(ticket['orden_id'], ticket)
+    except Exception as e:
+        st.error(f"Error al obtener los tickets de las órdenes: {e}")
+    return tickets
+
+def _get_summaries(db, partition_key, campos, selector, desde, campos_extra):
+    selector = dict(selector or {})
+    if desde is not None:
+        # Las fechas se guardan en ISO 8601 UTC, por lo que la comparación de texto respeta el orden
+        selector['fecha_creacion'] = {'$gte': desde.astimezone(timezone.utc).isoformat()}
+    return get_documents_by_partition(db, partition_key, selector=selector, fields=campos + list(campos_extra or []))
+
+def _find_paginado(resource, selector, fields, sort, limit):
+    return list(itertools.islice(_iter_find(resource, selector, fields, sort, FIND_PAGE_SIZE, limit), limit))
+
+def _iter_find(resource, selector, fields, sort, page_size, limit=None):
+    query = {"selector": selector or {}}
+    if fields:
+        query["fields"] = list(dict.fromkeys(['_id', '_rev'] + list(fields)))
+    if sort:
+        query["sort"] = sort
+
+    entregados = 0
+    bookmark = None
+    while True:
+        pagina_solicitada = page_size if limit is None else min(page_size, limit - entregados)
+        query["limit"] = pagina_solicitada
+        if bookmark:
+            query["bookmark"] = bookmark
+        _, _, data = resource.post_json(body=query)
+        page = data.get('docs', [])
+        for doc in page:
+            yield couchdb.Document(doc)
+        entregados += len(page)
+        bookmark = data.get('bookmark')
+        if len(page) < pagina_solicitada or not bookmark or (limit is not None and entregados >= limit):
+            break
+
+# Documentos por página al recorrer particiones grandes con iter_partition
+ITER_PAGE_SIZE = 200
+
+def iter_partition(db, partition_key, selector=None, fields=None, page_size=ITER_PAGE_SIZE):
+    """
+    Recorre una partición por páginas sin cargarla completa en memoria (generador).
+    Sin selector ni fields se pagina '_partition/<clave>/_all_docs' con limit + startkey/startkey_docid;
+    con selector o fields se pagina '_find' con 'bookmark' y la proyección se hace en CouchDB.
+    Solo se mantiene en memoria una página a la vez, y el llamador puede cortar el
+    recorrido con 'break' sin descargar el resto. Si CouchDB falla se muestra el error
+    y el recorrido termina, igual que get_documents_by_partition.
+    """
+    try:
+        if selector is not None or fields:
+            yield from _iter_find(db.resource('_partition', partition_key, '_find'), selector, fields, None, page_size)
+            return
+
+        opciones = {}
+        while True:
+            # Se pide un documento extra: si llega, es el inicio de la página siguiente
+            rows = db.view(f'_partition/{partition_key}/_all_docs', include_docs=True, limit=page_size + 1, **opciones).rows
+            for row in rows[:page_size]:
+                yield row.doc
+            if len(rows) <= page_size:
+                break
+            siguiente = rows[page_size]
+            opciones = {'startkey': siguiente.key, 'startkey_docid': siguiente.id}
+    except Exception as e:
+        st.error(f"Error al recorrer la partición '{partition_key}': {e}")
+
 def save_document_with_partition1(db, doc, partition_key, unique_field=None):
     try:
         # Si el documento ya tiene _id, es una actualización
@@ -593,57 +1065,50 @@ def get_mesas(db):
 #     except Exception as e:
 #         print(f"Error al obtener número de orden: {str(e)}")
 #         return 1  # Valor por defecto si hay error
+def _numero_inicial_configurado(db, secuencia):
+    clave = secuencias.SECUENCIAS.get(secuencia)
+    if not clave:
+        return 1
+    return int(obtener_configuracion_sistema(db).get(clave, 1))
+
 def get_next_order_number(db):
+    """
+    Número que recibirá la próxima orden, solo para mostrarlo en pantalla.
+    El número definitivo se asigna al guardar con asignar_numero_orden().
+    """
     try:
-        # Obtener configuración del sistema
-        configuracion = obtener_configuracion_sistema(db)
-        numero_inicial_configurado = configuracion.get('numero_orden_inicial', 1)
-        
-        # Buscar la última orden, ESPECIFICANDO LA PARTICIÓN
-        last_order = db.view('_design/orders/_view/by_order_number',
-                           limit=1,
-                           descending=True,
-                           partition=CURRENT_PARTITION_KEY # ADD THIS LINE
-                           ).rows
-        
-        if last_order and len(last_order) > 0:
-            # Asegurarse de que el valor es numérico
-            last_number = int(last_order[0].key)
-            # Retornar el máximo entre el último número usado + 1 y el configurado
-            return max(last_number + 1, numero_inicial_configurado)
-        else:
-            return numero_inicial_configurado  # Primera orden usa la configuración
-    
+        return secuencias.proximo_numero(db, "ordenes", _numero_inicial_configurado(db, "ordenes"))
     except Exception as e:
         print(f"Error al obtener número de orden: {str(e)}")
         return 1  # Valor por defecto si hay error
 
 def get_next_ticket_number(db):
-    """Obtiene el siguiente número de ticket correlativo"""
+    """Número que recibirá el próximo ticket (sin reservarlo)"""
     try:
-        # Obtener configuración del sistema
-        configuracion = obtener_configuracion_sistema(db)
-        numero_inicial_configurado = configuracion.get('numero_ticket_inicial', 1)
-        
-        last_ticket = db.find({
-            "selector": {"type": "tickets"},
-            "sort": [{"numero_ticket": "desc"}],
-            "limit": 1
-        })
-        
-        if last_ticket:
-            last_number = last_ticket[0]['numero_ticket']
-            # Retornar el máximo entre el último número usado + 1 y el configurado
-            return max(last_number + 1, numero_inicial_configurado)
-        else:
-            return numero_inicial_configurado  # Primer ticket usa la configuración
-    except:
+        return secuencias.proximo_numero(db, "tickets", _numero_inicial_configurado(db, "tickets"))
+    except Exception as e:
+        print(f"Error al obtener número de ticket: {str(e)}")
         return 1
 
+def asignar_numero_secuencia(db, secuencia):
+    """
+    Asigna el siguiente número de una secuencia ('ordenes', 'tickets', 'cierres_x', 'cierres_z').
+    Dos terminales nunca reciben el mismo número. Lanza excepción si no se pudo asignar.
+    """
+    return secuencias.siguiente_numero(db, secuencia, _numero_inicial_configurado(db, secuencia))
+
+def asignar_numero_orden(db):
+    """Asigna el número definitivo de una orden nueva."""
+    return asignar_numero_secuencia(db, "ordenes")
+
+def asignar_numero_ticket(db):
+    """Asigna el número correlativo de un ticket nuevo."""
+    return asignar_numero_secuencia(db, "tickets")
+
 def obtener_configuracion_sistema(db):
-    """Obtiene la configuración del sistema, creándola si no existe"""
+    """Obtiene la configuración del sistema (desde la caché de catálogos), creándola si no existe"""
     try:
-        config_docs = list(db.find({"selector": {"type": "configuracion"}}))
+        config_docs = get_catalog_documents(db, stock_alerts.CONFIGURACION_PARTITION_KEY)
         if config_docs:
             return config_docs[0]
         else:
@@ -659,7 +1124,7 @@ def obtener_configuracion_sistema(db):
                 "fecha_creacion": datetime.now(timezone.utc).isoformat(),
                 "ultima_modificacion": datetime.now(timezone.utc).isoformat()
             }
-            db.save(config_default)
+            guardar_configuracion_sistema(db, config_default)
             return config_default
     except Exception as e:
         print(f"Error al obtener configuración del sistema: {e}")
@@ -670,68 +1135,83 @@ def obtener_configuracion_sistema(db):
             "alertas_stock": {}
         }
 
+def guardar_configuracion_sistema(db, configuracion):
+    """
+    Guarda el documento de configuración y lo refleja de inmediato en la caché de catálogos
+    (las alertas de stock toman los nuevos límites sin esperar al feed).
+    Las excepciones de CouchDB se propagan.
+    """
+    db.save(configuracion)
+    get_catalog_cache(db).registrar_documento(configuracion)
+    return configuracion
+
+@st.cache_resource
+def get_stock_alerts(_db):
+    """
+    Retorna las alertas de stock bajo compartidas por todas las sesiones del proceso.
+    Cada movimiento de inventario reevalúa solo los ingredientes que toca.
+    """
+    return stock_alerts.AlertasStock(get_inventory_ledger(_db), get_catalog_cache(_db))
+
+@st.cache_resource
+def get_consumption_forecast(_db):
+    """
+    Retorna la matriz de ventas por día y plato compartida por todas las sesiones del proceso,
+    con la que se pronostica el consumo de ingredientes. Cada actualización lee solo los días nuevos.
+    """
+    def leer_ordenes(desde_iso, hasta_iso):
+        return iter_partition(
+            _db, "ordenes",
+            selector={"estado": "pagada", "fecha_creacion": {"$gte": desde_iso, "$lt": hasta_iso}},
+            fields=["fecha_creacion", "items"],
+        )
+    return consumption_forecast.PronosticoConsumo(leer_ordenes, get_recipe_engine(_db).receta)
+
+@st.cache_resource
+def get_supplier_history(_db):
+    """
+    Retorna el último proveedor y precio de cada artículo comprado, compartido por todas las sesiones
+    del proceso. Cada actualización lee solo las compras registradas desde la anterior.
+    """
+    def leer_compras(desde_iso):
+        return iter_partition(
+            _db, "compras",
+            selector={"fecha_registro": {"$gte": desde_iso}} if desde_iso else None,
+            fields=['proveedor_id', 'proveedor_nombre', 'items', 'fecha_compra', 'fecha_registro'],
+        )
+    return consumption_forecast.UltimosProveedores(leer_compras)
+
+def sugerencias_compra(db, horizonte_dias=7, dias_seguridad=2):
+    """
+    Cantidades sugeridas de compra por ingrediente y proveedor (DataFrame): el consumo previsto
+    para horizonte_dias + dias_seguridad según las ventas pagadas y las recetas, menos el stock actual.
+    El proveedor y el precio son los de la última compra del ingrediente.
+    """
+    try:
+        pronostico = get_consumption_forecast(db)
+        pronostico.actualizar()
+        previsto = pronostico.pronostico(horizonte_dias + dias_seguridad)
+        ingredientes = {i['_id']: i for i in get_catalog_documents(db, "ingredientes") if i.get('activo', 0) == 1}
+        historial_proveedores = get_supplier_history(db)
+        historial_proveedores.actualizar()
+        proveedores = historial_proveedores.por_ingrediente(ingredientes)
+        return consumption_forecast.sugerir_compras(previsto, get_stocks(db, ingredientes), ingredientes, proveedores)
+    except Exception as e:
+        st.error(f"Error al calcular las sugerencias de compra: {e}")
+        return None
+
 def verificar_alertas_stock_bajo(db):
-    """Verifica ingredientes con stock bajo usando alertas configurables y retorna alertas"""
-    alertas = []
+    """Alertas vigentes de stock bajo (límites configurables en 'alertas_stock'), leídas de memoria"""
     try:
-        # Obtener configuración del sistema
-        configuracion = obtener_configuracion_sistema(db)
-        alertas_config = configuracion.get('alertas_stock', {})
-        
-        # Obtener ingredientes activos
-        ingredientes = get_documents_by_partition(db, "ingredientes")
-        ingredientes_activos = [i for i in ingredientes if i.get('activo', 0) == 1]
-        
-        for ingrediente in ingredientes_activos:
-            ingrediente_id = ingrediente['_id']
-            cantidad = float(ingrediente.get('cantidad', 0))
-            nombre = ingrediente.get('descripcion', 'Ingrediente sin nombre')
-            unidad = ingrediente.get('unidad', 'unidad')
-            
-            # Buscar configuración específica para este ingrediente
-            config_ingrediente = alertas_config.get(ingrediente_id, {})
-            limite_minimo = config_ingrediente.get('minimo', 10)  # Por defecto 10
-            
-            if cantidad == 0:
-                alertas.append({
-                    'tipo': 'critico',
-                    'nivel': 'error',
-                    'mensaje': f"🚨 CRÍTICO: {nombre} está AGOTADO (0 {unidad})",
-                    'ingrediente_id': ingrediente_id,
-                    'cantidad': cantidad,
-                    'limite_configurado': limite_minimo
-                })
-            elif cantidad <= limite_minimo:
-                # Determinar si es crítico o advertencia basado en el porcentaje del límite
-                if cantidad <= (limite_minimo * 0.3):  # 30% del límite o menos = crítico
-                    alertas.append({
-                        'tipo': 'critico',
-                        'nivel': 'error',
-                        'mensaje': f"🚨 CRÍTICO: Quedan solo {cantidad:.1f} {unidad} de {nombre} (límite: {limite_minimo})",
-                        'ingrediente_id': ingrediente_id,
-                        'cantidad': cantidad,
-                        'limite_configurado': limite_minimo
-                    })
-                else:  # Entre 30% y 100% del límite = advertencia
-                    alertas.append({
-                        'tipo': 'advertencia',
-                        'nivel': 'warning',
-                        'mensaje': f"⚠️ STOCK BAJO: Quedan {cantidad:.1f} {unidad} de {nombre} (límite: {limite_minimo})",
-                        'ingrediente_id': ingrediente_id,
-                        'cantidad': cantidad,
-                        'limite_configurado': limite_minimo
-                    })
-                    
+        return get_stock_alerts(db).alertas()
     except Exception as e:
-        alertas.append({
+        return [{
             'tipo': 'error',
             'nivel': 'error',
             'mensaje': f"Error al verificar stock: {str(e)}",
             'ingrediente_id': None,
             'cantidad': 0
-        })
-    
-    return alertas
+        }]
 
 def generar_ticket(db, orden):
     """Genera un ticket de cobro con número correlativo"""
@@ -740,9 +1220,8 @@ def generar_ticket(db, orden):
         if not isinstance(orden, dict):
             raise ValueError("El parámetro 'orden' debe ser un diccionario")
             
-        # Obtener el último número de ticket (método alternativo sin índices)
-        all_tickets = [doc for doc in db if doc.get('type') == 'tickets']
-        numero_ticket = max([tkt.get('numero_ticket', 0) for tkt in all_tickets] or [0]) + 1
+        # Obtener el número de ticket del contador de secuencias
+        numero_ticket = asignar_numero_ticket(db)
         
         # Crear documento de ticket
         ticket_doc = {
@@ -763,9 +1242,10 @@ def generar_ticket(db, orden):
         db.save(ticket_doc)
         
         # Actualizar estado de la orden
-        if isinstance(orden, dict):
-            orden['estado'] = 'en_cobro'
-            db.save(orden)
+        orden_guardada, error = transicionar_orden(db, orden['_id'], "generar_ticket")
+        if error:
+            return numero_ticket, error
+        orden.update(orden_guardada)
         
         return numero_ticket, None  # Retorna número de ticket y error
         
@@ -822,6 +1302,9 @@ def save_document_with_partition(db, doc_data, partition_key, id_field_for_suffi
             print(f"DEBUG: save_document_with_partition - Usando _id existente: '{doc_data['_id']}'")
 
         doc_id, doc_rev = db.save(doc_data)
+        if partition_key in catalog_cache.PARTICIONES_CATALOGO:
+            # Reflejar el cambio en la caché de este proceso sin esperar al feed
+            get_catalog_cache(db).registrar_documento(doc_data)
         st.success(f"Documento guardado exitosamente con ID: {doc_id}")
         # print(f"DEBUG: save_document_with_partition - Documento guardado con ID: {doc_id}, REV: {doc_rev}")
         return True
@@ -840,6 +1323,204 @@ def delete_document(db, doc_id, doc_rev):
         st.error(f"Error al eliminar documento: {e}")
         return False
 
+# --- Escritura en lote (_bulk_docs) ---
+
+def save_documents_bulk(db, docs, rehacer=None, max_reintentos=3):
+    """
+    Guarda varios documentos en una sola petición '_bulk_docs'.
+    Retorna una lista, en el mismo orden que docs, de dicts
+    {'id', 'ok', 'rev', 'conflicto', 'error', 'doc'}; los guardados quedan con su nuevo '_rev'.
+    rehacer: función opcional que recibe los documentos en conflicto y retorna las versiones
+    a reenviar (releídas y con el cambio aplicado otra vez). Solo esos se reintentan, hasta
+    max_reintentos veces; los que rehacer no retorne quedan marcados como conflicto.
+    Las excepciones de CouchDB (red, autenticación) se propagan.
+    """
+    docs = list(docs)
+    if not docs:
+        return []
+
+    resultados = _bulk_docs(db, docs)
+    for _ in range(max_reintentos if rehacer else 0):
+        en_conflicto = [i for i, r in enumerate(resultados) if r['conflicto']]
+        if not en_conflicto:
+            break
+        nuevas_versiones = {d['_id']: d for d in (rehacer([docs[i] for i in en_conflicto]) or [])}
+        reenviar = [i for i in en_conflicto if docs[i].get('_id') in nuevas_versiones]
+        if not reenviar:
+            break
+        for i in reenviar:
+            docs[i] = nuevas_versiones[docs[i]['_id']]
+        for i, resultado in zip(reenviar, _bulk_docs(db, [docs[i] for i in reenviar])):
+            resultados[i] = resultado
+
+    # Reflejar en la caché de catálogo los documentos guardados (p. ej. stock de ingredientes)
+    for resultado in resultados:
+        if resultado['ok'] and _es_documento_de_catalogo(resultado['id']):
+            get_catalog_cache(db).registrar_documento(resultado['doc'])
+        elif resultado['ok'] and resultado['id'].startswith(f"{active_orders.ORDENES_PARTITION_KEY}:"):
+            registrar_orden_activa(db, resultado['doc'])
+    return resultados
+
+def _bulk_docs(db, docs):
+    resultados = []
+    for doc, (ok, doc_id, rev_o_error) in zip(docs, db.update(docs)):
+        resultados.append({
+            'id': doc_id,
+            'ok': ok,
+            'rev': rev_o_error if ok else None,
+            'conflicto': not ok and isinstance(rev_o_error, couchdb.http.ResourceConflict),
+            'error': None if ok else str(rev_o_error),
+            'doc': doc,
+        })
+    return resultados
+
+def _es_documento_de_catalogo(doc_id):
+    return doc_id.split(':', 1)[0] in catalog_cache.PARTICIONES_CATALOGO
+
+def _leer_documentos(db, ids):
+    """Lee varios documentos en una sola petición '_all_docs' con 'keys'. Retorna {_id: doc}."""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+    rows = db.view('_all_docs', keys=ids, include_docs=True)
+    return {row.id: row.doc for row in rows if getattr(row, 'doc', None) is not None}
+
+@st.cache_resource
+def get_document_cache(_db):
+    """Caché LRU de documentos (por _id y _rev) compartida por todas las sesiones del proceso."""
+    return doc_cache.CacheDocumentos()
+
+def get_many(db, ids):
+    """
+    Obtiene varios documentos por _id para cruzarlos con otros (p. ej. las órdenes de los tickets pendientes).
+    Consulta a '_all_docs' solo las revisiones actuales y descarga, en una segunda petición con 'keys',
+    únicamente los documentos que no están en la caché con ese _rev.
+    Retorna {_id: doc} (copias); los _id inexistentes o eliminados no se incluyen.
+    """
+    ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id]
+    if not ids:
+        return {}
+    cache = get_document_cache(db)
+    try:
+        revisiones = {}
+        for row in db.view('_all_docs', keys=ids):
+            valor = getattr(row, 'value', None) or {}
+            if row.id and valor.get('rev') and not valor.get('deleted'):
+                revisiones[row.id] = valor['rev']
+
+        documentos = {}
+        faltantes = []
+        for doc_id, rev in revisiones.items():
+            doc = cache.obtener(doc_id, rev)
+            if doc is None:
+                faltantes.append(doc_id)
+            else:
+                documentos[doc_id] = doc
+        for doc_id, doc in _leer_documentos(db, faltantes).items():
+            cache.guardar(doc)
+            documentos[doc_id] = doc
+    except Exception as e:
+        st.error(f"Error al obtener documentos: {e}")
+        return {}
+    # Copias: quien recibe el documento puede modificarlo sin alterar la caché
+    return {doc_id: copy.deepcopy(documentos[doc_id]) for doc_id in ids if doc_id in documentos}
+
+def guardar_movimientos_inventario(db, movimientos, otros_docs=(), actualizar_stock=True, rehacer_otros=None):
+    """
+    Guarda en un solo '_bulk_docs' los movimientos de inventario y otros documentos relacionados
+    (p. ej. la orden anulada). El stock sale de los movimientos (inventory_ledger), así que no se
+    reescribe ningún documento de ingrediente y las ventas simultáneas no compiten entre sí; solo
+    los otros documentos pueden quedar en conflicto, y para ellos se usa rehacer_otros (misma firma
+    que el rehacer de save_documents_bulk), si se indica.
+    La cantidad de cada movimiento lleva signo (salidas negativas). Con actualizar_stock=False los
+    movimientos se guardan como informativos (afecta_stock=False) y no cambian el saldo.
+    Retorna (ingredientes, resultados): los ingredientes afectados {_id: doc} con su 'cantidad'
+    resultante y el indicador 'sin_stock' cuando la salida superó lo disponible, y los resultados
+    de save_documents_bulk.
+    """
+    movimientos = list(movimientos)
+    if not actualizar_stock:
+        for movimiento in movimientos:
+            movimiento['afecta_stock'] = False
+
+    resultados = save_documents_bulk(db, movimientos + list(otros_docs), rehacer=rehacer_otros)
+
+    guardados = [
+        resultado['doc'] for resultado in resultados
+        if resultado['ok'] and inventory_ledger.afecta_stock(resultado['doc'])
+    ]
+    registrar_movimientos_inventario(db, guardados)
+
+    saldos = get_stocks(db, {movimiento['ingrediente_id'] for movimiento in guardados})
+    ingredientes = {}
+    for ingrediente_id, saldo in saldos.items():
+        ingrediente_doc = get_catalog_document(db, ingrediente_id) or {'_id': ingrediente_id}
+        ingredientes[ingrediente_id] = dict(ingrediente_doc, cantidad=max(saldo, 0), sin_stock=saldo < 0)
+    return ingredientes, resultados
+
+@st.cache_resource
+def get_inventory_ledger(_db):
+    """
+    Retorna el libro de inventario (saldo por ingrediente) compartido por todas las sesiones del proceso.
+    Se carga desde la última foto de saldos y el feed _changes de 'inventario' lo mantiene al día.
+    """
+    return inventory_ledger.LibroInventario(_db)
+
+def registrar_movimientos_inventario(db, movimientos):
+    """Refleja en el libro de inventario movimientos recién guardados, sin esperar al feed."""
+    try:
+        get_inventory_ledger(db).registrar(movimientos)
+    except Exception as e:
+        print(f"Error al actualizar el libro de inventario: {e}")
+
+def get_stocks(db, ingrediente_ids=None):
+    """
+    Stock actual {ingrediente_id: cantidad} de todos los ingredientes o de los indicados, desde el
+    libro de inventario en memoria. Si el libro no está disponible, se calcula con la vista _sum
+    de movimientos por ingrediente (una sola consulta).
+    """
+    try:
+        return get_inventory_ledger(db).saldos(ingrediente_ids)
+    except Exception as e:
+        print(f"Error al leer el libro de inventario: {e}")
+    try:
+        return inventory_ledger.saldos_desde_vista(db, ingrediente_ids)
+    except Exception as e:
+        st.error(f"Error al calcular el stock de inventario: {e}")
+        return {} if ingrediente_ids is None else dict.fromkeys(ingrediente_ids, 0)
+
+def get_stock(db, ingrediente_id):
+    """Stock actual de un ingrediente (suma de sus movimientos de inventario)."""
+    return get_stocks(db, [ingrediente_id]).get(ingrediente_id, 0)
+
+def ajustar_stock_inventario(db, ingrediente_id, cantidad_contada, usuario, motivo="Ajuste de inventario"):
+    """
+    Registra el movimiento ('ajuste') que lleva el stock del ingrediente a cantidad_contada.
+    Retorna (True, diferencia) o (False, mensaje_de_error); sin diferencia no se guarda nada.
+    """
+    return registrar_ajuste_inventario(
+        db, ingrediente_id, float(cantidad_contada) - get_stock(db, ingrediente_id), usuario, motivo
+    )
+
+def registrar_ajuste_inventario(db, ingrediente_id, diferencia, usuario, motivo="Ajuste de inventario"):
+    """
+    Registra un movimiento de ajuste por `diferencia` (con signo), sin leer el stock actual: las
+    ventas registradas entre tanto se conservan.
+    Retorna (True, diferencia) o (False, mensaje_de_error); sin diferencia no se guarda nada.
+    """
+    if abs(diferencia) < 1e-9:
+        return True, 0
+    movimiento = inventory_ledger.nuevo_movimiento(
+        ingrediente_id, diferencia, "entrada" if diferencia > 0 else "salida", usuario, motivo, ajuste=True
+    )
+    try:
+        _, resultados = guardar_movimientos_inventario(db, [movimiento])
+    except Exception as e:
+        return False, str(e)
+    if not resultados[0]['ok']:
+        return False, resultados[0]['error']
+    return True, diferencia
+
 # --- Funciones de Autenticación ---
 
 def validarUsuario(usuario, clave):    
@@ -851,7 +1532,7 @@ def validarUsuario(usuario, clave):
         st.error("No se pudo conectar a la base de datos de CouchDB para la validación de usuario.")
         return False
 
-    all_users_in_partition = get_documents_by_partition(db, PARTITION_KEY)
+    all_users_in_partition = get_catalog_documents(db, PARTITION_KEY)
 
     for user_doc in all_users_in_partition:
         stored_username = user_doc.get('usuario')
@@ -962,7 +1643,7 @@ def generarLogin(archivo_pagina_actual):
         if db_instance:
             db = get_database_instance()
             if db:
-                all_users_in_partition = get_documents_by_partition(db, PARTITION_KEY)
+                all_users_in_partition = get_catalog_documents(db, PARTITION_KEY)
                 found_user = None
                 # print(f"Tipo de dato recibido: {type(user_data_cookie_str)}")
                 # print(f"Contenido recibido: {user_data_cookie_str}")
@@ -1066,89 +1747,145 @@ def generarLogin(archivo_pagina_actual):
             </div>
             """, unsafe_allow_html=True)
 
-def registrar_movimiento_inventario(db, plato_id, cantidad_vendida, usuario):
+def _platos_de_orden(db, orden):
+    """
+    Platos vendidos en los items activos de la orden, como [(plato, cantidad)] sumando los items del mismo plato.
+    Cada item se resuelve por 'plato_id' con la caché de catálogo; el índice por nombre (órdenes antiguas,
+    promociones) se arma una sola vez y solo si algún item lo necesita.
     """
-    Registra movimientos de inventario (salidas de ingredientes) cuando se vende un plato.
+    vendidos = {}
+    por_nombre = None
+    for item in orden.get('items', []):
+        if item.get('anulado', False):
+            continue
+        plato = get_catalog_document(db, item['plato_id']) if item.get('plato_id') else None
+        if plato is None or not plato['_id'].startswith("platos:"):
+            if por_nombre is None:
+                por_nombre = {}
+                for p in get_catalog_documents(db, "platos"):
+                    por_nombre.setdefault(p.get('descripcion'), p)
+            plato = por_nombre.get(item.get('nombre'))
+        if plato is None:
+            continue
+        _, cantidad = vendidos.get(plato['_id'], (plato, 0))
+        vendidos[plato['_id']] = (plato, cantidad + item.get('cantidad', 1))
+    return list(vendidos.values())
+
+def _movimientos_venta(db, platos_vendidos, usuario, orden_referencia):
     """
+    Salidas de inventario de los platos vendidos [(plato, cantidad)]: un movimiento por ingrediente
+    con el consumo sumado de todos los platos que lo usan.
+    El _id es fijo por orden (orden_referencia) e ingrediente: un segundo cobro de la misma orden
+    queda en conflicto en lugar de descontar el inventario otra vez.
+    """
+    ingredientes_activos = None
+    consumo = {}
+    platos_por_ingrediente = {}
+    for plato, cantidad_vendida in platos_vendidos:
+        # Solo los platos que usan ingredientes descuentan inventario
+        if plato.get('usa_ingrediente', 0) != 1:
+            continue
+        if ingredientes_activos is None:
+            ingredientes_activos = {ing['_id']: ing for ing in get_catalog_documents(db, "ingredientes") if ing.get('activo', 0) == 1}
+        for ingrediente_info in ingredientes_de_plato(db, plato, ingredientes_activos):
+            ingrediente_id = ingrediente_info['ingrediente_id']
+            consumo[ingrediente_id] = consumo.get(ingrediente_id, 0) + ingrediente_info['cantidad'] * cantidad_vendida
+            platos_por_ingrediente.setdefault(ingrediente_id, []).append(plato.get('descripcion', 'plato'))
+
+    fecha = datetime.now(timezone.utc).isoformat()
+    movimientos = []
+    for ingrediente_id, cantidad in consumo.items():
+        movimiento = {
+            "_id": f"inventario:venta~{orden_referencia}~{ingrediente_id}",
+            "type": "inventario",
+            "ingrediente_id": ingrediente_id,
+            "tipo": "salida",
+            "cantidad": -cantidad,  # Negativo para salidas
+            "motivo": f"Venta de {', '.join(platos_por_ingrediente[ingrediente_id])}",
+            "usuario": usuario,
+            "fecha_creacion": fecha,
+            "orden_referencia": orden_referencia
+        }
+        movimientos.append(movimiento)
+    return movimientos
+
+def _mostrar_alertas_stock(db, ingredientes_actualizados):
+    """Avisos de stock agotado o bajo (según los límites de 'alertas_stock') de los ingredientes recién descontados."""
     try:
-        # Obtener el plato para verificar si usa ingredientes
-        platos = get_documents_by_partition(db, "platos")
-        plato = next((p for p in platos if p['_id'] == plato_id), None)
-        
-        if not plato:
-            return False
-            
-        if plato.get('usa_ingrediente', 0) == 1:
-            # Obtener ingredientes disponibles para mapear ingredientes del plato
-            ingredientes = get_documents_by_partition(db, "ingredientes")
-            ingredientes_activos = {ing['_id']: ing for ing in ingredientes if ing.get('activo', 0) == 1}
-            
-            # Mapear ingredientes por nombre del plato (lógica simplificada)
-            ingredientes_plato = obtener_ingredientes_por_plato(plato, ingredientes_activos)
-            
-            # Registrar movimiento de salida para cada ingrediente y actualizar stock
-            alertas_stock = []
-            
-            for ingrediente_info in ingredientes_plato:
-                ingrediente_id = ingrediente_info['ingrediente_id']
-                cantidad_usada = ingrediente_info['cantidad'] * cantidad_vendida
-                
-                # 1. Crear movimiento de inventario
-                movimiento = {
-                    "_id": f"inventario:{uuid.uuid4()}",
-                    "type": "inventario", 
-                    "ingrediente_id": ingrediente_id,
-                    "tipo": "salida",
-                    "cantidad": -cantidad_usada,  # Negativo para salidas
-                    "motivo": f"Venta de {plato.get('descripcion', 'plato')}",
-                    "usuario": usuario,
-                    "fecha_creacion": datetime.now(timezone.utc).isoformat()
-                }
-                db.save(movimiento)
-                
-                # 2. Actualizar cantidad física en la tabla de ingredientes
-                try:
-                    ingrediente_doc = db[ingrediente_id]
-                    cantidad_actual = float(ingrediente_doc.get('cantidad', 0))
-                    nueva_cantidad = cantidad_actual - cantidad_usada
-                    
-                    # Verificar que no quede negativo
-                    if nueva_cantidad < 0:
-                        nueva_cantidad = 0
-                        st.warning(f"⚠️ Stock insuficiente de {ingrediente_doc.get('descripcion', 'ingrediente')}. Se agotó el inventario.")
-                    
-                    # Actualizar la cantidad en el documento del ingrediente
-                    ingrediente_doc['cantidad'] = nueva_cantidad
-                    db.save(ingrediente_doc)
-                    
-                    # 3. Verificar alerta de stock bajo (menos de 10 unidades)
-                    if nueva_cantidad <= 10 and nueva_cantidad > 0:
-                        nombre_ingrediente = ingrediente_doc.get('descripcion', 'Ingrediente desconocido')
-                        unidad = ingrediente_doc.get('unidad', 'unidades')
-                        alertas_stock.append(f"🔔 ALERTA: Quedan solo {nueva_cantidad:.1f} {unidad} de {nombre_ingrediente}. ¡Es necesario comprar más!")
-                    elif nueva_cantidad == 0:
-                        nombre_ingrediente = ingrediente_doc.get('descripcion', 'Ingrediente desconocido')
-                        alertas_stock.append(f"🚨 CRÍTICO: {nombre_ingrediente} se ha AGOTADO. ¡Compra urgente necesaria!")
-                        
-                except Exception as e:
-                    st.error(f"Error al actualizar stock de ingrediente {ingrediente_id}: {e}")
-            
-            # Mostrar alertas de stock bajo
-            for alerta in alertas_stock:
-                st.warning(alerta)
-            
-            return True
-        else:
-            return False
+        alertas = get_stock_alerts(db)
     except Exception as e:
-        st.error(f"Error al registrar movimiento de inventario: {e}")
-        return False
+        print(f"Error al leer las alertas de stock: {e}")
+        alertas = None
+    for ingrediente_id, ingrediente_doc in ingredientes_actualizados.items():
+        if ingrediente_doc['sin_stock']:
+            nombre_ingrediente = ingrediente_doc.get('descripcion', 'Ingrediente desconocido')
+            st.warning(f"⚠️ Stock insuficiente de {nombre_ingrediente}. Se agotó el inventario.")
+        alerta = alertas.alerta(ingrediente_id) if alertas else None
+        if alerta:
+            st.warning(alerta['mensaje'])
+
+def confirmar_pago(db, ticket_id, orden_id, pago_info, usuario):
+    """
+    Cobra un ticket con una sola lectura ('_all_docs' del ticket y la orden) y una sola escritura
+    '_bulk_docs': el ticket pagado, la orden en 'pagada' (order_lifecycle), las salidas de inventario
+    de todos los items (consumo agregado por ingrediente) y el stock resultante.
+    Si otra terminal modificó el ticket o la orden, se releen y se vuelve a aplicar el cobro
+    (solo si siguen pendientes). Las salidas tienen _id fijo por orden, así que si dos terminales
+    cobran el mismo ticket a la vez, las de la que pierde quedan en conflicto y no se descuentan.
+    Retorna (orden, ticket, None) o (None, None, mensaje_de_error).
+    """
+    fecha_pago = datetime.now(timezone.utc).isoformat()
+
+    def marcar_pagado(ticket_doc):
+        ticket_doc.update({'estado': 'pagado', 'fecha_pago': fecha_pago, 'pago_info': pago_info})
+        return ticket_doc
+
+    def rehacer_otros(conflictos):
+        nuevas_versiones = []
+        for doc_id, doc in _leer_documentos(db, [d['_id'] for d in conflictos]).items():
+            if doc_id == ticket_id and doc.get('estado') != 'pagado':
+                nuevas_versiones.append(marcar_pagado(doc))
+            elif doc_id == orden_id and order_lifecycle.puede(doc, "pagar"):
+                nuevas_versiones.append(order_lifecycle.aplicar_transicion(doc, "pagar", usuario))
+        return nuevas_versiones
+
+    try:
+        docs = _leer_documentos(db, [ticket_id, orden_id])
+        ticket, orden = docs.get(ticket_id), docs.get(orden_id)
+        if ticket is None or orden is None:
+            return None, None, "No se encontró el ticket o la orden a cobrar"
+        if ticket.get('estado') == 'pagado':
+            return None, None, f"El ticket de la orden #{ticket.get('numero_orden', 'N/A')} ya fue cobrado"
+
+        marcar_pagado(ticket)
+        order_lifecycle.aplicar_transicion(orden, "pagar", usuario)
+        movimientos = _movimientos_venta(db, _platos_de_orden(db, orden), usuario, orden_id)
+
+        ingredientes_actualizados, resultados = guardar_movimientos_inventario(
+            db, movimientos, otros_docs=[ticket, orden], rehacer_otros=rehacer_otros
+        )
+    except order_lifecycle.TransicionInvalida as e:
+        return None, None, str(e)
+    except Exception as e:
+        return None, None, f"Error al procesar el pago: {e}"
+
+    por_id = {resultado['id']: resultado for resultado in resultados}
+    for resultado in resultados:
+        # Una salida en conflicto ya fue registrada por otro cobro de la misma orden
+        if not resultado['ok'] and not resultado['conflicto'] and resultado['id'] not in (ticket_id, orden_id):
+            log_action(db, usuario, f"Error al registrar movimiento de venta {resultado['id']}: {resultado['error']}")
+    for doc_id in (ticket_id, orden_id):
+        if not por_id[doc_id]['ok']:
+            return None, None, f"No se pudo guardar '{doc_id}': {por_id[doc_id]['error']}"
+
+    _mostrar_alertas_stock(db, ingredientes_actualizados)
+    return por_id[orden_id]['doc'], por_id[ticket_id]['doc'], None
 
 def obtener_ingredientes_por_plato(plato, ingredientes_activos):
     """
-    Determina qué ingredientes usa un plato y en qué cantidad.
-    Por ahora usa lógica simplificada basada en el nombre del plato.
-    En el futuro se puede expandir a un sistema de recetas completo.
+    Determina qué ingredientes usa un plato y en qué cantidad según el nombre del plato.
+    Mapeo de respaldo para los platos que aún no tienen receta en 'plato_ingrediente'
+    (ver ingredientes_de_plato()); los platos sin mapeo no descuentan ingredientes.
     """
     plato_nombre = plato.get('descripcion', '').lower()
     ingredientes_plato = []
@@ -1234,14 +1971,6 @@ def obtener_ingredientes_por_plato(plato, ingredientes_activos):
             elif 'cilantro' in nombre_ing:
                 ingredientes_plato.append({'ingrediente_id': ing_id, 'cantidad': 10})  # 10g cilantro
     
-    else:
-        # Para platos no mapeados, crear un mapeo genérico con cualquier ingrediente disponible
-        if ingredientes_activos:
-            # Tomar el primer ingrediente disponible como genérico
-            primer_ingrediente = next(iter(ingredientes_activos.items()))
-            ing_id, ing = primer_ingrediente
-            ingredientes_plato.append({'ingrediente_id': ing_id, 'cantidad': 1})
-    
     return ingredientes_plato
 
 # --- Funciones para Sistema de Anulaciones ---
@@ -1400,45 +2129,30 @@ def ejecutar_anulacion_producto(db, orden_id, item_index, usuario_admin):
         if 'solicitud_anulacion_id' in item:
             del item['solicitud_anulacion_id']
         
-        # Revertir inventario si el plato usa ingredientes
-        platos = get_documents_by_partition(db, "platos")
-        plato = next((p for p in platos if p.get('descripcion') == item.get('nombre')), None)
+        # Revertir inventario si el plato usa ingredientes. El plato se resuelve por 'plato_id' (como en la
+        # venta y en la anulación completa); por nombre solo en los items antiguos que no lo tienen
+        movimientos = []
+        plato = get_catalog_document(db, item['plato_id']) if item.get('plato_id') else None
+        if plato is None or not plato['_id'].startswith("platos:"):
+            plato = next((p for p in get_catalog_documents(db, "platos") if p.get('descripcion') == item.get('nombre')), None)
         
         if plato and plato.get('usa_ingrediente', 0) == 1:
-            # Revertir movimientos de inventario
-            ingredientes = get_documents_by_partition(db, "ingredientes")
-            ingredientes_activos = {ing['_id']: ing for ing in ingredientes if ing.get('activo', 0) == 1}
-            ingredientes_plato = obtener_ingredientes_por_plato(plato, ingredientes_activos)
+            # Revertir movimientos de inventario (receta compilada)
+            ingredientes_plato = ingredientes_de_plato(db, plato)
             
             for ingrediente_info in ingredientes_plato:
-                ingrediente_id = ingrediente_info['ingrediente_id']
-                cantidad_a_revertir = ingrediente_info['cantidad'] * item.get('cantidad', 1)
-                
-                # 1. Crear movimiento de inventario de reversión (entrada)
-                import uuid
-                movimiento = {
+                # Movimiento de inventario de reversión (entrada); el stock se ajusta al guardar
+                movimientos.append({
                     "_id": f"inventario:{uuid.uuid4()}",
                     "type": "inventario", 
-                    "ingrediente_id": ingrediente_id,
+                    "ingrediente_id": ingrediente_info['ingrediente_id'],
                     "tipo": "entrada",
-                    "cantidad": cantidad_a_revertir,  # Positivo para entradas
+                    "cantidad": ingrediente_info['cantidad'] * item.get('cantidad', 1),  # Positivo para entradas
                     "motivo": f"Reversión por anulación - {item.get('nombre', 'producto')}",
                     "usuario": usuario_admin,
                     "orden_relacionada": orden_id,
                     "fecha_creacion": datetime.now(timezone.utc).isoformat()
-                }
-                db.save(movimiento)
-                
-                # 2. Actualizar cantidad física en ingredientes
-                try:
-                    ingrediente_doc = db[ingrediente_id]
-                    cantidad_actual = float(ingrediente_doc.get('cantidad', 0))
-                    nueva_cantidad = cantidad_actual + cantidad_a_revertir
-                    ingrediente_doc['cantidad'] = nueva_cantidad
-                    db.save(ingrediente_doc)
-                except Exception as e:
-                    # Log del error pero continuar con otros ingredientes
-                    log_action(db, usuario_admin, f"Error al revertir ingrediente {ingrediente_id}: {e}")
+                })
         
         # Recalcular total de la orden (excluyendo items anulados)
         nuevo_total = sum(
@@ -1448,8 +2162,17 @@ def ejecutar_anulacion_producto(db, orden_id, item_index, usuario_admin):
         )
         orden['total'] = nuevo_total
         
-        # Guardar orden actualizada
-        db.save(orden)
+        # Guardar orden y movimientos en una sola escritura. Como en la anulación completa, el inventario
+        # solo se descuenta al cobrar: en una orden aún no pagada la reversión queda como informativa
+        _, resultados = guardar_movimientos_inventario(
+            db, movimientos, otros_docs=[orden], actualizar_stock=orden.get('estado') == order_lifecycle.PAGADA
+        )
+        for resultado in resultados:
+            if not resultado['ok']:
+                if resultado['id'] == orden_id:
+                    return False, resultado['error']
+                # Log del error pero conservar la anulación
+                log_action(db, usuario_admin, f"Error al revertir inventario {resultado['id']}: {resultado['error']}")
         
         # Log de la anulación
         log_action(db, usuario_admin, f"Producto '{item.get('nombre', 'N/A')}' anulado en orden {orden_id}")
@@ -1554,22 +2277,17 @@ def crear_solicitud_anulacion_orden_completa(db, orden_id, motivo, usuario_solic
     except Exception as e:
         return False, str(e)
 
-def get_documents_by_type(db, document_type):
+def get_documents_by_type(db, document_type, filtros=None):
     """
-    Obtiene todos los documentos de un tipo específico de la base de datos
+    Obtiene todos los documentos de un tipo específico de la base de datos.
+    filtros: condiciones Mango adicionales, p. ej. {"procesada": False}.
+    Usa el índice global sobre 'type' (db_bootstrap), así que el costo depende
+    de los documentos de ese tipo y no del tamaño de la base de datos.
     """
     try:
-        # Usar vista para obtener todos los documentos
-        docs = []
-        for doc_id in db:
-            if not doc_id.startswith('_'):  # Evitar documentos de diseño
-                try:
-                    doc = db[doc_id]
-                    if doc.get('type') == document_type:
-                        docs.append(doc)
-                except:
-                    continue
-        return docs
+        selector = {"type": document_type}
+        selector.update(filtros or {})
+        return find_documents(db, selector)
     except Exception as e:
         print(f"Error al obtener documentos por tipo {document_type}: {e}")
         return []
@@ -1579,13 +2297,8 @@ def obtener_solicitudes_anulacion_completa_pendientes(db):
     Obtiene todas las solicitudes de anulación completa pendientes
     """
     try:
-        # Obtener solicitudes por tipo
-        solicitudes = get_documents_by_type(db, "solicitud_anulacion_completa")
-        
-        # Filtrar solo las pendientes
-        solicitudes_pendientes = [s for s in solicitudes if not s.get('procesada', False)]
-        
-        return solicitudes_pendientes
+        # Obtener solo las solicitudes pendientes (filtro resuelto por CouchDB)
+        return get_documents_by_type(db, "solicitud_anulacion_completa", {"procesada": False})
     except Exception as e:
         print(f"Error al obtener solicitudes de anulación completa: {e}")
         return []
@@ -1652,10 +2365,12 @@ def ejecutar_anulacion_orden_completa(db, orden_id, usuario_admin):
             return False, "La orden ya está anulada"
         
         # Obtener datos necesarios para reversión de inventario
-        platos = {p['_id']: p for p in get_documents_by_partition(db, "platos")}
-        ingredientes = {i['_id']: i for i in get_documents_by_partition(db, "ingredientes")}
+        platos = {p['_id']: p for p in get_catalog_documents(db, "platos")}
+        ingredientes = {i['_id']: i for i in get_catalog_documents(db, "ingredientes")}
+        ingredientes_activos = {ing_id: ing for ing_id, ing in ingredientes.items() if ing.get('activo', 0) == 1}
         
         items_revertidos = []
+        movimientos = []
         
         # Revertir inventario para cada item no anulado
         for item in orden.get('items', []):
@@ -1663,11 +2378,12 @@ def ejecutar_anulacion_orden_completa(db, orden_id, usuario_admin):
                 plato_id = item.get('plato_id')
                 cantidad = item.get('cantidad', 0)
                 
-                if plato_id in platos:
+                # Como en la venta, solo los platos que usan ingredientes tienen qué revertir
+                if plato_id in platos and platos[plato_id].get('usa_ingrediente', 0) == 1:
                     plato = platos[plato_id]
                     
-                    # Revertir ingredientes del plato
-                    for ingrediente_info in plato.get('ingredientes', []):
+                    # Revertir ingredientes del plato (receta compilada)
+                    for ingrediente_info in ingredientes_de_plato(db, plato, ingredientes_activos):
                         ingrediente_id = ingrediente_info.get('ingrediente_id')
                         cantidad_por_plato = ingrediente_info.get('cantidad', 0)
                         cantidad_total_revertir = cantidad_por_plato * cantidad
@@ -1687,8 +2403,7 @@ def ejecutar_anulacion_orden_completa(db, orden_id, usuario_admin):
                                 "orden_referencia": orden_id
                             }
                             
-                            # Guardar movimiento
-                            db.save(movimiento_doc)
+                            movimientos.append(movimiento_doc)
                             
                             items_revertidos.append({
                                 "item_nombre": item.get('nombre', 'N/A'),
@@ -1697,10 +2412,11 @@ def ejecutar_anulacion_orden_completa(db, orden_id, usuario_admin):
                             })
         
         # Cambiar estado de la orden
-        orden['estado'] = 'anulada'
-        orden['fecha_anulacion_completa'] = datetime.now(timezone.utc).isoformat()
-        orden['usuario_anula_completa'] = usuario_admin
-        orden['items_revertidos_inventario'] = items_revertidos
+        order_lifecycle.aplicar_transicion(orden, "anular", usuario_admin, {
+            'fecha_anulacion_completa': datetime.now(timezone.utc).isoformat(),
+            'usuario_anula_completa': usuario_admin,
+            'items_revertidos_inventario': items_revertidos,
+        })
         
         # Limpiar campos de solicitud pendiente
         if 'solicitud_anulacion_completa_pendiente' in orden:
@@ -1708,8 +2424,13 @@ def ejecutar_anulacion_orden_completa(db, orden_id, usuario_admin):
         if 'anulacion_completa_rechazada' in orden:
             del orden['anulacion_completa_rechazada']
         
-        # Guardar orden actualizada
-        db.save(orden)
+        # Guardar orden y movimientos de reversión en una sola escritura
+        _, resultados = guardar_movimientos_inventario(db, movimientos, otros_docs=[orden], actualizar_stock=False)
+        for resultado in resultados:
+            if not resultado['ok']:
+                if resultado['id'] == orden_id:
+                    return False, resultado['error']
+                log_action(db, usuario_admin, f"Error al registrar movimiento de reversión {resultado['id']}: {resultado['error']}")
         
         # Log de la anulación
         log_action(db, usuario_admin, f"Ejecutó anulación completa de orden #{orden.get('numero_orden')} - {len(items_revertidos)} items revertidos al inventario")
@@ -0,0 +1,347 @@
+# db_bootstrap.py
+"""
+Instala y actualiza las vistas (design documents) e índices Mango que la
+aplicación necesita en la base de datos particionada 'tiajuana'.
+
+Se ejecuta automáticamente una vez por proceso desde
+couchdb_utils.get_database_instance() y también puede usarse desde consola:
+
+    python db_bootstrap.py            # instala/actualiza vistas e índices
+    python db_bootstrap.py --forzar   # reinstala aunque la versión coincida
+    python db_bootstrap.py --estado   # muestra el progreso de construcción
+"""
+
+import warnings
+warnings.filterwarnings("ignore", message="pkg_resources is deprecated as an API")
+
+import argparse
+import time
+import couchdb
+import inventory_ledger
+
+# Incrementar cada vez que cambien DESIGN_DOCS, MANGO_INDEXES o MIGRACIONES
+SCHEMA_VERSION = 7
+
+# Documento local (no se replica ni pertenece a ninguna partición) con la versión instalada
+SCHEMA_LOCAL_DOC_ID = "_local/tjadmin_schema"
+
+# --- Vistas MapReduce ---
+# Son particionadas: se consultan con '_partition/<clave>/_design/<ddoc>/_view/<vista>'
+DESIGN_DOCS = {
+    "_design/orders": {
+        "language": "javascript",
+        "options": {"partitioned": True},
+        "views": {
+            # Usada por get_next_order_number y la pestaña de numeración de configuracion.py
+            "by_order_number": {
+                "map": "function (doc) { if (typeof doc.numero_orden === 'number') { emit(doc.numero_orden, null); } }"
+            }
+        }
+    },
+    # Tiempos de preparación sobre los eventos de la partición 'despachos' (prep_times.py)
+    "_design/prep": {
+        "language": "javascript",
+        "options": {"partitioned": True},
+        "views": {
+            # [estacion, plato_id, dia_semana, hora, cubeta de 30 s] -> cantidad de muestras
+            # (30 y 14400 deben coincidir con prep_times.ANCHO_CUBETA_SEGUNDOS y MAX_SEGUNDOS)
+            "histograma": {
+                "map": "function (doc) { if (doc.type === 'despachos' && typeof doc.segundos_preparacion === 'number') { emit([doc.estacion, doc.plato_id, doc.dia_semana, doc.hora, Math.floor(Math.min(doc.segundos_preparacion, 14399) / 30)], null); } }",
+                "reduce": "_count"
+            },
+            # [estacion, fecha local, hora] del despacho -> items despachados
+            "rendimiento": {
+                "map": "function (doc) { if (doc.type === 'despachos' && doc.fecha_local_despacho) { emit([doc.estacion, doc.fecha_local_despacho, doc.hora_despacho], null); } }",
+                "reduce": "_count"
+            }
+        }
+    },
+    # Movimientos de la partición 'inventario' (inventory_ledger.py)
+    "_design/inventario": {
+        "language": "javascript",
+        "options": {"partitioned": True},
+        "views": {
+            # [ingrediente_id, fecha local, tipo] -> suma de cantidades (con signo); group_level=1 da el stock.
+            # Fecha local de El Salvador (UTC-6, sin horario de verano). Excluye los movimientos con afecta_stock=false
+            "stock": {
+                "map": "function (doc) { if (doc.type === 'inventario' && doc.ingrediente_id && doc.afecta_stock !== false && typeof doc.cantidad === 'number') { var t = Date.parse(doc.fecha_creacion); var dia = isNaN(t) ? '' : new Date(t - 6 * 3600000).toISOString().substring(0, 10); emit([doc.ingrediente_id, dia, doc.tipo || ''], doc.cantidad); } }",
+                "reduce": "_sum"
+            }
+        }
+    }
+}
+
+# --- Índices Mango ---
+# Un índice particionado cubre todas las particiones, por eso cada campo se indexa
+# una sola vez aunque lo consulten varias particiones ('particiones' es informativo).
+MANGO_INDEXES = [
+    {"name": "estado", "fields": ["estado"], "particiones": ["ordenes", "tickets", "anulaciones"]},
+    # También ordena (desc) el historial de movimientos de inventario (pages/inventario.py)
+    {"name": "fecha_creacion", "fields": ["fecha_creacion"], "particiones": ["ordenes", "tickets", "inventario"]},
+    {"name": "fecha_pago", "fields": ["fecha_pago"], "particiones": ["ordenes", "tickets"]},
+    {"name": "numero_orden", "fields": ["numero_orden"], "particiones": ["ordenes"]},
+    {"name": "numero_ticket", "fields": ["numero_ticket"], "particiones": ["tickets"]},
+    {"name": "orden_id", "fields": ["orden_id"], "particiones": ["tickets", "anulaciones", "despachos"]},
+    {"name": "ingrediente_id", "fields": ["ingrediente_id"], "particiones": ["inventario"]},
+    # Compras nuevas para el historial de proveedores (consumption_forecast.UltimosProveedores)
+    {"name": "fecha_registro", "fields": ["fecha_registro"], "particiones": ["compras"]},
+    {"name": "usuario", "fields": ["usuario"], "particiones": ["Usuario", "logs"]},
+    {"name": "id_rol", "fields": ["id_rol"], "particiones": ["Usuario"]},
+    # Logs de un usuario en un rango de _id (couchdb_utils.query_logs)
+    {"name": "usuario-id", "fields": ["usuario", "_id"], "particiones": ["logs"]},
+    # Índice global (no particionado) para las consultas db.find({"selector": {"type": ...}})
+    {"name": "type-global", "fields": ["type"], "partitioned": False},
+]
+
+MANGO_DDOC = "mango-tjadmin"
+
+# Prefijo del _id del movimiento de apertura de cada ingrediente (uno por ingrediente: si la
+# migración se repite, el _id choca en lugar de sumar el saldo otra vez)
+APERTURA_ID_PREFIJO = f"{inventory_ledger.MOVIMIENTOS_PARTITION_KEY}:apertura~"
+
+# Nombres de base de datos ya verificados en este proceso
+_ESQUEMA_VERIFICADO = set()
+
+# Migraciones que fallaron en este proceso: {nombre de la base de datos: [(migración, error)]}
+_MIGRACIONES_FALLIDAS = {}
+
+
+class MigracionFallida(RuntimeError):
+    """Una migración de datos falló: el esquema no se registra como instalado y se reintenta."""
+
+
+def instalar_design_docs(db):
+    """
+    Crea o actualiza los design documents de DESIGN_DOCS.
+    Retorna una lista de tuplas (ddoc_id, acción) con acción 'creado', 'actualizado' o 'sin cambios'.
+    """
+    resultados = []
+    for ddoc_id, definicion in DESIGN_DOCS.items():
+        existente = db.get(ddoc_id)
+        if existente is None:
+            db.save(dict(definicion, _id=ddoc_id))
+            resultados.append((ddoc_id, 'creado'))
+            continue
+
+        cambios = {k: v for k, v in definicion.items() if existente.get(k) != v}
+        if cambios:
+            existente.update(cambios)
+            db.save(existente)
+            resultados.append((ddoc_id, 'actualizado'))
+        else:
+            resultados.append((ddoc_id, 'sin cambios'))
+    return resultados
+
+
+def instalar_indices_mango(db):
+    """
+    Crea los índices de MANGO_INDEXES. CouchDB responde 'exists' si ya estaban creados.
+    Retorna una lista de tuplas (nombre, resultado).
+    """
+    resultados = []
+    for indice in MANGO_INDEXES:
+        cuerpo = {
+            "index": {"fields": indice["fields"]},
+            "ddoc": MANGO_DDOC if indice.get("partitioned", True) else f"{MANGO_DDOC}-global",
+            "name": indice["name"],
+            "type": "json",
+            "partitioned": indice.get("partitioned", True),
+        }
+        _, _, data = db.resource.post_json('_index', body=cuerpo)
+        resultados.append((indice["name"], data.get('result', 'desconocido')))
+    return resultados
+
+
+# --- Migraciones de datos ---
+# Se ejecutan una sola vez por base de datos (quedan anotadas en SCHEMA_LOCAL_DOC_ID),
+# después de instalar las vistas que usan. Las fotos de saldos del libro de inventario se
+# toman después: couchdb_utils.get_database_instance() instala el esquema antes de crearlo.
+
+def migrar_stock_inicial(db):
+    """
+    Pasa al libro de inventario el stock de los ingredientes que se guardaba en el campo
+    'cantidad' (antes de que el stock fuera la suma de los movimientos): por cada ingrediente
+    registra un movimiento de ajuste por cantidad - suma de sus movimientos.
+    Retorna la cantidad de movimientos de apertura guardados.
+    """
+    saldos = inventory_ledger.saldos_desde_vista(db)
+    movimientos = []
+    for fila in db.view('_partition/ingredientes/_all_docs', include_docs=True):
+        ingrediente = fila.doc
+        if not isinstance((ingrediente or {}).get('cantidad'), (int, float)):
+            continue
+        diferencia = float(ingrediente['cantidad']) - saldos.get(ingrediente['_id'], 0)
+        if abs(diferencia) < 1e-9:
+            continue
+        movimiento = inventory_ledger.nuevo_movimiento(
+            ingrediente['_id'], diferencia, "entrada" if diferencia > 0 else "salida", "Sistema",
+            "Saldo inicial (cantidad registrada en el ingrediente)", ajuste=True
+        )
+        movimiento['_id'] = f"{APERTURA_ID_PREFIJO}{ingrediente['_id']}"
+        movimientos.append(movimiento)
+    guardados = 0
+    for ok, doc_id, resultado in db.update(movimientos):
+        if ok:
+            guardados += 1
+        elif not isinstance(resultado, couchdb.http.ResourceConflict):
+            raise RuntimeError(f"No se pudo guardar el movimiento de apertura {doc_id}: {resultado}")
+    return guardados
+
+
+# Migraciones en orden de ejecución: (nombre, función(db) -> resultado)
+MIGRACIONES = [
+    ("stock_inicial", migrar_stock_inicial),
+]
+
+
+def ejecutar_migraciones(db, registro):
+    """
+    Ejecuta las migraciones de MIGRACIONES que aún no figuran en registro['migraciones'].
+    Retorna (resultados, fallidas): listas de tuplas (nombre, resultado) y (nombre, error).
+    Las que fallan no se anotan y se reintentan en la siguiente instalación.
+    """
+    resultados = []
+    fallidas = []
+    hechas = registro.setdefault('migraciones', [])
+    for nombre, migracion in MIGRACIONES:
+        if nombre in hechas:
+            continue
+        try:
+            resultados.append((nombre, migracion(db)))
+            hechas.append(nombre)
+        except Exception as e:
+            resultados.append((nombre, f"error: {e}"))
+            fallidas.append((nombre, str(e)))
+    return resultados, fallidas
+
+
+def migraciones_pendientes(registro):
+    """Nombres de las migraciones de MIGRACIONES que no figuran como hechas en el registro."""
+    hechas = set((registro or {}).get('migraciones', []))
+    return [nombre for nombre, _ in MIGRACIONES if nombre not in hechas]
+
+
+def migraciones_fallidas(db):
+    """Migraciones que fallaron en este proceso, como [(nombre, error)]; vacía si no hubo fallos."""
+    return list(_MIGRACIONES_FALLIDAS.get(db.name, []))
+
+
+def asegurar_esquema(db, forzar=False):
+    """
+    Instala vistas e índices si la versión registrada en la base de datos es distinta
+    de SCHEMA_VERSION o si falta alguna migración (o si forzar=True). Retorna True si se
+    realizó la instalación. Si una migración falla lanza MigracionFallida; se intenta una
+    vez por proceso (o con forzar=True) y el error queda en migraciones_fallidas().
+    """
+    if not forzar and db.name in _ESQUEMA_VERIFICADO:
+        fallidas = migraciones_fallidas(db)
+        if fallidas:
+            raise MigracionFallida(_mensaje_fallidas(fallidas))
+        return False
+
+    registro = db.get(SCHEMA_LOCAL_DOC_ID) or {"_id": SCHEMA_LOCAL_DOC_ID}
+    if not forzar and registro.get('version') == SCHEMA_VERSION and not migraciones_pendientes(registro):
+        _ESQUEMA_VERIFICADO.add(db.name)
+        return False
+
+    instalar_esquema(db, registro)
+    fallidas = migraciones_fallidas(db)
+    if fallidas:
+        raise MigracionFallida(_mensaje_fallidas(fallidas))
+    return True
+
+
+def _mensaje_fallidas(fallidas):
+    return "; ".join(f"migración '{nombre}': {error}" for nombre, error in fallidas)
+
+
+def instalar_esquema(db, registro=None):
+    """
+    Instala vistas e índices sin consultar la versión, ejecuta las migraciones pendientes
+    y registra SCHEMA_VERSION (solo si ninguna migración falló; las hechas se anotan igual).
+    Retorna (resultados_design_docs, resultados_indices, resultados_migraciones).
+    """
+    resultados_ddocs = instalar_design_docs(db)
+    resultados_indices = instalar_indices_mango(db)
+
+    registro = registro or db.get(SCHEMA_LOCAL_DOC_ID) or {"_id": SCHEMA_LOCAL_DOC_ID}
+    resultados_migraciones, fallidas = ejecutar_migraciones(db, registro)
+    if not fallidas:
+        registro['version'] = SCHEMA_VERSION
+        registro['fecha_instalacion'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    db.save(registro)
+    _ESQUEMA_VERIFICADO.add(db.name)
+    if fallidas:
+        _MIGRACIONES_FALLIDAS[db.name] = fallidas
+    else:
+        _MIGRACIONES_FALLIDAS.pop(db.name, None)
+    return resultados_ddocs, resultados_indices, resultados_migraciones
+
+
+def progreso_indices(server, db_name):
+    """
+    Consulta '_active_tasks' y retorna el progreso de construcción de índices de la base de datos.
+    Cada elemento: {'design_document', 'progreso' (0-100), 'changes_done', 'total_changes'}.
+    """
+    progreso = []
+    for tarea in server.tasks():
+        if tarea.get('type') not in ('indexer', 'search_indexer'):
+            continue
+        if db_name not in str(tarea.get('database', '')):
+            continue
+        hechos = tarea.get('changes_done', 0)
+        total = tarea.get('total_changes', 0)
+        porcentaje = tarea.get('progress')
+        if porcentaje is None:
+            porcentaje = int(hechos * 100 / total) if total else 100
+        progreso.append({
+            'design_document': tarea.get('design_document', 'N/A'),
+            'progreso': porcentaje,
+            'changes_done': hechos,
+            'total_changes': total,
+        })
+    return progreso
+
+
+def _conectar():
+    # Importación diferida: couchdb_utils inicializa Streamlit al importarse
+    import couchdb_utils
+    server = couchdb.Server(couchdb_utils.COUCHDB_URL)
+    server.resource.credentials = (couchdb_utils.COUCHDB_USER, couchdb_utils.COUCHDB_PASSWORD)
+    return server, server[couchdb_utils.COUCHDB_DATABASE_NAME]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instala vistas e índices de CouchDB para tjAdmin.")
+    parser.add_argument('--forzar', action='store_true', help="Reinstalar aunque la versión coincida")
+    parser.add_argument('--estado', action='store_true', help="Mostrar el progreso de construcción de índices")
+    args = parser.parse_args()
+
+    server, db = _conectar()
+
+    if args.estado:
+        tareas = progreso_indices(server, db.name)
+        if not tareas:
+            print("No hay índices en construcción.")
+        for tarea in tareas:
+            print(f"{tarea['design_document']}: {tarea['progreso']}% ({tarea['changes_done']}/{tarea['total_changes']})")
+        return
+
+    if not args.forzar and (db.get(SCHEMA_LOCAL_DOC_ID) or {}).get('version') == SCHEMA_VERSION:
+        print(f"Esquema ya instalado (versión {SCHEMA_VERSION}). Use --forzar para reinstalar.")
+        return
+
+    resultados_ddocs, resultados_indices, resultados_migraciones = instalar_esquema(db)
+    for ddoc_id, accion in resultados_ddocs:
+        print(f"{ddoc_id}: {accion}")
+    for nombre, resultado in resultados_indices:
+        print(f"índice {nombre}: {resultado}")
+    for nombre, resultado in resultados_migraciones:
+        print(f"migración {nombre}: {resultado}")
+    if migraciones_fallidas(db):
+        raise SystemExit(f"Falló alguna migración: el esquema versión {SCHEMA_VERSION} no quedó registrado en '{db.name}'.")
+    print(f"Esquema versión {SCHEMA_VERSION} instalado en '{db.name}'.")
+
+
+if __name__ == "__main__":
+    main()
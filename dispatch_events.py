@@ -0,0 +1,98 @@
+# dispatch_events.py
+"""
+Despacho de items (cocina y bar) registrado como documentos de evento propios en
+la partición 'despachos', en lugar de reescribir la orden completa.
+
+Cada clic crea un documento pequeño con _id determinista
+('despachos:<orden>~<item>~<estacion>'), por lo que nunca choca con las
+ediciones concurrentes de la orden (mesero agregando items, anulaciones, cobro) y
+repetir el mismo despacho simplemente devuelve 409 sobre el propio evento.
+El <item> es el 'id' que recibe cada item al agregarse a la orden (nuevo_item_id),
+de modo que quitar un item no mueve los despachos de los demás; los items de
+órdenes anteriores sin 'id' usan su posición en la lista.
+Los eventos se combinan con la orden al leerla (active_orders.OrdenesActivas),
+dejando en el item los mismos campos que antes se guardaban en la orden:
+'despachado_<estacion>', 'fecha_despacho_<estacion>' y 'usuario_despacho_<estacion>'.
+"""
+
+import uuid
+from datetime import datetime, timezone
+
+DESPACHOS_PARTITION_KEY = "despachos"
+
+# Estaciones que despachan items
+ESTACIONES_DESPACHO = ["cocina", "bar"]
+
+
+def _sufijo(valor):
+    # El ':' separa la partición del resto del _id
+    return str(valor).replace(':', '_')
+
+
+def evento_id(orden_id, item_id, estacion):
+    """_id del evento de despacho de un item en una estación (uno solo por item y estación)."""
+    return f"{DESPACHOS_PARTITION_KEY}:{_sufijo(orden_id)}~{_sufijo(item_id)}~{estacion}"
+
+
+def nuevo_evento(orden_id, item_id, estacion, usuario, fecha=None, muestra=None):
+    """
+    Construye el documento de evento de despacho.
+    muestra: campos de tiempo de preparación (prep_times.campos_muestra) que se guardan junto al evento.
+    """
+    if estacion not in ESTACIONES_DESPACHO:
+        raise ValueError(f"Estación de despacho desconocida: '{estacion}'")
+    evento = dict(muestra or {})
+    evento.update({
+        "_id": evento_id(orden_id, item_id, estacion),
+        "type": DESPACHOS_PARTITION_KEY,
+        "orden_id": orden_id,
+        "item_id": item_id,
+        "estacion": estacion,
+        "usuario": usuario,
+        "fecha": (fecha or datetime.now(timezone.utc)).isoformat(),
+    })
+    return evento
+
+
+def nuevo_item_id():
+    """'id' estable de un item nuevo; se asigna al crearlo, antes de agregarlo a la orden."""
+    return uuid.uuid4().hex
+
+
+def id_item(orden, idx, item):
+    """Identificador del item: su 'id' o, en órdenes anteriores sin él, '<orden_id>_<índice>'."""
+    return item.get('id') or f"{orden['_id']}_{idx}"
+
+
+def fijar_ids_items(orden):
+    """
+    Guarda en los items sin 'id' (órdenes anteriores) su identificador posicional,
+    antes de que editar la orden cambie las posiciones. Modifica la orden.
+    """
+    for idx, item in enumerate(orden.get('items', [])):
+        item['id'] = id_item(orden, idx, item)
+    return orden
+
+
+def aplicar_eventos(orden, eventos):
+    """
+    Marca en los items de la orden (modificándola) los despachos de `eventos`.
+    Los items ya marcados en el propio documento de la orden se respetan.
+    """
+    if not eventos:
+        return orden
+    por_item = {}
+    for evento in eventos:
+        por_item.setdefault(evento.get('item_id'), []).append(evento)
+
+    for idx, item in enumerate(orden.get('items', [])):
+        item_id = id_item(orden, idx, item)
+        for evento in por_item.get(item_id, []):
+            estacion = evento.get('estacion')
+            if item.get(f'despachado_{estacion}', False):
+                continue
+            item['id'] = item_id
+            item[f'despachado_{estacion}'] = True
+            item[f'fecha_despacho_{estacion}'] = evento.get('fecha')
+            item[f'usuario_despacho_{estacion}'] = evento.get('usuario')
+    return orden
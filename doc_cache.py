@@ -0,0 +1,57 @@
+# doc_cache.py
+"""
+Caché LRU de documentos leídos por _id, validada por _rev.
+
+couchdb_utils.get_many() pide primero a '_all_docs' (sin include_docs) la revisión
+actual de cada _id, que es una respuesta pequeña, y solo descarga los documentos
+cuyo _rev no coincide con el guardado aquí. Así los cruces (tickets con sus
+órdenes, por ejemplo) traen únicamente los documentos referenciados y, entre una
+recarga y otra de la página, solo los que cambiaron.
+"""
+
+import threading
+from collections import OrderedDict
+
+# Documentos que se conservan en memoria (los menos usados se descartan)
+CAPACIDAD = 2000
+
+
+class CacheDocumentos:
+    """Caché LRU {_id: documento} compartida entre sesiones; cada entrada vale solo para su _rev."""
+
+    def __init__(self, capacidad=CAPACIDAD):
+        self._capacidad = capacidad
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, doc_id, rev):
+        """Documento guardado para doc_id si su _rev es `rev`; None si no está o cambió."""
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            if doc is None or doc.get('_rev') != rev:
+                self.fallos += 1
+                return None
+            self._docs.move_to_end(doc_id)
+            self.aciertos += 1
+            return doc
+
+    def guardar(self, doc):
+        """Guarda (o reemplaza) un documento con _id y _rev."""
+        if not doc.get('_id') or not doc.get('_rev'):
+            return
+        with self._lock:
+            self._docs[doc['_id']] = doc
+            self._docs.move_to_end(doc['_id'])
+            while len(self._docs) > self._capacidad:
+                self._docs.popitem(last=False)
+
+    def invalidar(self, doc_id):
+        with self._lock:
+            self._docs.pop(doc_id, None)
+
+    def estado(self):
+        """Información de diagnóstico de la caché."""
+        with self._lock:
+            return {'documentos': len(self._docs), 'aciertos': self.aciertos, 'fallos': self.fallos}
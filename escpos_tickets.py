@@ -0,0 +1,311 @@
+# escpos_tickets.py
+"""
+Tickets de 80 mm en ESC/POS para impresoras térmicas, como alternativa rápida al PDF.
+
+El encabezado (inicialización, página de códigos, logo rasterizado y datos del
+negocio) se arma una sola vez por proceso; cada ticket solo formatea sus líneas
+de texto con plantillas de ancho fijo, por lo que generar los bytes toma menos de
+un milisegundo. imprimir() los envía a un dispositivo local (/dev/usb/lp0), a
+una impresora de red (tcp://host:puerto) o a un directorio de cola. El PDF
+(couchdb_utils.generar_ticket_pdf y similares) se sigue generando para archivo.
+"""
+
+import functools
+import os
+import socket
+import textwrap
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# --- Papel de 80 mm (fuente A: 48 columnas, 576 puntos por línea) ---
+ANCHO_COLUMNAS = 48
+ANCHO_LOGO_PUNTOS = 320  # 40 mm a 8 puntos/mm, el mismo tamaño del logo en el PDF
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'assets', 'LOGO.png')
+
+# Página de códigos PC850 (incluye tildes y ñ)
+CODIFICACION = 'cp850'
+
+ENCABEZADO_NEGOCIO = [
+    'Elias, Salvador Alfonso',
+    'NIT: 0210-030563-104-1',
+    'IVA DL296',
+    'REG. 102166713',
+    'Giro: Restaurantes',
+    'Fecha Autorización: 11/12/2019',
+]
+
+# Segundos de espera al conectar con una impresora de red
+TIMEOUT_RED_SEGUNDOS = 3
+
+# Estados de un envío a la impresora (ColaImpresion)
+PENDIENTE = "pendiente"
+IMPRESO = "impreso"
+ERROR = "error"
+
+# Envíos terminados que se conservan en memoria para consultar su estado
+MAX_ENVIOS = 200
+
+# --- Comandos ESC/POS ---
+ESC = b'\x1b'
+GS = b'\x1d'
+INICIALIZAR = ESC + b'@'
+PAGINA_PC850 = ESC + b't\x02'
+ALINEAR_IZQUIERDA = ESC + b'a\x00'
+ALINEAR_CENTRO = ESC + b'a\x01'
+NEGRITA_SI = ESC + b'E\x01'
+NEGRITA_NO = ESC + b'E\x00'
+TAMANO_NORMAL = GS + b'!\x00'
+TAMANO_DOBLE = GS + b'!\x11'
+CORTAR = GS + b'V\x42\x03'  # Avanza 3 líneas y corta parcialmente
+
+SEPARADOR = '-' * ANCHO_COLUMNAS
+
+# Plantillas de fila (CANT. | PRODUCTO | PRECIO | TOTAL y columnas de los cierres)
+_ANCHO_PRODUCTO = 25
+_FILA_ITEM = '{:>4} {:<25}{:>9}{:>9}'
+_FILA_TOTAL = '{:>30}{:>18}'
+_FILA_CIERRE_Z = '{:^16}{:^16}{:>16}'
+_FILA_CIERRE_X = '{:^12}{:^12}{:^12}{:>12}'
+
+
+def _texto(valor):
+    return str(valor).encode(CODIFICACION, errors='ignore')
+
+
+def _linea(valor=''):
+    return _texto(valor) + b'\n'
+
+
+def rasterizar_logo(ruta=LOGO_PATH, ancho=ANCHO_LOGO_PUNTOS):
+    """Imagen como comando de raster ESC/POS (GS v 0) en blanco y negro; b'' si no se puede leer."""
+    try:
+        from PIL import Image  # Dependencia de fpdf2
+        imagen = Image.open(ruta)
+        if imagen.mode in ('RGBA', 'LA', 'P'):
+            imagen = imagen.convert('RGBA')
+            fondo = Image.new('RGBA', imagen.size, (255, 255, 255, 255))
+            fondo.alpha_composite(imagen)
+            imagen = fondo
+        alto = max(1, round(imagen.height * ancho / imagen.width))
+        imagen = imagen.convert('L').resize((ancho, alto))
+        # En el raster de ESC/POS un bit en 1 es un punto negro
+        bits = imagen.point(lambda p: 255 if p < 128 else 0).convert('1')
+    except Exception as e:
+        print(f"No se pudo rasterizar el logo '{ruta}': {e}")
+        return b''
+    bytes_por_fila = (ancho + 7) // 8
+    return (GS + b'v0\x00'
+            + bytes([bytes_por_fila % 256, bytes_por_fila // 256, alto % 256, alto // 256])
+            + bits.tobytes())
+
+
+@functools.lru_cache(maxsize=None)
+def encabezado():
+    """Inicialización, logo y datos del negocio (se arma una sola vez por proceso)."""
+    partes = [INICIALIZAR, PAGINA_PC850, ALINEAR_CENTRO, rasterizar_logo(), b'\n',
+              NEGRITA_SI, TAMANO_DOBLE, _linea('Tia Juana'), TAMANO_NORMAL, NEGRITA_NO]
+    partes += [_linea(texto) for texto in ENCABEZADO_NEGOCIO]
+    partes += [b'\n', ALINEAR_IZQUIERDA]
+    return b''.join(partes)
+
+
+def _pie(lineas, negrita=None):
+    partes = [b'\n', ALINEAR_CENTRO]
+    if negrita:
+        partes += [NEGRITA_SI, _linea(negrita), NEGRITA_NO]
+    partes += [_linea(texto) for texto in lineas]
+    partes += [ALINEAR_IZQUIERDA, CORTAR]
+    return b''.join(partes)
+
+
+def _ticket_items(titulo, ticket, orden, mesa, mesero, pie):
+    fecha = datetime.now(timezone.utc).astimezone().strftime('%d/%m/%Y %I:%M:%S %p')
+    lineas = [
+        f"{titulo} #{ticket.get('numero_orden', 'N/A')}",
+        f"Fecha: {fecha}",
+        f"Mesa: {mesa.get('descripcion', 'N/A')}",
+        f"Mesero: {mesero.get('nombre', 'N/A')}",
+        '',
+        _FILA_ITEM.format('CANT', 'PRODUCTO', 'PRECIO', 'TOTAL'),
+        SEPARADOR,
+    ]
+    items_activos = [item for item in orden.get('items', []) if not item.get('anulado', False)]
+    subtotal = 0
+    for item in items_activos:
+        cantidad = item.get('cantidad', 0)
+        precio = item.get('precio_unitario', 0)
+        subtotal += cantidad * precio
+        nombre = textwrap.wrap(str(item.get('nombre', 'N/A')), _ANCHO_PRODUCTO) or ['']
+        lineas.append(_FILA_ITEM.format(cantidad, nombre[0], f"${precio:.2f}", f"${cantidad * precio:.2f}"))
+        lineas += [' ' * 5 + resto for resto in nombre[1:]]
+    servicio = subtotal * 0.10
+    lineas += [
+        SEPARADOR,
+        _FILA_TOTAL.format('Subtotal:', f"${subtotal:.2f}"),
+        _FILA_TOTAL.format('Servicio (10%):', f"${servicio:.2f}"),
+    ]
+    total = _FILA_TOTAL.format('TOTAL:', f"${subtotal + servicio:.2f}")
+    return b''.join([encabezado()] + [_linea(l) for l in lineas] + [NEGRITA_SI, _linea(total), NEGRITA_NO]) + pie
+
+
+def ticket_cobro(ticket, orden, mesa, mesero):
+    """Ticket de cuenta pagada (equivalente a couchdb_utils.generar_ticket_pdf)."""
+    return _ticket_items('Ticket', ticket, orden, mesa, mesero,
+                         _pie(['GRACIAS POR TU COMPRA', 'REGRESA PRONTO'], negrita='!!!!! CANCELADO/PAGADO !!!!!'))
+
+
+def ticket_orden(ticket, orden, mesa, mesero):
+    """Ticket de orden enviada a cobro (equivalente a couchdb_utils.generar_orden_pdf)."""
+    return _ticket_items('Orden', ticket, orden, mesa, mesero,
+                         _pie(['GRACIAS POR TU COMPRA', 'REGRESA PRONTO'], negrita='!!!!! EN PROCESO/COBRO !!!!!'))
+
+
+def _fecha_pago(venta):
+    try:
+        return datetime.fromisoformat(venta.get('fecha_pago', '').replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _cierre(titulo, subtitulo, lineas_titulo, cabecera, filas, ventas, usuario, periodo, pie):
+    total_ventas = sum(venta.get('total', 0) for venta in ventas)
+    cuerpo = [ALINEAR_CENTRO, NEGRITA_SI, TAMANO_DOBLE, _linea(titulo), TAMANO_NORMAL, NEGRITA_NO]
+    cuerpo += [_linea(texto) for texto in lineas_titulo]
+    cuerpo += [_linea(SEPARADOR), NEGRITA_SI, _linea(subtitulo), NEGRITA_NO, ALINEAR_IZQUIERDA]
+    cuerpo += [_linea(fila) for fila in [cabecera] + filas] if filas else [_linea('No hay ventas')]
+    cuerpo += [_linea(SEPARADOR), NEGRITA_SI,
+               _linea(f'TOTAL TICKETS: {len(ventas)}'), _linea(f'TOTAL VENTAS: ${total_ventas:.2f}'),
+               NEGRITA_NO, ALINEAR_CENTRO, _linea(periodo), _linea(f'Usuario: {usuario or "N/A"}')]
+    return encabezado() + b''.join(cuerpo) + pie
+
+
+def ticket_cierre_z(ventas_del_dia, numero_cierre_z, fecha, usuario=None):
+    """Ticket de Cierre Z (equivalente al PDF de pages/cierre.py)."""
+    filas = []
+    for venta in ventas_del_dia:
+        pago = _fecha_pago(venta)
+        filas.append(_FILA_CIERRE_Z.format(
+            f"#{venta.get('numero_orden', 'N/A')}", pago.strftime('%H:%M') if pago else 'N/A', f"${venta.get('total', 0):.2f}"
+        ))
+    return _cierre(
+        'CIERRE Z', 'RESUMEN DE VENTAS DEL DIA',
+        [f'Ticket Z #{numero_cierre_z:04d}', f'Fecha: {fecha.strftime("%d/%m/%Y")}', f'Hora: {datetime.now().strftime("%H:%M:%S")}'],
+        _FILA_CIERRE_Z.format('Ticket', 'Hora', 'Total'), filas, ventas_del_dia, usuario, 'Periodo: 00:00 - 23:59',
+        _pie(['CIERRE DIARIO COMPLETO', 'Gracias por su preferencia']),
+    )
+
+
+def ticket_cierre_x(ventas_rango, numero_cierre_x, datetime_inicio, datetime_fin, usuario=None):
+    """Ticket de Cierre X (equivalente al PDF de pages/cierreX.py)."""
+    filas = []
+    for venta in sorted(ventas_rango, key=lambda v: v.get('fecha_pago', '')):
+        pago = _fecha_pago(venta)
+        filas.append(_FILA_CIERRE_X.format(
+            str(venta.get('numero_orden', 'N/A')), pago.strftime('%d/%m') if pago else 'N/A',
+            pago.strftime('%H:%M') if pago else 'N/A', f"${venta.get('total', 0):.2f}"
+        ))
+    horas_total = round((datetime_fin - datetime_inicio).total_seconds() / 3600, 1)
+    return _cierre(
+        'CIERRE X', 'REPORTE PARCIAL DE VENTAS',
+        [f'Ticket X #{numero_cierre_x:04d}', f'Del: {datetime_inicio.strftime("%d/%m/%Y %H:%M")}',
+         f'Al: {datetime_fin.strftime("%d/%m/%Y %H:%M")}', f'Generado: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}'],
+        _FILA_CIERRE_X.format('Tick', 'Fecha', 'Hora', 'Total'), filas, ventas_rango, usuario, f'Periodo: {horas_total} hora(s)',
+        _pie(['REPORTE PARCIAL', 'Entrega de caja']),
+    )
+
+
+def imprimir(datos, destino):
+    """
+    Envía los bytes ESC/POS al destino y retorna la ruta o dirección usada:
+    - 'tcp://host:puerto': impresora de red (puerto RAW, normalmente 9100)
+    - un directorio: se deja un archivo .bin en la cola para que otro proceso lo imprima
+    - cualquier otra ruta: dispositivo o archivo local (p. ej. /dev/usb/lp0), escrito directamente
+    """
+    if not destino:
+        raise ValueError("No hay impresora térmica configurada")
+    if destino.startswith('tcp://'):
+        host, _, puerto = destino[len('tcp://'):].partition(':')
+        with socket.create_connection((host, int(puerto or 9100)), timeout=TIMEOUT_RED_SEGUNDOS) as conexion:
+            conexion.sendall(datos)
+        return destino
+    if os.path.isdir(destino):
+        nombre = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}.bin"
+        temporal = os.path.join(destino, f".{nombre}.tmp")
+        with open(temporal, 'wb') as archivo:
+            archivo.write(datos)
+        # El archivo aparece completo en la cola (el renombrado es atómico)
+        ruta = os.path.join(destino, nombre)
+        os.replace(temporal, ruta)
+        return ruta
+    with open(destino, 'wb') as dispositivo:
+        dispositivo.write(datos)
+    return destino
+
+
+class ColaImpresion:
+    """
+    Envíos a la impresora térmica atendidos por un solo hilo, uno detrás de otro: dos tickets
+    nunca abren a la vez el dispositivo o la conexión de red ni mezclan sus bytes.
+    enviar() retorna un identificador con el que la página consulta estado() y error().
+    """
+
+    def __init__(self, max_envios=MAX_ENVIOS):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="impresora")
+        self._max_envios = max_envios
+        self._envios = OrderedDict()  # id -> {'estado', 'destino', 'ruta', 'error', 'futuro'}
+        self._lock = threading.Lock()
+        self.ultimo_error = None
+
+    def enviar(self, datos, destino):
+        """Encola los bytes ESC/POS para `destino` (ver imprimir()) y retorna el identificador del envío."""
+        envio_id = uuid.uuid4().hex
+        with self._lock:
+            self._envios[envio_id] = {'estado': PENDIENTE, 'destino': destino, 'ruta': None, 'error': None}
+            while len(self._envios) > self._max_envios:
+                self._envios.popitem(last=False)
+        futuro = self._executor.submit(self._imprimir, envio_id, datos, destino)
+        self._actualizar(envio_id, futuro=futuro)
+        return envio_id
+
+    def esperar(self, envio_id, timeout=TIMEOUT_RED_SEGUNDOS * 2):
+        """Espera a que termine el envío (hasta `timeout` segundos) y retorna su estado."""
+        with self._lock:
+            futuro = (self._envios.get(envio_id) or {}).get('futuro')
+        if futuro is not None:
+            try:
+                futuro.result(timeout=timeout)
+            except Exception:
+                pass
+        return self.estado(envio_id)
+
+    def estado(self, envio_id):
+        """PENDIENTE, IMPRESO o ERROR (un envío que ya no está en memoria se da por impreso)."""
+        with self._lock:
+            envio = self._envios.get(envio_id)
+        return envio['estado'] if envio else IMPRESO
+
+    def error(self, envio_id):
+        """Mensaje de error del envío (None si no falló)."""
+        with self._lock:
+            envio = self._envios.get(envio_id)
+        return envio['error'] if envio else None
+
+    def _imprimir(self, envio_id, datos, destino):
+        try:
+            ruta = imprimir(datos, destino)
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"Error al imprimir en '{destino}': {e}")
+            self._actualizar(envio_id, estado=ERROR, error=str(e))
+            return
+        self._actualizar(envio_id, estado=IMPRESO, ruta=ruta)
+
+    def _actualizar(self, envio_id, **campos):
+        with self._lock:
+            envio = self._envios.get(envio_id)
+            if envio is not None:
+                envio.update(campos)
@@ -54,8 +54,11 @@ def convert_to_local_time(utc_datetime_str):
 
 # --- Funciones de Procesamiento de Datos ---
 
+# Campos de las órdenes pagadas que usan las estadísticas y el detalle de ventas
+ORDER_FIELDS = ['numero_orden', 'total', 'items', 'fecha_pago', 'fecha_creacion', 'comentarios']
+
 def get_data_for_period(data_list, date_field, start_date, end_date):
-    """Filtra una lista de documentos por un rango de fechas."""
+    """Filtra una lista (o iterador) de documentos por un rango de fechas."""
     filtered_data = []
     for doc in data_list:
         date_str = doc.get(date_field)
@@ -305,15 +308,17 @@ if 'usuario' in st.session_state:
         st.info(f"Mostrando datos desde **{start_date.strftime('%d/%m/%Y')}** hasta **{end_date.strftime('%d/%m/%Y')}**")
         st.markdown("---")
 
-        # --- Cargar todos los datos ---
-        all_paid_orders = couchdb_utils.get_all_paid_orders(db)
+        # --- Recorrer los datos por páginas y filtrar por el período seleccionado ---
+        # Solo se conservan en memoria los documentos del período, no el histórico completo
+        all_paid_orders = couchdb_utils.get_all_paid_orders(db, fields=ORDER_FIELDS)
         all_purchases = couchdb_utils.get_all_purchases(db)
         all_inventory_records = couchdb_utils.get_all_inventory_records(db)
 
-        # --- Filtrar datos por el período seleccionado ---
         filtered_sales = get_data_for_period(all_paid_orders, 'fecha_creacion', start_date, end_date)
         filtered_purchases = get_data_for_period(all_purchases, 'fecha_compra', start_date, end_date)
         filtered_inventory = get_data_for_period(all_inventory_records, 'fecha', start_date, end_date)
+        # Ordenar por fecha para asegurar un procesamiento cronológico correcto en las estadísticas
+        filtered_inventory.sort(key=lambda x: datetime.fromisoformat(x['fecha']))
 
         # --- Calcular Estadísticas ---
         sales_stats = calculate_sales_stats(filtered_sales)
@@ -0,0 +1,238 @@
+# inventory_ledger.py
+"""
+Libro de inventario: los movimientos de la partición 'inventario' son la única
+fuente del stock de cada ingrediente.
+
+Los movimientos solo se agregan (nunca se modifica un contador compartido), así
+que dos ventas simultáneas del mismo ingrediente no compiten por un documento.
+El saldo de cada ingrediente se mantiene en memoria, compartido por todas las
+sesiones del proceso, a partir de la última foto de saldos (partición
+'inventario_saldos') más los movimientos posteriores, que llegan por el feed
+'_changes'. Cada cierto número de movimientos o de tiempo se guarda una nueva
+foto, de modo que al arrancar solo se leen los movimientos recientes.
+
+Se obtiene con couchdb_utils.get_inventory_ledger(db).
+"""
+
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import changes_feed
+
+MOVIMIENTOS_PARTITION_KEY = "inventario"
+SALDOS_PARTITION_KEY = "inventario_saldos"
+
+# Se guarda una foto de saldos cada tantos movimientos aplicados...
+FOTO_CADA_MOVIMIENTOS = 500
+# ...o cada tantos segundos si hubo movimientos desde la última
+FOTO_CADA_SEGUNDOS = 3600
+
+# Espera máxima (ms) al leer los movimientos posteriores a la foto al arrancar
+ESPERA_CARGA_MS = 1
+
+# _id de los últimos movimientos aplicados que se recuerdan para no sumarlos dos veces
+# (registrar() puede llegar después de que el feed ya entregó el mismo movimiento)
+APLICADOS_MAX = 5000
+
+# Vista _sum de los movimientos por [ingrediente_id, fecha local, tipo] (db_bootstrap.py)
+VISTA_STOCK = f'_partition/{MOVIMIENTOS_PARTITION_KEY}/_design/inventario/_view/stock'
+
+
+def afecta_stock(movimiento):
+    """True si el movimiento suma al saldo (los marcados con afecta_stock=False son solo informativos)."""
+    return (movimiento.get('type') == MOVIMIENTOS_PARTITION_KEY
+            and bool(movimiento.get('ingrediente_id'))
+            and movimiento.get('afecta_stock', True) is not False)
+
+
+def nuevo_movimiento(ingrediente_id, cantidad, tipo, usuario, motivo=None, **campos):
+    """Documento de movimiento de inventario. cantidad lleva signo (salidas negativas)."""
+    movimiento = {
+        "_id": f"{MOVIMIENTOS_PARTITION_KEY}:{uuid.uuid4()}",
+        "type": MOVIMIENTOS_PARTITION_KEY,
+        "ingrediente_id": ingrediente_id,
+        "tipo": tipo,
+        "cantidad": cantidad,
+        "usuario": usuario,
+        "fecha_creacion": datetime.now(timezone.utc).isoformat(),
+    }
+    if motivo:
+        movimiento["motivo"] = motivo
+    movimiento.update(campos)
+    return movimiento
+
+
+def saldos_desde_vista(db, ingrediente_ids=None):
+    """
+    Stock {ingrediente_id: cantidad} calculado por CouchDB con la vista _sum (una sola consulta
+    de una fila por ingrediente), de todos los ingredientes o solo de los indicados.
+    No depende del libro en memoria.
+    """
+    saldos = {row.key[0]: row.value for row in db.view(VISTA_STOCK, group_level=1)}
+    if ingrediente_ids is None:
+        return saldos
+    return {ingrediente_id: saldos.get(ingrediente_id, 0) for ingrediente_id in ingrediente_ids}
+
+
+class LibroInventario:
+    """
+    Saldos {ingrediente_id: cantidad} proyectados desde los movimientos de inventario.
+    saldo() y saldos() no consultan CouchDB. Los saldos pueden quedar negativos si se
+    vendió más de lo registrado; quien los muestra decide cómo tratarlos.
+    """
+
+    def __init__(self, db, foto_cada=FOTO_CADA_MOVIMIENTOS, foto_segundos=FOTO_CADA_SEGUNDOS):
+        self._db = db
+        self._lock = threading.RLock()
+        self._saldos = {}
+        self._locales = {}  # movimientos registrados por este proceso que el feed aún no entregó
+        self._aplicados = {}  # _id de los movimientos ya sumados (acotado a APLICADOS_MAX, en orden de llegada)
+        self._foto_cada = foto_cada
+        self._foto_segundos = foto_segundos
+        self._desde_foto = 0
+        self._hora_foto = time.monotonic()
+        self._suscriptores = []
+        self.ultimo_error = None
+
+        foto = self._ultima_foto()
+        since = foto['seq'] if foto else 0
+        if foto:
+            self._saldos = dict(foto.get('saldos', {}))
+
+        # Movimientos posteriores a la foto (todos, si todavía no hay ninguna)
+        resultados, since = changes_feed.leer_cambios(
+            changes_feed.abrir_conexion_feed(db), since, [MOVIMIENTOS_PARTITION_KEY], timeout_ms=ESPERA_CARGA_MS
+        )
+        self._aplicar(resultados)
+        if foto is None or self._desde_foto:
+            self._guardar_foto(since)
+
+        self._feed = changes_feed.SuscriptorCambios(
+            db, [MOVIMIENTOS_PARTITION_KEY], since, self._aplicar_cambios, nombre="libro-inventario"
+        )
+        self._feed.start()
+
+    def saldo(self, ingrediente_id):
+        """Stock actual del ingrediente (0 si no tiene movimientos)."""
+        with self._lock:
+            return self._saldos.get(ingrediente_id, 0)
+
+    def saldos(self, ingrediente_ids=None):
+        """Copia de {ingrediente_id: stock}, de todos o solo de los ingredientes indicados."""
+        with self._lock:
+            if ingrediente_ids is None:
+                return dict(self._saldos)
+            return {ingrediente_id: self._saldos.get(ingrediente_id, 0) for ingrediente_id in ingrediente_ids}
+
+    def registrar(self, movimientos):
+        """
+        Aplica de inmediato movimientos recién guardados por este proceso (sin esperar al feed).
+        Los que el feed ya entregó se ignoran, y cuando el feed entregue los demás no se vuelven a sumar.
+        """
+        tocados = set()
+        with self._lock:
+            for movimiento in movimientos:
+                if not afecta_stock(movimiento) or movimiento['_id'] in self._aplicados:
+                    continue
+                self._locales[movimiento['_id']] = (movimiento['ingrediente_id'], float(movimiento.get('cantidad', 0)))
+                self._marcar_aplicado(movimiento['_id'])
+                self._sumar(movimiento['ingrediente_id'], float(movimiento.get('cantidad', 0)))
+                tocados.add(movimiento['ingrediente_id'])
+        self._avisar(tocados)
+
+    def al_cambiar(self, callback):
+        """
+        Registra `callback(ingrediente_ids)` para después de cada lote de movimientos aplicado.
+        Corre en el hilo del feed o en el que llamó a registrar(): no debe usar funciones de Streamlit.
+        """
+        with self._lock:
+            self._suscriptores.append(callback)
+
+    def estado(self):
+        """Información de diagnóstico del libro."""
+        with self._lock:
+            return {
+                'ingredientes': len(self._saldos),
+                'movimientos_desde_foto': self._desde_foto,
+                'pendientes_feed': len(self._locales),
+                'since': self._feed.since,
+                'feed_activo': self._feed.is_alive(),
+                'ultimo_error': self.ultimo_error or self._feed.ultimo_error,
+            }
+
+    def _sumar(self, ingrediente_id, cantidad):
+        self._saldos[ingrediente_id] = self._saldos.get(ingrediente_id, 0) + cantidad
+        self._desde_foto += 1
+
+    def _marcar_aplicado(self, movimiento_id):
+        self._aplicados[movimiento_id] = True
+        while len(self._aplicados) > APLICADOS_MAX:
+            del self._aplicados[next(iter(self._aplicados))]
+
+    def _avisar(self, ingrediente_ids):
+        if not ingrediente_ids:
+            return
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for callback in suscriptores:
+            try:
+                callback(set(ingrediente_ids))
+            except Exception as e:
+                print(f"Error en suscriptor del libro de inventario: {e}")
+
+    def _aplicar(self, resultados):
+        """Suma los movimientos entregados por el feed; retorna los ingredientes afectados."""
+        tocados = set()
+        with self._lock:
+            for cambio in resultados:
+                movimiento = cambio.get('doc')
+                if cambio.get('deleted') or movimiento is None:
+                    # El libro es de solo agregar: una corrección se registra como otro movimiento
+                    continue
+                if self._locales.pop(cambio['id'], None) is not None or cambio['id'] in self._aplicados:
+                    # Ya se sumó con registrar() (o el feed lo repitió)
+                    continue
+                if afecta_stock(movimiento):
+                    self._marcar_aplicado(cambio['id'])
+                    self._sumar(movimiento['ingrediente_id'], float(movimiento.get('cantidad', 0)))
+                    tocados.add(movimiento['ingrediente_id'])
+        return tocados
+
+    def _aplicar_cambios(self, resultados):
+        # El feed actualiza `since` después de cada lote: al recibir uno nuevo, los saldos
+        # reflejan exactamente hasta feed.since, que es el punto de partida de la foto
+        if self._desde_foto >= self._foto_cada or (
+            self._desde_foto and time.monotonic() - self._hora_foto >= self._foto_segundos
+        ):
+            self._guardar_foto(self._feed.since)
+        self._avisar(self._aplicar(resultados))
+
+    def _ultima_foto(self):
+        filas = list(self._db.view(
+            f'_partition/{SALDOS_PARTITION_KEY}/_all_docs', descending=True, limit=1, include_docs=True
+        ))
+        return filas[0].doc if filas else None
+
+    def _guardar_foto(self, seq):
+        with self._lock:
+            saldos = dict(self._saldos)
+            # Los movimientos locales que el feed aún no entregó llegarán después de `seq`
+            for ingrediente_id, cantidad in self._locales.values():
+                saldos[ingrediente_id] = saldos.get(ingrediente_id, 0) - cantidad
+            movimientos = self._desde_foto
+            self._desde_foto = 0
+            self._hora_foto = time.monotonic()
+        ahora = datetime.now(timezone.utc)
+        try:
+            self._db.save({
+                "_id": f"{SALDOS_PARTITION_KEY}:{ahora.strftime('%Y%m%dT%H%M%S%fZ')}",
+                "type": SALDOS_PARTITION_KEY,
+                "seq": seq,
+                "saldos": saldos,
+                "movimientos_aplicados": movimientos,
+                "fecha_creacion": ahora.isoformat(),
+            })
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"Error al guardar la foto de saldos de inventario: {e}")
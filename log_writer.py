@@ -0,0 +1,160 @@
+# log_writer.py
+"""
+Escritura en segundo plano de los registros de actividad (partición 'logs').
+
+couchdb_utils.log_action() solo encola el documento; un hilo del proceso vacía
+la cola cada INTERVALO_SEGUNDOS (o al juntar TAMANO_LOTE registros) con un único
+'_bulk_docs', de modo que ninguna acción del usuario espera a CouchDB para
+registrarse. Si CouchDB no responde, el lote se conserva y se reintenta más tarde;
+un documento que CouchDB rechaza se reintenta junto con los registros nuevos
+hasta MAX_INTENTOS_DOCUMENTO veces y después se descarta, para que un registro
+inválido no detenga a los demás.
+"""
+
+import atexit
+import queue
+import threading
+import couchdb
+
+# Tiempo máximo que un registro espera en la cola antes de enviarse
+INTERVALO_SEGUNDOS = 0.3
+
+# Registros por petición '_bulk_docs'
+TAMANO_LOTE = 100
+
+# Registros que pueden esperar en memoria (cola + lote pendiente de reintento)
+CAPACIDAD = 5000
+
+# Espera máxima al encolar con la cola llena antes de descartar el registro
+ESPERA_ENCOLAR_SEGUNDOS = 0.05
+
+# Espera entre reintentos cuando falla el envío de un lote
+REINTENTO_SEGUNDOS = 5
+
+# Intentos de un documento rechazado por CouchDB (error distinto de conflicto) antes de descartarlo
+MAX_INTENTOS_DOCUMENTO = 3
+
+# Tiempo máximo para vaciar la cola al cerrar el proceso
+ESPERA_CIERRE_SEGUNDOS = 5
+
+
+class EscritorLogs(threading.Thread):
+    """
+    Hilo que guarda por lotes los documentos encolados con encolar().
+    Los registros se descartan (y se cuentan en 'descartados') si la cola se llena, es decir,
+    si CouchDB lleva caído el tiempo suficiente para acumular CAPACIDAD registros, o si CouchDB
+    rechaza el documento MAX_INTENTOS_DOCUMENTO veces (se cuentan también en 'rechazados').
+    """
+
+    def __init__(self, db, intervalo=INTERVALO_SEGUNDOS, tamano_lote=TAMANO_LOTE, capacidad=CAPACIDAD):
+        super().__init__(name="log-writer", daemon=True)
+        self._db = db
+        self._intervalo = intervalo
+        self._tamano_lote = tamano_lote
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._pendientes = []  # Lote que no se pudo enviar (CouchDB no respondió) y se reintentará
+        self._reintentos = []  # Documentos rechazados que se envían de nuevo con el siguiente lote
+        self._intentos = {}  # id(doc) -> intentos rechazados
+        self._detener = threading.Event()
+        self._vaciado = threading.Condition()
+        self.escritos = 0
+        self.descartados = 0
+        self.rechazados = 0
+        self.ultimo_error = None
+        atexit.register(self.cerrar)
+
+    def encolar(self, doc):
+        """Agrega un documento a la cola sin esperar a CouchDB. Retorna False si se descartó."""
+        try:
+            self._cola.put(doc, timeout=ESPERA_ENCOLAR_SEGUNDOS)
+            return True
+        except queue.Full:
+            self.descartados += 1
+            print(f"Cola de logs llena: se descartó el registro '{doc.get('descripcion', '')}'")
+            return False
+
+    def vaciar(self, timeout=ESPERA_CIERRE_SEGUNDOS):
+        """Espera (como máximo timeout segundos) a que se envíe todo lo encolado. Retorna True si quedó vacío."""
+        with self._vaciado:
+            return self._vaciado.wait_for(self._sin_pendientes, timeout)
+
+    def cerrar(self):
+        """Vacía la cola y detiene el hilo (se llama automáticamente al salir del proceso)."""
+        if self.is_alive():
+            self.vaciar()
+        self._detener.set()
+
+    def estado(self):
+        """Información de diagnóstico del escritor."""
+        return {
+            'en_cola': self._cola.qsize() + len(self._pendientes) + len(self._reintentos),
+            'escritos': self.escritos,
+            'descartados': self.descartados,
+            'rechazados': self.rechazados,
+            'ultimo_error': self.ultimo_error,
+        }
+
+    def _sin_pendientes(self):
+        return self._cola.unfinished_tasks == 0 and not self._pendientes and not self._reintentos
+
+    def _tomar_lote(self, maximo):
+        lote = []
+        try:
+            lote.append(self._cola.get(timeout=self._intervalo))
+            while len(lote) < maximo:
+                lote.append(self._cola.get_nowait())
+        except queue.Empty:
+            pass
+        return lote
+
+    def _enviar(self, lote):
+        """
+        Guarda el lote; retorna los documentos rechazados que aún pueden reintentarse.
+        Los que agotaron MAX_INTENTOS_DOCUMENTO se descartan.
+        """
+        reintentar = []
+        for doc, (ok, _, error) in zip(lote, self._db.update(lote)):
+            if ok or isinstance(error, couchdb.http.ResourceConflict):
+                # Un conflicto indica que el registro ya se guardó en un intento anterior
+                self.escritos += 1
+                self._intentos.pop(id(doc), None)
+                continue
+            intentos = self._intentos.get(id(doc), 0) + 1
+            self.ultimo_error = str(error)
+            if intentos >= MAX_INTENTOS_DOCUMENTO:
+                self._intentos.pop(id(doc), None)
+                self.rechazados += 1
+                self.descartados += 1
+                print(f"Registro de actividad rechazado por CouchDB, se descarta ({error}): '{doc.get('descripcion', '')}'")
+            else:
+                self._intentos[id(doc)] = intentos
+                reintentar.append(doc)
+        return reintentar
+
+    def run(self):
+        while not self._detener.is_set():
+            if self._pendientes:
+                # CouchDB no respondió: se reintenta el mismo lote sin tomar registros nuevos
+                lote, tomados = self._pendientes, 0
+            else:
+                nuevos = self._tomar_lote(max(self._tamano_lote - len(self._reintentos), 1))
+                lote, tomados = self._reintentos + nuevos, len(nuevos)
+                self._reintentos = []
+            if not lote:
+                continue
+            try:
+                self._reintentos = self._enviar(lote)
+                self._pendientes = []
+                if not self._reintentos:
+                    self.ultimo_error = None
+            except Exception as e:
+                self._pendientes = lote
+                self.ultimo_error = str(e)
+                print(f"Error al guardar registros de actividad: {e}")
+            finally:
+                for _ in range(tomados):
+                    self._cola.task_done()
+            with self._vaciado:
+                self._vaciado.notify_all()
+            if self._pendientes:
+                self._detener.wait(REINTENTO_SEGUNDOS)
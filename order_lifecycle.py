@@ -0,0 +1,134 @@
+# order_lifecycle.py
+"""
+Ciclo de vida de las órdenes: estados declarados, eventos permitidos y el
+registro de cada transición en la propia orden.
+
+Toda página que cambie el estado de una orden lo hace con un evento
+(transicion() o aplicar_transicion()), que valida el estado de origen, escribe el
+nuevo 'estado' y agrega {'evento', 'desde', 'hacia', 'fecha', 'usuario'} a la
+lista 'transiciones'. Con esa lista, tiempos_en_estado() calcula cuánto estuvo la
+orden en cada estado sin consultas adicionales.
+"""
+
+import random
+import time
+from datetime import datetime, timezone
+import couchdb
+
+# --- Estados ---
+PENDIENTE = "pendiente"            # Creada por el mesero; cocina y bar la preparan
+ENVIADO_COBRO = "enviado_cobro"    # El mesero la envió a caja (ticket pendiente de pago)
+EN_COBRO = "en_cobro"              # Ticket generado desde caja
+PAGADA = "pagada"
+ANULADA = "anulada"
+
+ESTADOS = [PENDIENTE, ENVIADO_COBRO, EN_COBRO, PAGADA, ANULADA]
+ESTADOS_ABIERTOS = [PENDIENTE, ENVIADO_COBRO, EN_COBRO]
+ESTADOS_FINALES = [PAGADA, ANULADA]
+
+ESTADO_INICIAL = PENDIENTE
+
+# --- Eventos: estados de origen permitidos -> estado de destino ---
+TRANSICIONES = {
+    "enviar_cobro": ([PENDIENTE], ENVIADO_COBRO),
+    "generar_ticket": ([PENDIENTE, ENVIADO_COBRO], EN_COBRO),
+    "pagar": ([PENDIENTE, ENVIADO_COBRO, EN_COBRO], PAGADA),
+    "anular": ([PENDIENTE, ENVIADO_COBRO, EN_COBRO], ANULADA),
+}
+
+# Reintentos de transicion() ante conflictos de _rev
+MAX_REINTENTOS = 5
+
+
+class TransicionInvalida(ValueError):
+    """El evento no está permitido desde el estado actual de la orden."""
+
+
+def _ahora():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def campos_orden_nueva(usuario=None):
+    """Campos de estado de una orden recién creada (estado inicial y su transición de creación)."""
+    return {
+        "estado": ESTADO_INICIAL,
+        "transiciones": [{
+            "evento": "crear",
+            "desde": None,
+            "hacia": ESTADO_INICIAL,
+            "fecha": _ahora(),
+            "usuario": usuario,
+        }],
+    }
+
+
+def puede(orden, evento):
+    """True si el evento está permitido desde el estado actual de la orden."""
+    origen, _ = TRANSICIONES.get(evento, ([], None))
+    return orden.get('estado') in origen
+
+
+def aplicar_transicion(orden, evento, usuario=None, campos=None):
+    """
+    Aplica el evento a la orden (modificándola) y la retorna; no la guarda.
+    campos: valores adicionales que se escriben en la orden junto con el cambio de estado.
+    Lanza TransicionInvalida si el evento no existe o no se permite desde el estado actual.
+    """
+    if evento not in TRANSICIONES:
+        raise TransicionInvalida(f"Evento de orden desconocido: '{evento}'")
+    origen, destino = TRANSICIONES[evento]
+    estado_actual = orden.get('estado')
+    if estado_actual not in origen:
+        raise TransicionInvalida(
+            f"La orden #{orden.get('numero_orden', '?')} está '{estado_actual}': no se puede aplicar '{evento}'"
+        )
+
+    fecha = _ahora()
+    orden.update(campos or {})
+    orden['estado'] = destino
+    orden['fecha_estado'] = fecha
+    orden.setdefault('transiciones', []).append({
+        "evento": evento,
+        "desde": estado_actual,
+        "hacia": destino,
+        "fecha": fecha,
+        "usuario": usuario,
+    })
+    return orden
+
+
+def transicion(db, orden_id, evento, usuario=None, campos=None, max_reintentos=MAX_REINTENTOS):
+    """
+    Lee la orden, aplica el evento y la guarda. Ante un conflicto de _rev (otra terminal
+    modificó la orden) vuelve a leerla y reintenta, validando otra vez el estado.
+    Retorna la orden guardada. Lanza TransicionInvalida o las excepciones de CouchDB.
+    """
+    for intento in range(max_reintentos):
+        orden = db.get(orden_id)
+        if orden is None:
+            raise TransicionInvalida(f"No existe la orden '{orden_id}'")
+        aplicar_transicion(orden, evento, usuario, campos)
+        try:
+            db.save(orden)
+            return orden
+        except couchdb.http.ResourceConflict:
+            time.sleep(random.uniform(0, 0.02 * (intento + 1)))
+    raise RuntimeError(f"No se pudo aplicar '{evento}' a la orden '{orden_id}' tras {max_reintentos} intentos")
+
+
+def tiempos_en_estado(orden, hasta=None):
+    """
+    Segundos que la orden pasó en cada estado según su lista de transiciones.
+    El estado actual (si no es final) se cuenta hasta `hasta` (por defecto, ahora).
+    """
+    transiciones = orden.get('transiciones', [])
+    tiempos = {}
+    for actual, siguiente in zip(transiciones, transiciones[1:]):
+        inicio = datetime.fromisoformat(actual['fecha'])
+        fin = datetime.fromisoformat(siguiente['fecha'])
+        tiempos[actual['hacia']] = tiempos.get(actual['hacia'], 0) + (fin - inicio).total_seconds()
+    if transiciones and transiciones[-1]['hacia'] not in ESTADOS_FINALES:
+        ultimo = transiciones[-1]
+        fin = hasta or datetime.now(timezone.utc)
+        tiempos[ultimo['hacia']] = tiempos.get(ultimo['hacia'], 0) + (fin - datetime.fromisoformat(ultimo['fecha'])).total_seconds()
+    return tiempos
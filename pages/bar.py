@@ -2,6 +2,7 @@
 import streamlit as st
 from datetime import datetime, timezone
 import couchdb_utils
+import dispatch_events
 import os
 import time
 
@@ -111,63 +112,6 @@ if 'usuario' in st.session_state:
         if current_time - st.session_state.bar_last_refresh >= 60:
             st.session_state.bar_last_refresh = current_time
             st.rerun()
-        # Función para obtener bebidas de los platos
-        def obtener_bebidas():
-            platos = couchdb_utils.get_documents_by_partition(db, "platos")
-            menus = couchdb_utils.get_documents_by_partition(db, "menu")
-            
-            # Encontrar el menú "bar"
-            menu_bar = None
-            for menu in menus:
-                if menu.get('descripcion', '').lower() == 'bar':
-                    menu_bar = menu
-                    break
-            
-            bebidas = []
-            
-            for plato in platos:
-                nombre = plato.get('descripcion', '')
-                categoria = plato.get('categoria', '')
-                menu_id = plato.get('menu_id', '')
-                
-                # Métodos de identificación (en orden de prioridad):
-                # 1. Por menú "bar" (PRIORITARIO)
-                es_bebida_menu = False
-                if menu_bar and menu_id == menu_bar.get('_id'):
-                    es_bebida_menu = True
-                
-                # 2. Por categoría específica
-                es_bebida_categoria = any(cat in categoria.lower() for cat in ['bar', 'bebida', 'bebidas', 'drink'])
-                
-                # 3. Por palabras clave (fallback)
-                keywords_bebidas = [
-                    'bebida', 'jugo', 'agua', 'gaseosa', 'refresco', 'cocktail', 
-                    'cerveza', 'licor', 'café', 'té', 'smoothie', 'cola', 'pepsi',
-                    'cuba', 'libre', 'mojito', 'piña', 'colada', 'margarita',
-                    'daiquiri', 'whisky', 'ron', 'vodka', 'tequila', 'ginebra',
-                    'sangria', 'vino', 'champagne', 'limonada', 'naranjada',
-                    'soda', 'sprite', 'fanta', 'cocacola', 'energética', 'isotónica',
-                    'pilsener', 'pilsen', 'beer', 'lager'
-                ]
-                es_bebida_keyword = any(keyword in nombre.lower() for keyword in keywords_bebidas)
-                
-                # Es bebida si cumple cualquiera de los criterios
-                es_bebida = es_bebida_menu or es_bebida_categoria or es_bebida_keyword
-                
-                if es_bebida:
-                    bebidas.append(plato['_id'])
-                    
-                    # Determinar método de detección
-                    if es_bebida_menu:
-                        metodo = 'Menú Bar'
-                    elif es_bebida_categoria:
-                        metodo = 'Categoría'
-                    else:
-                        metodo = 'Palabra clave'
-                    
-            
-            return bebidas
-        
         # Función para calcular tiempo transcurrido
         def calcular_tiempo_transcurrido(fecha_creacion):
             try:
@@ -188,24 +132,16 @@ if 'usuario' in st.session_state:
         # Función para despachar bebida
         def despachar_bebida(orden_id, item_id):
             try:
-                # Obtener la orden actual
-                orden = db.get(orden_id)
+                # La orden se lee de la vista en memoria; el despacho se guarda como un evento propio
+                # (partición 'despachos'), sin reescribir la orden ni chocar con otras ediciones
+                orden = couchdb_utils.get_active_order(db, orden_id)
                 item_despachado = None
                 
-                # Buscar el item específico y marcarlo como despachado
-                for idx, item in enumerate(orden.get('items', [])):
-                    # Excluir productos anulados
+                # Buscar el item específico (excluyendo productos anulados)
+                for idx, item in enumerate((orden or {}).get('items', [])):
                     if item.get('anulado', False):
                         continue
-                        
-                    # Crear ID temporal si no existe
-                    temp_id = item.get('id') or f"{orden_id}_{idx}"
-                    
-                    if temp_id == item_id:
-                        item['despachado_bar'] = True
-                        item['fecha_despacho_bar'] = datetime.now(timezone.utc).isoformat()
-                        item['usuario_despacho_bar'] = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
-                        item['id'] = temp_id  # Asegurar que tenga ID
+                    if dispatch_events.id_item(orden, idx, item) == item_id:
                         item_despachado = item
                         break
                 
@@ -213,11 +149,14 @@ if 'usuario' in st.session_state:
                     st.error(f"No se encontró el item con ID: {item_id}")
                     return False
                 
-                # Guardar la orden actualizada
-                db.save(orden)
+                logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
+                couchdb_utils.registrar_despacho_item(
+                    db, orden_id, item_id, "bar", logged_in_user,
+                    plato_id=item_despachado.get('plato_id'), fecha_orden=orden.get('fecha_creacion'),
+                    fecha_agregado=item_despachado.get('fecha_agregado')
+                )
                 
                 # Log de la acción
-                logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
                 couchdb_utils.log_action(
                     db, 
                     logged_in_user, 
@@ -233,12 +172,11 @@ if 'usuario' in st.session_state:
         st.title("🍹 Sistema de Despacho de Bar")
         st.markdown("---")
         
-        # Obtener todas las órdenes pendientes y en cobro
-        ordenes = couchdb_utils.get_documents_by_partition(db, "ordenes")
-        ordenes_activas = [orden for orden in ordenes if orden.get('estado') in ['pendiente', 'en_cobro']]
+        # Obtener todas las órdenes pendientes y en cobro (vista compartida en memoria)
+        ordenes_activas = couchdb_utils.get_active_orders(db, estados=['pendiente', 'en_cobro'], estacion="bar")
         
-        # Obtener lista de IDs de bebidas
-        bebidas_ids = obtener_bebidas()
+        # IDs de platos que se despachan en bar (índice de ruteo precalculado)
+        bebidas_ids = couchdb_utils.get_station_dish_ids(db, "bar")
         
         # Filtrar órdenes que tienen bebidas (pendientes y despachadas)
         ordenes_con_bebidas = []
@@ -254,9 +192,8 @@ if 'usuario' in st.session_state:
                     continue
                 
                 if item.get('plato_id') in bebidas_ids:
-                    # Asegurar que el item tenga un ID único
-                    if not item.get('id'):
-                        item['id'] = f"{orden['_id']}_{idx}"
+                    # ID estable del item (posicional solo en órdenes anteriores sin 'id')
+                    item['id'] = dispatch_events.id_item(orden, idx, item)
                     
                     if item.get('despachado_bar', False):
                         bebidas_despachadas.append(item)
@@ -318,13 +255,12 @@ if 'usuario' in st.session_state:
             
             for orden in ordenes_con_bebidas:
                 for idx, bebida in enumerate(orden['bebidas_pendientes']):
-                    # Crear un ID único para el item
-                    item_id = bebida.get('id') or f"{orden['_id']}_{idx}"
-                    bebida['id'] = item_id  # Asegurar que tenga ID
+                    # ID asignado al clasificar los items de la orden
+                    item_id = bebida['id']
                     current_items.add(item_id)
                     
-                    # Calcular tiempo para esta bebida específica
-                    tiempo_str, minutos = calcular_tiempo_transcurrido(orden.get('fecha_creacion', ''))
+                    # Calcular tiempo para esta bebida específica (desde que se agregó a la orden; fechas ISO UTC)
+                    tiempo_str, minutos = calcular_tiempo_transcurrido(max(orden.get('fecha_creacion', ''), bebida.get('fecha_agregado', '')))
                     es_urgente = minutos > 15
                     
                     # Extraer número de mesa
@@ -1,10 +1,10 @@
 # pages/cierre.py
 import streamlit as st
 import couchdb_utils
+import escpos_tickets
 import os
 from datetime import datetime, timezone
 import uuid
-import base64
 from fpdf import FPDF
 
 # Configuracion basica
@@ -66,38 +66,14 @@ def get_ventas_del_dia(db, fecha_objetivo=None):
 
 def get_next_ticket_z_number(db):
     """
-    Obtiene el siguiente numero correlativo para el ticket Z
+    Asigna el siguiente numero correlativo para el ticket Z desde el contador de secuencias
     """
-    # Buscar el ultimo numero de orden usado
-    ordenes = couchdb_utils.get_documents_by_partition(db, "ordenes")
-    tickets = couchdb_utils.get_documents_by_partition(db, "tickets")
-    cierres_z = couchdb_utils.get_documents_by_partition(db, "cierres_z")
-    
-    max_numero = 0
-    
-    # Revisar ordenes
-    for orden in ordenes:
-        numero = orden.get('numero_orden', 0)
-        if isinstance(numero, int) and numero > max_numero:
-            max_numero = numero
-    
-    # Revisar tickets
-    for ticket in tickets:
-        numero = ticket.get('numero_orden', 0)
-        if isinstance(numero, int) and numero > max_numero:
-            max_numero = numero
-    
-    # Revisar cierres Z anteriores
-    for cierre in cierres_z:
-        numero = cierre.get('numero_cierre_z', 0)
-        if isinstance(numero, int) and numero > max_numero:
-            max_numero = numero
-    
-    return max_numero + 1
+    return couchdb_utils.asignar_numero_secuencia(db, "cierres_z")
 
-def generar_ticket_z_pdf(ventas_del_dia, numero_cierre_z, fecha):
+def generar_ticket_z_pdf(ventas_del_dia, numero_cierre_z, fecha, usuario=None):
     """
-    Genera el PDF del ticket de Cierre Z
+    Genera el PDF del ticket de Cierre Z (se ejecuta en la cola de render, fuera del script:
+    no debe leer st.session_state, por eso recibe el usuario)
     """
     pdf = FPDF('P', 'mm', (80, 200))  # Ancho de ticket de 80mm
     pdf.add_page()
@@ -173,7 +149,7 @@ def generar_ticket_z_pdf(ventas_del_dia, numero_cierre_z, fecha):
     # Informacion adicional
     pdf.set_font('Arial', '', 7)
     pdf.cell(0, 4, 'Periodo: 00:00 - 23:59', 0, 1, 'C')
-    pdf.cell(0, 4, f'Usuario: {st.session_state.get("user_data", {}).get("usuario", "N/A")}', 0, 1, 'C')
+    pdf.cell(0, 4, f'Usuario: {usuario or "N/A"}', 0, 1, 'C')
     pdf.ln(5)
     
     # Pie
@@ -283,24 +259,20 @@ if 'usuario' in st.session_state:
                         # Guardar en base de datos
                         db.save(cierre_doc)
                         
-                        # Generar PDF
-                        pdf_data = generar_ticket_z_pdf(ventas_del_dia, numero_cierre_z, fecha_hoy)
-                        
-                        # Mostrar PDF
-                        st.success(f"✅ Cierre Z #{numero_cierre_z:04d} generado exitosamente!")
-                        
-                        # Boton de descarga
-                        st.download_button(
-                            label="📄 Descargar Cierre Z",
-                            data=pdf_data,
-                            file_name=f"Cierre_Z_{numero_cierre_z:04d}_{fecha_hoy.strftime('%Y%m%d')}.pdf",
-                            mime="application/pdf"
+                        # Encolar el PDF (queda como adjunto 'cierre_z.pdf' del cierre) sin esperar a fpdf
+                        handle_pdf = couchdb_utils.encolar_pdf(
+                            db, cierre_doc['_id'], "cierre_z.pdf",
+                            generar_ticket_z_pdf, ventas_del_dia, numero_cierre_z, fecha_hoy, cierre_doc['usuario']
                         )
-                        
-                        # Mostrar PDF en linea
-                        base64_pdf = base64.b64encode(pdf_data).decode('utf-8')
-                        pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800" type="application/pdf" style="border: none;"></iframe>'
-                        st.markdown(pdf_display, unsafe_allow_html=True)
+                        # Copia inmediata en la impresora termica, si esta configurada
+                        couchdb_utils.imprimir_ticket_termico(
+                            db, escpos_tickets.ticket_cierre_z, ventas_del_dia, numero_cierre_z, fecha_hoy, cierre_doc['usuario']
+                        )
+                        st.session_state['cierre_z_pdf'] = {
+                            'handle': handle_pdf,
+                            'file_name': f"Cierre_Z_{numero_cierre_z:04d}_{fecha_hoy.strftime('%Y%m%d')}.pdf",
+                            'message': f"✅ Cierre Z #{numero_cierre_z:04d} generado exitosamente!"
+                        }
                         
                         # Log de la accion
                         logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
@@ -310,6 +282,10 @@ if 'usuario' in st.session_state:
                         st.error(f"❌ Error al generar el Cierre Z: {str(e)}")
                 else:
                     st.error("❌ No hay ventas para generar un Cierre Z.")
+            
+            # PDF del ultimo cierre generado (se muestra cuando la cola de render lo termina)
+            couchdb_utils.mostrar_pdf_encolado(db, 'cierre_z_pdf', "📄 Descargar Cierre Z")
+            couchdb_utils.mostrar_impresiones_termicas()
         
         with col_history:
             st.subheader("📋 Historial de Cierres Z")
@@ -1,10 +1,10 @@
 # pages/cierreX.py
 import streamlit as st
 import couchdb_utils
+import escpos_tickets
 import os
 from datetime import datetime, timezone
 import uuid
-import base64
 from fpdf import FPDF
 import pandas as pd
 
@@ -70,21 +70,14 @@ def get_ventas_por_rango_datetime(db, datetime_inicio, datetime_fin):
 
 def get_next_ticket_x_number(db):
     """
-    Obtiene el siguiente numero correlativo para el ticket X
+    Asigna el siguiente numero correlativo para el ticket X desde el contador de secuencias
     """
-    cierres_x = couchdb_utils.get_documents_by_partition(db, "cierres_x")
-    
-    max_numero = 0
-    for cierre in cierres_x:
-        numero = cierre.get('numero_cierre_x', 0)
-        if isinstance(numero, int) and numero > max_numero:
-            max_numero = numero
-    
-    return max_numero + 1
+    return couchdb_utils.asignar_numero_secuencia(db, "cierres_x")
 
-def generar_ticket_x_pdf(ventas_rango, numero_cierre_x, datetime_inicio, datetime_fin):
+def generar_ticket_x_pdf(ventas_rango, numero_cierre_x, datetime_inicio, datetime_fin, usuario=None):
     """
-    Genera el PDF del ticket de Cierre X
+    Genera el PDF del ticket de Cierre X (se ejecuta en la cola de render, fuera del script:
+    no debe leer st.session_state, por eso recibe el usuario)
     """
     pdf = FPDF('P', 'mm', (80, 200))  # Ancho de ticket de 80mm
     pdf.add_page()
@@ -172,7 +165,7 @@ def generar_ticket_x_pdf(ventas_rango, numero_cierre_x, datetime_inicio, datetim
     duracion = datetime_fin - datetime_inicio
     horas_total = round(duracion.total_seconds() / 3600, 1)
     pdf.cell(0, 4, f'Periodo: {horas_total} hora(s)', 0, 1, 'C')
-    pdf.cell(0, 4, f'Usuario: {st.session_state.get("user_data", {}).get("usuario", "N/A")}', 0, 1, 'C')
+    pdf.cell(0, 4, f'Usuario: {usuario or "N/A"}', 0, 1, 'C')
     pdf.ln(5)
     
     # Pie
@@ -334,24 +327,20 @@ if 'usuario' in st.session_state:
                             # Guardar en base de datos
                             db.save(cierre_doc)
                             
-                            # Generar PDF
-                            pdf_data = generar_ticket_x_pdf(ventas_rango, numero_cierre_x, datetime_inicio, datetime_fin)
-                            
-                            # Mostrar exito
-                            st.success(f"Cierre X #{numero_cierre_x:04d} generado exitosamente!")
-                            
-                            # Boton de descarga
-                            st.download_button(
-                                label="Descargar Cierre X",
-                                data=pdf_data,
-                                file_name=f"Cierre_X_{numero_cierre_x:04d}_{datetime_inicio.strftime('%Y%m%d_%H%M')}_{datetime_fin.strftime('%Y%m%d_%H%M')}.pdf",
-                                mime="application/pdf"
+                            # Encolar el PDF (queda como adjunto 'cierre_x.pdf' del cierre) sin esperar a fpdf
+                            handle_pdf = couchdb_utils.encolar_pdf(
+                                db, cierre_doc['_id'], "cierre_x.pdf",
+                                generar_ticket_x_pdf, ventas_rango, numero_cierre_x, datetime_inicio, datetime_fin, cierre_doc['usuario']
                             )
-                            
-                            # Mostrar PDF en linea
-                            base64_pdf = base64.b64encode(pdf_data).decode('utf-8')
-                            pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800" type="application/pdf" style="border: none;"></iframe>'
-                            st.markdown(pdf_display, unsafe_allow_html=True)
+                            # Copia inmediata en la impresora termica, si esta configurada
+                            couchdb_utils.imprimir_ticket_termico(
+                                db, escpos_tickets.ticket_cierre_x, ventas_rango, numero_cierre_x, datetime_inicio, datetime_fin, cierre_doc['usuario']
+                            )
+                            st.session_state['cierre_x_pdf'] = {
+                                'handle': handle_pdf,
+                                'file_name': f"Cierre_X_{numero_cierre_x:04d}_{datetime_inicio.strftime('%Y%m%d_%H%M')}_{datetime_fin.strftime('%Y%m%d_%H%M')}.pdf",
+                                'message': f"Cierre X #{numero_cierre_x:04d} generado exitosamente!"
+                            }
                             
                             # Log de la accion
                             logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
@@ -364,6 +353,10 @@ if 'usuario' in st.session_state:
                             st.error(f"Error al generar el Cierre X: {str(e)}")
                     else:
                         st.error("No hay ventas en el rango seleccionado para generar un Cierre X.")
+                
+                # PDF del ultimo cierre generado (se muestra cuando la cola de render lo termina)
+                couchdb_utils.mostrar_pdf_encolado(db, 'cierre_x_pdf', "Descargar Cierre X")
+                couchdb_utils.mostrar_impresiones_termicas()
         
         with col_history:
             st.subheader("Historial de Cierres X")
@@ -1,10 +1,9 @@
 import streamlit as st
 import couchdb_utils
+import render_queue
+import escpos_tickets
 import os
-from datetime import datetime, timezone
-from fpdf import FPDF
-from fpdf.enums import XPos, YPos
-import base64 # Import base64 for embedding PDF
+from datetime import datetime, time, timezone
 
 
 # --- Configuración Inicial ---
@@ -12,122 +11,8 @@ st.set_page_config(layout="wide", page_title="Cobro de Tickets", page_icon="../a
 archivo_actual_relativo = os.path.join(os.path.basename(os.path.dirname(__file__)), os.path.basename(__file__))
 couchdb_utils.generarLogin(archivo_actual_relativo)
 
-# --- Clase para Generar PDF del Ticket (as provided in previous fix) ---
-class PDF(FPDF):
-    def header(self):
-        # Logo
-        try:
-            logo_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets', 'LOGO.png')
-            if os.path.exists(logo_path):
-                # Centrar el logo en la página de 80mm de ancho
-                self.image(logo_path, 20, 8, 40)  # x=20 para centrar en 80mm, width=40
-                self.set_y(self.get_y() + 25)  # Espacio después del logo
-        except:
-            pass
-        
-        self.set_font('Helvetica', 'B', 12) # Changed to Helvetica
-        self.cell(0, 8, 'Tia Juana', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.set_font('Helvetica', '', 8) # Changed to Helvetica
-        self.cell(0, 4, 'Elias, Salvador Alfonso', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.cell(0, 4, 'NIT: 0210-030563-104-1', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.cell(0, 4, 'IVA DL296', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.cell(0, 4, 'REG. 102166713', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.cell(0, 4, 'Giro: Restaurantes', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.cell(0, 4, 'Fecha Autorización: 11/12/2019', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.set_y(self.get_y() + 5)
-
-    def footer(self):
-        self.set_y(-30)
-        self.set_font('Helvetica', 'B', 10) # Changed to Helvetica
-        self.cell(0, 10, '!!!!! CANCELADO/PAGADO !!!!!', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.set_font('Helvetica', 'I', 8) # Changed to Helvetica
-        self.cell(0, 5, 'GRACIAS POR TU COMPRA', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-        self.cell(0, 5, 'REGRESA PRONTO', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
-
-# --- Función para limpiar texto del PDF ---
-def limpiar_texto_pdf(texto):
-    """Limpia emojis y caracteres no compatibles con PDF"""
-    if not texto:
-        return "N/A"
-    
-    import re
-    # Remover emojis y caracteres especiales
-    texto_limpio = re.sub(r'[^\x00-\x7F]+', '', str(texto))  # Solo ASCII
-    # Limpiar espacios extra y caracteres especiales comunes
-    texto_limpio = re.sub(r'[🎉🍹🍽️💰🔥⭐💥⏰]', '', texto_limpio)
-    # Limpiar caracteres de formato especial
-    texto_limpio = texto_limpio.strip()
-    
-    return texto_limpio if texto_limpio else "Producto"
-
-# --- Función para generar el PDF (as provided in previous fix) ---
-def generar_ticket_pdf(ticket, orden, mesa, mesero):
-    pdf = PDF('P', 'mm', (80, 200)) # Ancho de ticket de 80mm
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_font('Helvetica', '', 9) # Changed to Helvetica
-
-    # Info del Ticket
-    pdf.cell(0, 5, f"Ticket #{ticket.get('numero_orden', 'N/A')}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='L')
-    fecha_pago = datetime.now(timezone.utc).astimezone().strftime('%d/%m/%Y %I:%M:%S %p')
-    pdf.cell(0, 5, f"Fecha: {fecha_pago}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='L')
-    mesa_nombre_limpio = limpiar_texto_pdf(mesa.get('descripcion', 'N/A'))
-    pdf.cell(0, 5, f"Mesa: {mesa_nombre_limpio}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='L')
-    mesero_nombre_limpio = limpiar_texto_pdf(mesero.get('nombre', 'N/A'))
-    pdf.cell(0, 5, f"Mesero: {mesero_nombre_limpio}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='L')
-    pdf.set_y(pdf.get_y() + 5)
-
-    # Encabezados de productos
-    pdf.set_font('Helvetica', 'B', 8) # Changed to Helvetica
-    pdf.cell(10, 5, 'CANT.', new_x=XPos.RIGHT, new_y=YPos.TOP, align='C')
-    pdf.cell(30, 5, 'PRODUCTO', new_x=XPos.RIGHT, new_y=YPos.TOP, align='L')
-    pdf.cell(15, 5, 'PRECIO', new_x=XPos.RIGHT, new_y=YPos.TOP, align='R')
-    pdf.cell(15, 5, 'TOTAL', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='R')
-    pdf.line(pdf.get_x(), pdf.get_y(), pdf.get_x() + 70, pdf.get_y())
-    pdf.set_y(pdf.get_y() + 2)
-
-    # Items
-    pdf.set_font('Helvetica', '', 8) # Changed to Helvetica
-    # Filtrar productos anulados
-    items_activos = [item for item in orden.get('items', []) if not item.get('anulado', False)]
-    subtotal = sum(item.get('cantidad', 0) * item.get('precio_unitario', 0) for item in items_activos)
-    
-    for item in items_activos:
-        cantidad = item.get('cantidad', 0)
-        precio = item.get('precio_unitario', 0)
-        total_item = cantidad * precio
-        
-        y_before = pdf.get_y()
-        pdf.cell(10, 5, str(cantidad), new_x=XPos.RIGHT, new_y=YPos.TOP, align='C')
-        nombre_limpio = limpiar_texto_pdf(item.get('nombre', 'N/A'))
-        pdf.multi_cell(30, 5, nombre_limpio, align='L')
-        y_after = pdf.get_y()
-        height_diff = y_after - y_before
-        
-        pdf.set_y(y_before)
-        pdf.set_x(pdf.get_x() + 40)
-        
-        pdf.cell(15, height_diff, f"${precio:.2f}", new_x=XPos.RIGHT, new_y=YPos.TOP, align='R')
-        pdf.cell(15, height_diff, f"${total_item:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='R')
-    
-    servicio = subtotal * 0.10
-    total_final = subtotal + servicio
-    
-    # Totales
-    pdf.set_y(pdf.get_y() + 3)
-    pdf.line(pdf.get_x(), pdf.get_y(), pdf.get_x() + 70, pdf.get_y())
-    pdf.set_y(pdf.get_y() + 2)
-    pdf.set_font('Helvetica', 'B', 9) # Changed to Helvetica
-    pdf.cell(40, 5, 'Subtotal:', new_x=XPos.RIGHT, new_y=YPos.TOP, align='R')
-    pdf.cell(30, 5, f"${subtotal:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='R')
-    pdf.cell(40, 5, 'Servicio (10%):', new_x=XPos.RIGHT, new_y=YPos.TOP, align='R')
-    pdf.cell(30, 5, f"${servicio:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='R')
-    pdf.set_font('Helvetica', 'B', 11) # Changed to Helvetica
-    pdf.cell(40, 8, 'TOTAL:', new_x=XPos.RIGHT, new_y=YPos.TOP, align='R')
-    pdf.cell(30, 8, f"${total_final:.2f}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='R')
-
-    return bytes(pdf.output())
-
+# El PDF del ticket (couchdb_utils.generar_ticket_pdf) se genera en la cola de render,
+# fuera de este script, y queda como adjunto 'ticket.pdf' del documento del ticket.
 
 # --- Lógica Principal de la Pantalla ---
 
@@ -141,34 +26,18 @@ if 'usuario' in st.session_state:
     if db:
         st.title("💰 Sistema de Cobros")
         
-        # --- Display the PDF and button immediately if a ticket was just processed ---
+        # --- Mostrar el ticket recién cobrado (se genera en segundo plano) ---
         if st.session_state['just_processed_ticket_display'] is not None:
-            info = st.session_state.pop('just_processed_ticket_display') # Pop to clear it after display
-            st.success(info['message'])
-            
-            # Display the download button
-            st.download_button(
-                label="📄 Descargar Ticket en PDF",
-                data=info['pdf_data'],
-                file_name=info['file_name'],
-                mime="application/pdf"
-            )
-            
-            # Optional: Display PDF directly using base64
-            base64_pdf = base64.b64encode(info['pdf_data']).decode('utf-8')
-            pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800" type="application/pdf" style="border: none;"></iframe>'
-            st.markdown(pdf_display, unsafe_allow_html=True)
-            
-            # No st.rerun() here. The next interaction will naturally rerun.
-            # This ensures the user sees the button and PDF before the page potentially refreshes to show other tickets.
+            couchdb_utils.mostrar_pdf_encolado(db, 'just_processed_ticket_display', "📄 Descargar Ticket en PDF")
             st.markdown("---")
+        # Resultado de los tickets enviados a la impresora térmica (avisa si alguno falló)
+        couchdb_utils.mostrar_impresiones_termicas()
 
         # --- Cargar datos comunes para ambas pestañas ---
-        mesas = {m['_id']: m for m in couchdb_utils.get_documents_by_partition(db, "mesas")}
+        mesas = {m['_id']: m for m in couchdb_utils.get_catalog_documents(db, "mesas")}
         # Corregir partición de usuarios de "usuario" a "Usuario"
-        todos_usuarios = couchdb_utils.get_documents_by_partition(db, "Usuario")
+        todos_usuarios = couchdb_utils.get_catalog_documents(db, "Usuario")
         meseros = {m['_id']: m for m in todos_usuarios if m.get('id_rol') == 3}
-        ordenes = {o['_id']: o for o in couchdb_utils.get_documents_by_partition(db, "ordenes")}
         
         # --- Pestañas para Cobros Pendientes e Historial ---
         tab_pendientes, tab_historial = st.tabs(["🕒 Cobros Pendientes", "📋 Historial de Cobros"])
@@ -177,13 +46,15 @@ if 'usuario' in st.session_state:
             st.subheader("Tickets Pendientes de Cobro")
             
             # --- Rest of the payment processing logic ---
-            tickets_pendientes = [doc for doc in couchdb_utils.get_documents_by_partition(db, "tickets") if doc.get('estado') == 'pendiente_pago']
+            tickets_pendientes = couchdb_utils.get_documents_by_partition(db, "tickets", selector={"estado": "pendiente_pago"})
         
             if not tickets_pendientes:
                 st.info("✅ No hay cuentas pendientes de cobro.")
             else:
                 # Ordenar tickets por fecha de creación (más viejo primero)
                 tickets_pendientes.sort(key=lambda x: x.get('fecha_creacion', ''))
+                # Solo las órdenes de las cuentas abiertas (no toda la partición de órdenes)
+                ordenes = couchdb_utils.get_many(db, [t.get('orden_id') for t in tickets_pendientes])
 
                 for idx, ticket in enumerate(tickets_pendientes):
                     orden_id = ticket.get('orden_id')
@@ -400,36 +271,27 @@ if 'usuario' in st.session_state:
 
                         if pago_valido and st.button("✅ Confirmar Pago y Generar Ticket", key=f"pay_{ticket['_id']}"):
                             try:
-                                ticket_doc = db[ticket['_id']]
-                                ticket_doc['estado'] = 'pagado'
-                                ticket_doc['fecha_pago'] = datetime.now(timezone.utc).isoformat()
-                                ticket_doc['pago_info'] = pago_info
-                                db.save(ticket_doc)
-                                
-                                orden_doc = db[orden_id]
-                                orden_doc['estado'] = 'pagada'
-                                db.save(orden_doc)
-
-                                # Registrar movimientos de inventario por cada item vendido (solo productos activos)
+                                # Ticket pagado, orden en 'pagada' e inventario en una sola escritura
                                 logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
-                                items_activos_inventario = [item for item in orden_doc.get('items', []) if not item.get('anulado', False)]
-                                for item in items_activos_inventario:
-                                    # Buscar el plato_id en la base de datos por nombre del item
-                                    platos = couchdb_utils.get_documents_by_partition(db, "platos")
-                                    plato = next((p for p in platos if p.get('descripcion') == item.get('nombre')), None)
-                                    if plato:
-                                        couchdb_utils.registrar_movimiento_inventario(
-                                            db, 
-                                            plato['_id'], 
-                                            item.get('cantidad', 1), 
-                                            logged_in_user
-                                        )
+                                orden_doc, ticket_doc, error_pago = couchdb_utils.confirmar_pago(
+                                    db, ticket['_id'], orden_id, pago_info, logged_in_user
+                                )
+                                if error_pago:
+                                    raise RuntimeError(error_pago)
 
-                                pdf_data_for_display = generar_ticket_pdf(ticket_doc, orden_doc, mesa, mesero)
+                                # El PDF se arma en la cola de render; la página no espera a fpdf
+                                handle_pdf = couchdb_utils.encolar_pdf(
+                                    db, ticket_doc['_id'], "ticket.pdf",
+                                    couchdb_utils.generar_ticket_pdf, dict(ticket_doc), orden_doc, mesa, mesero
+                                )
+                                # Si hay impresora térmica, el ticket ESC/POS sale de inmediato (el PDF queda para archivo)
+                                couchdb_utils.imprimir_ticket_termico(
+                                    db, escpos_tickets.ticket_cobro, dict(ticket_doc), orden_doc, mesa, mesero
+                                )
                                 
                                 # Store info for display on the next run
                                 st.session_state['just_processed_ticket_display'] = {
-                                    'pdf_data': pdf_data_for_display,
+                                    'handle': handle_pdf,
                                     'file_name': f"Ticket_{ticket.get('numero_orden', 'N_A')}.pdf",
                                     'message': f"¡Pago registrado para la Mesa {mesa.get('descripcion')}!"
                                 }
@@ -443,30 +305,35 @@ if 'usuario' in st.session_state:
         with tab_historial:
             st.subheader("Historial de Cobros Realizados")
             
-            # Obtener tickets pagados
-            tickets_pagados = [doc for doc in couchdb_utils.get_documents_by_partition(db, "tickets") if doc.get('estado') == 'pagado']
+            # Filtros
+            col_filtro1, col_filtro2, col_filtro3 = st.columns(3)
+            with col_filtro1:
+                filtro_mesa = st.selectbox(
+                    "Filtrar por Mesa:",
+                    options=["Todas"] + [f"Mesa {mesa.get('descripcion', 'N/A')}" for mesa in mesas.values()],
+                    key="filtro_mesa_historial"
+                )
+            
+            with col_filtro2:
+                fecha_desde = st.date_input("Desde:", key="fecha_desde_historial")
+            
+            with col_filtro3:
+                fecha_hasta = st.date_input("Hasta:", key="fecha_hasta_historial")
+            
+            # Obtener solo los tickets pagados del rango (índice 'fecha_pago'; las fechas se guardan en UTC)
+            inicio_rango = datetime.combine(fecha_desde, time.min).astimezone(timezone.utc)
+            fin_rango = datetime.combine(fecha_hasta, time.max).astimezone(timezone.utc)
+            tickets_pagados = couchdb_utils.get_ticket_summaries(db, {
+                "estado": "pagado",
+                "fecha_pago": {"$gte": inicio_rango.isoformat(), "$lte": fin_rango.isoformat()}
+            })
             
             if not tickets_pagados:
-                st.info("📝 No hay cobros realizados en el historial.")
+                st.info("📝 No hay cobros realizados en el período seleccionado.")
             else:
                 # Ordenar por fecha de pago (más reciente primero)
                 tickets_pagados.sort(key=lambda x: x.get('fecha_pago', ''), reverse=True)
                 
-                # Filtros
-                col_filtro1, col_filtro2, col_filtro3 = st.columns(3)
-                with col_filtro1:
-                    filtro_mesa = st.selectbox(
-                        "Filtrar por Mesa:",
-                        options=["Todas"] + [f"Mesa {mesa.get('descripcion', 'N/A')}" for mesa in mesas.values()],
-                        key="filtro_mesa_historial"
-                    )
-                
-                with col_filtro2:
-                    fecha_desde = st.date_input("Desde:", key="fecha_desde_historial")
-                
-                with col_filtro3:
-                    fecha_hasta = st.date_input("Hasta:", key="fecha_hasta_historial")
-                
                 # Aplicar filtros
                 tickets_filtrados = tickets_pagados
                 if filtro_mesa != "Todas":
@@ -482,6 +349,9 @@ if 'usuario' in st.session_state:
                 total_cobrado = sum(ticket.get('total', 0) for ticket in tickets_filtrados)
                 st.info(f"📊 Mostrando {len(tickets_filtrados)} cobro(s) - Total: ${total_cobrado:.2f}")
                 
+                # Solo las órdenes de los tickets que se muestran
+                ordenes = couchdb_utils.get_many(db, [t.get('orden_id') for t in tickets_filtrados])
+                
                 # Mostrar tickets en el historial
                 for ticket in tickets_filtrados:
                     orden_id = ticket.get('orden_id')
@@ -533,19 +403,35 @@ if 'usuario' in st.session_state:
                         with col_reprint:
                             st.markdown("**Reimprimir:**")
                             if st.button(f"🖨️ Reimprimir Ticket", key=f"reprint_{ticket['_id']}", use_container_width=True):
-                                # Generar PDF nuevamente
+                                # Usar el PDF guardado como adjunto; si no existe, generarlo en la cola de render
                                 try:
-                                    pdf_data_reprint = generar_ticket_pdf(ticket, orden, mesa, mesero)
-                                    st.download_button(
-                                        label="📄 Descargar Ticket (Reimpresión)",
-                                        data=pdf_data_reprint,
-                                        file_name=f"Reimpresion_Ticket_{ticket.get('numero_orden', 'N_A')}.pdf",
-                                        mime="application/pdf",
-                                        key=f"download_reprint_{ticket['_id']}"
-                                    )
-                                    st.success("✅ Ticket listo para reimprimir")
+                                    handle_pdf = render_queue.handle(ticket['_id'], "ticket.pdf")
+                                    pdf_data_reprint = couchdb_utils.obtener_pdf(db, handle_pdf)
+                                    if pdf_data_reprint is None:
+                                        couchdb_utils.encolar_pdf(
+                                            db, ticket['_id'], "ticket.pdf",
+                                            couchdb_utils.generar_ticket_pdf, ticket, orden, mesa, mesero
+                                        )
+                                        st.info("⏳ Generando el ticket, presione Reimprimir nuevamente en unos segundos.")
+                                    else:
+                                        st.download_button(
+                                            label="📄 Descargar Ticket (Reimpresión)",
+                                            data=pdf_data_reprint,
+                                            file_name=f"Reimpresion_Ticket_{ticket.get('numero_orden', 'N_A')}.pdf",
+                                            mime="application/pdf",
+                                            key=f"download_reprint_{ticket['_id']}"
+                                        )
+                                        st.success("✅ Ticket listo para reimprimir")
                                 except Exception as e:
                                     st.error(f"❌ Error al generar reimpresión: {str(e)}")
+                            if st.button("🧾 Impresora Térmica", key=f"reprint_termica_{ticket['_id']}", use_container_width=True):
+                                ok, mensaje = couchdb_utils.imprimir_ticket_termico(
+                                    db, escpos_tickets.ticket_cobro, ticket, orden, mesa, mesero
+                                )
+                                if ok:
+                                    st.rerun()
+                                else:
+                                    st.warning(mensaje)
     
     else:
         st.error("No se pudo conectar a la base de datos.")
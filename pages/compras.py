@@ -223,86 +223,73 @@ if 'usuario' in st.session_state:
         def actualizar_ingredientes(items_compra, usuario, num_documento):
             ingredientes = couchdb_utils.get_documents_by_partition(db, "ingredientes")
             
+            ingredientes_a_guardar = {}  # _id -> documento de ingrediente nuevo o con unidad cambiada
+            ingredientes_compra = {}  # _id -> documento de ingrediente (existente o nuevo)
+            movimientos = []
+            
             for item in items_compra:
                 descripcion = item['Descripción']
                 cantidad = item['Cantidad']
                 unidad = item.get('Unidad', 'unidad')  # Usar 'unidad' como valor por defecto
                 
-                # Buscar si el ingrediente ya existe
-                ingrediente_existente = next((i for i in ingredientes if i.get('descripcion', '').lower() == descripcion.lower()), None)
+                # Buscar si el ingrediente ya existe (o ya apareció en esta compra)
+                ingrediente_existente = next((i for i in list(ingredientes_compra.values()) + ingredientes if i.get('descripcion', '').lower() == descripcion.lower()), None)
                 
                 if ingrediente_existente:
                     # Verificar si la unidad es diferente
                     if ingrediente_existente.get('unidad') != unidad:
                         st.warning(f"La unidad del ingrediente '{descripcion}' ha cambiado de '{ingrediente_existente.get('unidad')}' a '{unidad}'")
-                    
-                    # Actualizar cantidad existente y unidad
-                    cantidad_actual = float(ingrediente_existente.get('cantidad', 0))
-                    nueva_cantidad = cantidad_actual + cantidad
-                    
-                    ingrediente_actualizado = {
-                        "_id": ingrediente_existente["_id"],
-                        "_rev": ingrediente_existente["_rev"],
-                        "descripcion": ingrediente_existente["descripcion"],
-                        "cantidad": nueva_cantidad,
-                        "unidad": unidad,  # Actualizar la unidad
-                        "imagen": ingrediente_existente.get("imagen", ""),
-                        "activo": ingrediente_existente.get("activo", 1),
-                        "fecha_creacion": ingrediente_existente.get("fecha_creacion"),
-                        "type": "ingredientes"
-                    }
-                    
-                    try:
-                        db.save(ingrediente_actualizado)
-                        
-                        # Registrar movimiento de inventario (entrada)
-                        movimiento = {
-                            "_id": f"inventario:{str(uuid.uuid4())}",
-                            "type": "inventario",
-                            "ingrediente_id": ingrediente_existente["_id"],
-                            "tipo": "entrada",
-                            "cantidad": cantidad,  # Cantidad positiva para entradas
-                            "motivo": f"Compra - Documento: {num_documento}",
-                            "usuario": usuario,
-                            "fecha_creacion": datetime.now(timezone.utc).isoformat()
-                        }
-                        db.save(movimiento)
-                        
-                    except Exception as e:
-                        st.error(f"Error al actualizar ingrediente {descripcion}: {str(e)}")
+                        ingrediente_existente["unidad"] = unidad  # Actualizar la unidad
+                        ingredientes_a_guardar[ingrediente_existente["_id"]] = ingrediente_existente
+                    doc_id = ingrediente_existente["_id"]
+                    ingredientes_compra[doc_id] = ingrediente_existente
                 else:
-                    # Crear nuevo ingrediente con la unidad especificada
+                    # Crear nuevo ingrediente con la unidad especificada (el stock lo dan los movimientos)
                     doc_id = f"ingredientes:{str(uuid.uuid4())}"
                     
-                    nuevo_ingrediente = {
+                    ingredientes_a_guardar[doc_id] = ingredientes_compra[doc_id] = {
                         "_id": doc_id,
                         "descripcion": descripcion,
-                        "cantidad": cantidad,
                         "unidad": unidad,  # Usar la unidad especificada en la compra
                         "imagen": "",
                         "activo": 1,
                         "fecha_creacion": datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
                         "type": "ingredientes"
                     }
-                    
-                    try:
-                        db.save(nuevo_ingrediente)
-                        
-                        # Registrar movimiento de inventario (entrada) para nuevo ingrediente
-                        movimiento = {
-                            "_id": f"inventario:{str(uuid.uuid4())}",
-                            "type": "inventario",
-                            "ingrediente_id": doc_id,
-                            "tipo": "entrada",
-                            "cantidad": cantidad,  # Cantidad positiva para entradas
-                            "motivo": f"Compra - Documento: {num_documento}",
-                            "usuario": usuario,
-                            "fecha_creacion": datetime.now(timezone.utc).isoformat()
-                        }
-                        db.save(movimiento)
-                        
-                    except Exception as e:
-                        st.error(f"Error al crear nuevo ingrediente {descripcion}: {str(e)}")
+                
+                # Registrar movimiento de inventario (entrada)
+                movimientos.append({
+                    "_id": f"inventario:{str(uuid.uuid4())}",
+                    "type": "inventario",
+                    "ingrediente_id": doc_id,
+                    "tipo": "entrada",
+                    "cantidad": cantidad,  # Cantidad positiva para entradas
+                    "motivo": f"Compra - Documento: {num_documento}",
+                    "usuario": usuario,
+                    "fecha_creacion": datetime.now(timezone.utc).isoformat()
+                })
+            
+            def rehacer(conflictos):
+                # Otra terminal modificó el ingrediente: releerlo y volver a aplicar la unidad
+                reintentos = []
+                for conflicto in conflictos:
+                    actual = db.get(conflicto["_id"])
+                    if actual is None:
+                        continue
+                    actual["unidad"] = conflicto["unidad"]
+                    reintentos.append(actual)
+                return reintentos
+            
+            # Ingredientes y movimientos (entradas al libro de inventario) en una sola escritura
+            try:
+                _, resultados = couchdb_utils.guardar_movimientos_inventario(
+                    db, movimientos, otros_docs=list(ingredientes_a_guardar.values()), rehacer_otros=rehacer
+                )
+                for resultado in resultados:
+                    if not resultado['ok']:
+                        st.error(f"Error al actualizar ingrediente {resultado['doc'].get('descripcion', resultado['id'])}: {resultado['error']}")
+            except Exception as e:
+                st.error(f"Error al actualizar ingredientes: {str(e)}")
 
         # Inicializar tabla de items si no existe
         if 'items_compra' not in st.session_state:
@@ -494,10 +481,64 @@ if 'usuario' in st.session_state:
                         
                         # Limpiar formulario
                         st.session_state.items_compra = pd.DataFrame(columns=['Cantidad', 'Descripción', 'Unidad', 'Precio Unitario', 'Total'])
+                        # El stock cambió: las sugerencias calculadas ya no son válidas
+                        st.session_state.pop('sugerencias_compra', None)
                         st.rerun()
                     except Exception as e:
                         st.error(f"Error al registrar la compra: {str(e)}")
 
+        # --- Sección de Sugerencias de Compra ---
+        st.header("Sugerencias de Compra")
+        st.caption("Consumo previsto según las ventas pagadas de las últimas semanas y las recetas (Plato - Ingrediente), menos el stock actual.")
+
+        col_horizonte, col_seguridad = st.columns(2)
+        with col_horizonte:
+            horizonte_dias = st.number_input("Días a cubrir:", min_value=1, max_value=30, value=7, step=1, key="sugerencias_horizonte")
+        with col_seguridad:
+            dias_seguridad = st.number_input("Días de seguridad:", min_value=0, max_value=14, value=2, step=1, key="sugerencias_seguridad")
+
+        # El pronóstico se calcula solo a pedido: cada cambio del formulario de compra vuelve a ejecutar la página
+        parametros_sugerencias = (int(horizonte_dias), int(dias_seguridad))
+        if st.button("Calcular Sugerencias", key="btn_calcular_sugerencias"):
+            st.session_state.sugerencias_compra = (
+                parametros_sugerencias,
+                couchdb_utils.sugerencias_compra(db, *parametros_sugerencias)
+            )
+
+        calculadas = st.session_state.get('sugerencias_compra')
+        sugerencias = None
+        if calculadas is not None and calculadas[0] != parametros_sugerencias:
+            st.info("Los días cambiaron; presione 'Calcular Sugerencias' para actualizar.")
+        elif calculadas is not None:
+            sugerencias = calculadas[1]
+        if sugerencias is not None:
+            if sugerencias.empty:
+                st.info("El stock actual cubre el consumo previsto de todos los ingredientes.")
+            else:
+                for proveedor_nombre, grupo in sugerencias.groupby('Proveedor', sort=True):
+                    with st.expander(f"{proveedor_nombre} ({len(grupo)} ingredientes)"):
+                        st.dataframe(
+                            grupo[['Descripción', 'Unidad', 'Stock', 'Consumo previsto', 'Sugerido', 'Precio Unitario']],
+                            hide_index=True,
+                            use_container_width=True,
+                            column_config={
+                                'Stock': st.column_config.NumberColumn(format="%.2f"),
+                                'Consumo previsto': st.column_config.NumberColumn(format="%.2f"),
+                                'Sugerido': st.column_config.NumberColumn(format="%.1f"),
+                                'Precio Unitario': st.column_config.NumberColumn(format="$%.2f"),
+                            }
+                        )
+                        if st.button("Cargar en la compra", key=f"cargar_sugerencias_{proveedor_nombre}"):
+                            nuevos_items = pd.DataFrame({
+                                'Cantidad': grupo['Sugerido'].values,
+                                'Descripción': grupo['Descripción'].values,
+                                'Unidad': grupo['Unidad'].values,
+                                'Precio Unitario': grupo['Precio Unitario'].values,
+                                'Total': (grupo['Sugerido'] * grupo['Precio Unitario']).values,
+                            })
+                            st.session_state.items_compra = pd.concat([st.session_state.items_compra, nuevos_items], ignore_index=True)
+                            st.rerun()
+
         # --- Sección de Historial de Compras ---
         st.header("Historial de Compras")
         
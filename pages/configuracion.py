@@ -1,6 +1,9 @@
 # pages/configuracion.py
 import streamlit as st
 import couchdb_utils
+import db_bootstrap
+import secuencias
+import escpos_tickets
 import os
 from datetime import datetime, timezone
 import uuid
@@ -69,7 +72,7 @@ if 'usuario' in st.session_state:
         def obtener_configuracion():
             """Obtiene la configuración actual del sistema"""
             try:
-                config_docs = list(db.find({"selector": {"type": "configuracion"}}))
+                config_docs = couchdb_utils.get_catalog_documents(db, "configuracion")
                 if config_docs:
                     return config_docs[0]
                 else:
@@ -83,7 +86,7 @@ if 'usuario' in st.session_state:
                         "fecha_creacion": datetime.now(timezone.utc).isoformat(),
                         "ultima_modificacion": datetime.now(timezone.utc).isoformat()
                     }
-                    db.save(config_default)
+                    couchdb_utils.guardar_configuracion_sistema(db, config_default)
                     return config_default
             except Exception as e:
                 st.error(f"Error al obtener configuración: {e}")
@@ -93,7 +96,7 @@ if 'usuario' in st.session_state:
             """Guarda la configuración actualizada"""
             try:
                 config["ultima_modificacion"] = datetime.now(timezone.utc).isoformat()
-                db.save(config)
+                couchdb_utils.guardar_configuracion_sistema(db, config)
                 return True
             except Exception as e:
                 st.error(f"Error al guardar configuración: {e}")
@@ -102,7 +105,7 @@ if 'usuario' in st.session_state:
         def obtener_ingredientes_activos():
             """Obtiene todos los ingredientes activos"""
             try:
-                ingredientes = couchdb_utils.get_documents_by_partition(db, "ingredientes")
+                ingredientes = couchdb_utils.get_catalog_documents(db, "ingredientes")
                 return [i for i in ingredientes if i.get('activo', 0) == 1]
             except Exception as e:
                 st.error(f"Error al obtener ingredientes: {e}")
@@ -115,7 +118,7 @@ if 'usuario' in st.session_state:
             st.stop()
 
         # Pestañas principales
-        tab_numeracion, tab_stock_alerts = st.tabs(["🔢 Numeracion", "⚠️ Alertas de Stock"])
+        tab_numeracion, tab_stock_alerts, tab_impresora, tab_indices = st.tabs(["🔢 Numeracion", "⚠️ Alertas de Stock", "🖨️ Impresora", "🗂️ Índices"])
 
         # === TAB NUMERACIÓN ===
         with tab_numeracion:
@@ -143,14 +146,8 @@ if 'usuario' in st.session_state:
 
                 # Mostrar información actual
                 try:
-                    # Obtener el último número de orden usado
-                    last_order = db.view('_design/orders/_view/by_order_number',
-                                       limit=1,
-                                       descending=True,
-                                       partition="ordenes"
-                                       ).rows
-                    
-                    ultimo_numero_orden = int(last_order[0].key) if last_order else 0
+                    # Obtener el último número de orden asignado
+                    ultimo_numero_orden = secuencias.ultimo_numero(db, "ordenes")
                     proximo_numero_orden = max(numero_orden_inicial, ultimo_numero_orden + 1)
                     
                     st.markdown(f"""
@@ -180,9 +177,8 @@ if 'usuario' in st.session_state:
 
                 # Mostrar información actual
                 try:
-                    # Obtener el último número de ticket usado
-                    all_tickets = [doc for doc in db if doc.get('type') == 'tickets']
-                    ultimo_numero_ticket = max([tkt.get('numero_ticket', 0) for tkt in all_tickets] or [0])
+                    # Obtener el último número de ticket asignado
+                    ultimo_numero_ticket = secuencias.ultimo_numero(db, "tickets")
                     proximo_numero_ticket = max(numero_ticket_inicial, ultimo_numero_ticket + 1)
                     
                     st.markdown(f"""
@@ -248,6 +244,7 @@ if 'usuario' in st.session_state:
 
             # Obtener ingredientes
             ingredientes = obtener_ingredientes_activos()
+            stocks = couchdb_utils.get_stocks(db, [i['_id'] for i in ingredientes])
             
             if not ingredientes:
                 st.warning("No se encontraron ingredientes activos en el sistema.")
@@ -272,7 +269,7 @@ if 'usuario' in st.session_state:
                         
                         with cols[col_idx]:
                             # Obtener stock actual si existe
-                            stock_actual = ingrediente.get('cantidad', 0)
+                            stock_actual = stocks.get(ingrediente_id, 0)
                             unidad = ingrediente.get('unidad', 'unidad')
                             
                             st.markdown(f"**{nombre}**")
@@ -350,25 +347,18 @@ if 'usuario' in st.session_state:
                 st.markdown("---")
                 st.subheader("🚨 Alertas Activas de Stock Bajo")
                 
-                alertas_activas = []
-                
-                for ingrediente in ingredientes:
-                    ingrediente_id = ingrediente['_id']
-                    stock_actual = ingrediente.get('cantidad', 0)
-                    
-                    if ingrediente_id in alertas_actuales:
-                        minimo = alertas_actuales[ingrediente_id].get('minimo', 10)
-                        nombre = ingrediente.get('descripcion', 'Sin nombre')
-                        unidad = ingrediente.get('unidad', 'unidad')
-                        
-                        if stock_actual <= minimo:
-                            alertas_activas.append({
-                                'nombre': nombre,
-                                'stock_actual': stock_actual,
-                                'stock_minimo': minimo,
-                                'unidad': unidad,
-                                'critico': stock_actual == 0
-                            })
+                # Alertas vigentes mantenidas por cada movimiento de inventario (sin recorrer ingredientes)
+                alertas_activas = [
+                    {
+                        'nombre': alerta['nombre'],
+                        'stock_actual': alerta['cantidad'],
+                        'stock_minimo': alerta['limite_configurado'],
+                        'unidad': alerta['unidad'],
+                        'critico': alerta['cantidad'] == 0
+                    }
+                    for alerta in couchdb_utils.verificar_alertas_stock_bajo(db)
+                    if alerta['tipo'] != 'error'
+                ]
 
                 if alertas_activas:
                     # Separar alertas críticas (stock 0) de las normales
@@ -416,6 +406,97 @@ if 'usuario' in st.session_state:
                 </div>
                 """, unsafe_allow_html=True)
 
+        # === TAB IMPRESORA TÉRMICA ===
+        with tab_impresora:
+            st.markdown("""
+            <div class="config-card">
+                <h3>🖨️ Impresora Térmica (ESC/POS)</h3>
+                <p>Los tickets de cobro, órdenes enviadas a caja y cierres se imprimen directamente en la impresora
+                de 80 mm; el PDF se sigue generando como archivo del documento.</p>
+            </div>
+            """, unsafe_allow_html=True)
+
+            impresora = configuracion.get('impresora_termica', {})
+            impresora_activa = st.checkbox("Imprimir tickets en la impresora térmica", value=impresora.get('activa', False))
+            destino_impresora = st.text_input(
+                "Destino:",
+                value=impresora.get('destino', ''),
+                placeholder="/dev/usb/lp0",
+                help="Dispositivo local (/dev/usb/lp0), impresora de red (tcp://192.168.1.50:9100) o un directorio de cola"
+            )
+
+            col_guardar_imp, col_prueba_imp = st.columns([1, 1])
+            with col_guardar_imp:
+                if st.button("💾 Guardar Impresora", type="primary", use_container_width=True):
+                    configuracion['impresora_termica'] = {'activa': impresora_activa, 'destino': destino_impresora.strip()}
+                    if guardar_configuracion(configuracion):
+                        st.success("✅ Configuración de impresora guardada exitosamente!")
+                        couchdb_utils.log_action(
+                            db,
+                            st.session_state.get('user_data', {}).get('usuario', 'Sistema'),
+                            f"Configuración actualizada - Impresora térmica: {destino_impresora.strip() or 'ninguna'} ({'activa' if impresora_activa else 'inactiva'})"
+                        )
+                        st.rerun()
+
+            with col_prueba_imp:
+                if st.button("🧾 Imprimir Ticket de Prueba", use_container_width=True):
+                    try:
+                        datos_prueba = escpos_tickets.encabezado() + b'Ticket de prueba\n' + escpos_tickets.CORTAR
+                        # Por la misma cola que los tickets, para no abrir la impresora mientras imprime otro
+                        cola_impresion = couchdb_utils.get_print_queue()
+                        envio_id = cola_impresion.enviar(datos_prueba, destino_impresora.strip())
+                        estado_envio = cola_impresion.esperar(envio_id)
+                        if estado_envio == escpos_tickets.IMPRESO:
+                            st.success(f"✅ Ticket de prueba enviado a {destino_impresora.strip()}")
+                        elif estado_envio == escpos_tickets.ERROR:
+                            st.error(f"❌ No se pudo imprimir: {cola_impresion.error(envio_id)}")
+                        else:
+                            st.warning("⏳ La impresora no respondió a tiempo; el ticket sigue en cola.")
+                    except Exception as e:
+                        st.error(f"❌ No se pudo imprimir: {e}")
+
+        # === TAB ÍNDICES ===
+        with tab_indices:
+            st.markdown(f"""
+            <div class="config-card">
+                <h3>🗂️ Vistas e Índices de la Base de Datos</h3>
+                <p>Versión de esquema esperada: <strong>{db_bootstrap.SCHEMA_VERSION}</strong>.
+                Las vistas e índices se instalan automáticamente al conectar.</p>
+            </div>
+            """, unsafe_allow_html=True)
+
+            try:
+                tareas = db_bootstrap.progreso_indices(couchdb_utils.get_couchdb_server(), db.name)
+                if tareas:
+                    for tarea in tareas:
+                        st.progress(
+                            min(int(tarea['progreso']), 100),
+                            text=f"{tarea['design_document']}: {tarea['changes_done']}/{tarea['total_changes']} cambios"
+                        )
+                else:
+                    st.success("✅ Todos los índices están construidos.")
+            except Exception as e:
+                st.warning(f"No se pudo consultar el progreso de los índices: {e}")
+
+            if st.button("🔄 Reinstalar Vistas e Índices", type="secondary"):
+                try:
+                    resultados_ddocs, resultados_indices, resultados_migraciones = db_bootstrap.instalar_esquema(db)
+                    for ddoc_id, accion in resultados_ddocs:
+                        st.write(f"• {ddoc_id}: {accion}")
+                    for nombre, resultado in resultados_indices:
+                        st.write(f"• Índice {nombre}: {resultado}")
+                    for nombre, resultado in resultados_migraciones:
+                        st.write(f"• Migración {nombre}: {resultado}")
+                    for nombre, error in db_bootstrap.migraciones_fallidas(db):
+                        st.error(f"❌ La migración '{nombre}' falló ({error}); el esquema no se registró como instalado.")
+                    couchdb_utils.log_action(
+                        db,
+                        st.session_state.get('user_data', {}).get('usuario', 'Sistema'),
+                        f"Vistas e índices reinstalados (esquema v{db_bootstrap.SCHEMA_VERSION})"
+                    )
+                except Exception as e:
+                    st.error(f"Error al instalar vistas e índices: {e}")
+
     else:
         st.error("❌ No se pudo conectar a la base de datos.")
 
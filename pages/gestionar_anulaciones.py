@@ -79,8 +79,8 @@ if 'usuario' in st.session_state:
             """, unsafe_allow_html=True)
         all_solicitudes = couchdb_utils.get_documents_by_partition(db, "anulaciones")
         ordenes = {o['_id']: o for o in couchdb_utils.get_documents_by_partition(db, "ordenes")}
-        mesas = {m['_id']: m for m in couchdb_utils.get_documents_by_partition(db, "mesas")}
-        meseros = {m['_id']: m for m in couchdb_utils.get_documents_by_partition(db, "Usuario") if m.get('id_rol') == 3}
+        mesas = {m['_id']: m for m in couchdb_utils.get_catalog_documents(db, "mesas")}
+        meseros = {m['_id']: m for m in couchdb_utils.get_catalog_documents(db, "Usuario") if m.get('id_rol') == 3}
         
         # --- Pestañas ---
         tab_pendientes, tab_ordenes, tab_historial = st.tabs(["🕒 Anulaciones Productos", "🗑️ Anulaciones Órdenes", "📋 Historial"])
@@ -131,7 +131,6 @@ if 'usuario' in st.session_state:
                         new_ingrediente_doc = {
                             "_id": doc_id,
                             "descripcion": new_ingrediente_descripcion,
-                            "cantidad": float(new_ingrediente_cantidad),
                             "unidad": new_ingrediente_unidad,
                             "imagen": new_ingrediente_imagen,
                             "activo": 1 if new_ingrediente_activo else 0,
@@ -144,6 +143,14 @@ if 'usuario' in st.session_state:
                             
                             # LOGGING
                             logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
+                            
+                            # La cantidad inicial entra al inventario como movimiento
+                            if new_ingrediente_cantidad > 0:
+                                ok, resultado = couchdb_utils.ajustar_stock_inventario(
+                                    db, doc_id, new_ingrediente_cantidad, logged_in_user, "Inventario inicial"
+                                )
+                                if not ok:
+                                    st.error(f"Error al registrar la cantidad inicial: {resultado}")
                             couchdb_utils.log_action(db, logged_in_user, f"Ingrediente '{new_ingrediente_descripcion}' agregado satisfactoriamente.")
                             
                             st.rerun()
@@ -169,6 +176,7 @@ if 'usuario' in st.session_state:
                 st.rerun()
 
         all_ingredientes_raw = couchdb_utils.get_documents_by_partition(db, CURRENT_PARTITION_KEY)
+        stocks = couchdb_utils.get_stocks(db)  # Stock por ingrediente desde el libro de inventario
         
         active_ingredientes = [
             item for item in all_ingredientes_raw 
@@ -201,7 +209,7 @@ if 'usuario' in st.session_state:
                         min_value=0.0,
                         step=0.1,
                         format="%.2f",
-                        value=float(ingrediente_to_edit.get("cantidad", 0.0)),
+                        value=st.session_state.edit_ingrediente_cantidad_mostrada,
                         key="edit_ingrediente_cantidad"
                     )
                     
@@ -233,7 +241,6 @@ if 'usuario' in st.session_state:
                             "_id": ingrediente_to_edit["_id"],
                             "_rev": ingrediente_to_edit["_rev"],
                             "descripcion": edited_descripcion,
-                            "cantidad": float(edited_cantidad),
                             "unidad": edited_unidad,
                             "imagen": edited_imagen,
                             "activo": 1 if edited_activo else 0,
@@ -246,6 +253,16 @@ if 'usuario' in st.session_state:
                             st.success(f"Ingrediente '{edited_descripcion}' actualizado exitosamente.")
                             
                             logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
+                            
+                            # Solo si el usuario cambió la cantidad, se registra como ajuste la diferencia con la
+                            # cantidad mostrada al abrir el formulario (no con el stock actual, que pudo cambiar por ventas)
+                            diferencia = edited_cantidad - st.session_state.edit_ingrediente_cantidad_mostrada
+                            if abs(diferencia) > 1e-9:
+                                ok, resultado = couchdb_utils.registrar_ajuste_inventario(
+                                    db, updated_doc["_id"], diferencia, logged_in_user
+                                )
+                                if not ok:
+                                    st.error(f"Error al ajustar el inventario: {resultado}")
                             couchdb_utils.log_action(db, logged_in_user, f"Ingrediente '{edited_descripcion}' actualizado satisfactoriamente.")
 
                             st.session_state.selected_ingrediente_doc = None
@@ -264,7 +281,6 @@ if 'usuario' in st.session_state:
                             "_id": ingrediente_to_edit["_id"],
                             "_rev": ingrediente_to_edit["_rev"],
                             "descripcion": ingrediente_to_edit["descripcion"],
-                            "cantidad": ingrediente_to_edit.get("cantidad", 0.0),
                             "unidad": ingrediente_to_edit["unidad"],
                             "imagen": ingrediente_to_edit.get("imagen", ""),
                             "activo": 0 if bool(ingrediente_to_edit.get("activo", 0)) else 1,
@@ -289,6 +305,8 @@ if 'usuario' in st.session_state:
         # Función para manejar el clic en el botón "Editar"
         def on_edit_button_click(ingrediente_doc):
             st.session_state.selected_ingrediente_doc = ingrediente_doc
+            # Cantidad que muestra el formulario (se fija al abrirlo)
+            st.session_state.edit_ingrediente_cantidad_mostrada = max(float(couchdb_utils.get_stock(db, ingrediente_doc["_id"])), 0.0)
             st.session_state.show_edit_ingrediente_dialog = True
             st.rerun()
 
@@ -322,10 +340,10 @@ if 'usuario' in st.session_state:
                     # with col_cantidad:
                     #     st.write(f"{ingrediente.get('cantidad', 0.0):.2f}")
                     with col_cantidad:
-                        st.write(f"{ingrediente.get('cantidad', 0.0):.2f} {ingrediente.get('unidad', '')}")
+                        st.write(f"{stocks.get(ingrediente['_id'], 0.0):.2f} {ingrediente.get('unidad', '')}")
                         # Mostrar conversión solo si aplica
                         if ingrediente.get('unidad') in UNIDAD_CONVERSION:
-                            shots = convertir_a_shots(ingrediente.get('cantidad', 0.0), ingrediente.get('unidad', ''))
+                            shots = convertir_a_shots(stocks.get(ingrediente['_id'], 0.0), ingrediente.get('unidad', ''))
                             st.caption(f"({shots:.2f} shots)")
                     with col_unidad:
                         st.write(ingrediente.get('unidad', 'N/A'))
@@ -375,10 +393,10 @@ if 'usuario' in st.session_state:
                     # with col_cantidad:
                     #     st.write(f"{ingrediente.get('cantidad', 0.0):.2f}")
                     with col_cantidad:
-                        st.write(f"{ingrediente.get('cantidad', 0.0):.2f} {ingrediente.get('unidad', '')}")
+                        st.write(f"{stocks.get(ingrediente['_id'], 0.0):.2f} {ingrediente.get('unidad', '')}")
                         # Mostrar conversión solo si aplica
                         if ingrediente.get('unidad') in UNIDAD_CONVERSION:
-                            shots = convertir_a_shots(ingrediente.get('cantidad', 0.0), ingrediente.get('unidad', ''))
+                            shots = convertir_a_shots(stocks.get(ingrediente['_id'], 0.0), ingrediente.get('unidad', ''))
                             st.caption(f"({shots:.2f} shots)")
                     with col_unidad:
                         st.write(ingrediente.get('unidad', 'N/A'))
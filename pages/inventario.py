@@ -2,13 +2,18 @@
 import streamlit as st
 import couchdb_utils
 import os
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta, time
 import pandas as pd
+import pytz
 import uuid
 
 # Configuración básica
 archivo_actual_relativo = os.path.join(os.path.basename(os.path.dirname(__file__)), os.path.basename(__file__))
 CURRENT_PARTITION_KEY = "inventario"
+
+# Días que muestra el historial de movimientos por defecto y máximo de movimientos por consulta
+HISTORIAL_DIAS = 7
+HISTORIAL_MAX = 1000
 couchdb_utils.generarLogin(archivo_actual_relativo)
 st.set_page_config(layout="wide", page_title="Gestión de Inventario", page_icon="../assets/LOGO.png")
 
@@ -43,19 +48,31 @@ if 'usuario' in st.session_state:
     if db:
         # --- Funciones auxiliares ---
         def get_ingredientes_activos():
-            ingredientes = couchdb_utils.get_documents_by_partition(db, "ingredientes")
+            ingredientes = couchdb_utils.get_catalog_documents(db, "ingredientes")
             return [i for i in ingredientes if i.get('activo', 0) == 1]
         
-        def get_movimientos_inventario():
-            return couchdb_utils.get_documents_by_partition(db, CURRENT_PARTITION_KEY)
+        def get_movimientos_inventario(desde, hasta, ingrediente_id=None, tipo=None):
+            # Filtro en CouchDB (índices por fecha_creacion e ingrediente_id) en lugar de descargar toda la partición;
+            # desde y hasta son fechas locales, ambas inclusive
+            zona = pytz.timezone('America/El_Salvador')
+            inicio = zona.localize(datetime.combine(desde, time.min)).astimezone(timezone.utc)
+            fin = zona.localize(datetime.combine(hasta + timedelta(days=1), time.min)).astimezone(timezone.utc)
+            selector = {"fecha_creacion": {"$gte": inicio.isoformat(), "$lt": fin.isoformat()}}
+            if ingrediente_id:
+                selector["ingrediente_id"] = ingrediente_id
+            if tipo:
+                selector["tipo"] = tipo
+            try:
+                # Los más recientes primero (índice 'fecha_creacion'): si se alcanza el límite, se omiten los más viejos
+                return couchdb_utils.find_in_partition(
+                    db, CURRENT_PARTITION_KEY, selector, sort=[{"fecha_creacion": "desc"}], limit=HISTORIAL_MAX
+                )
+            except Exception as e:
+                st.error(f"Error al obtener movimientos de inventario: {str(e)}")
+                return []
         
-        def get_stock_actual(ingrediente_id):
-            movimientos = get_movimientos_inventario()
-            stock = 0
-            for mov in movimientos:
-                if mov.get('ingrediente_id') == ingrediente_id:
-                    stock += mov.get('cantidad', 0)
-            return stock
+        # Stock de todos los ingredientes en una sola lectura (libro de inventario / vista _sum)
+        stocks = couchdb_utils.get_stocks(db)
         
         # --- Sección de Entradas/Salidas ---
         st.title("📦 Gestión de Inventario")
@@ -69,6 +86,12 @@ if 'usuario' in st.session_state:
             st.subheader("Historial de Movimientos")
             
             # Filtros
+            hoy_local = datetime.now(pytz.timezone('America/El_Salvador')).date()
+            col_desde, col_hasta = st.columns(2)
+            with col_desde:
+                filtro_desde = st.date_input("Desde:", value=hoy_local - timedelta(days=HISTORIAL_DIAS - 1), key="movimientos_desde")
+            with col_hasta:
+                filtro_hasta = st.date_input("Hasta:", value=hoy_local, key="movimientos_hasta")
             col1, col2 = st.columns(2)
             with col1:
                 ingredientes = get_ingredientes_activos()
@@ -86,11 +109,15 @@ if 'usuario' in st.session_state:
                 )
             
             # Obtener movimientos filtrados
-            movimientos = get_movimientos_inventario()
-            if ingrediente_filtro != "Todos":
-                movimientos = [m for m in movimientos if m.get('ingrediente_id') == ingrediente_filtro]
-            if tipo_filtro != "Todos":
-                movimientos = [m for m in movimientos if m.get('tipo') == tipo_filtro]
+            movimientos = get_movimientos_inventario(
+                filtro_desde,
+                filtro_hasta,
+                None if ingrediente_filtro == "Todos" else ingrediente_filtro,
+                None if tipo_filtro == "Todos" else tipo_filtro
+            )
+            if len(movimientos) >= HISTORIAL_MAX:
+                st.warning(f"Se muestran solo los {HISTORIAL_MAX} movimientos más recientes; acote el rango de fechas o filtre por ingrediente.")
+            ingredientes_por_id = {i['_id']: i for i in ingredientes}
             
             # Mostrar tabla de movimientos
             if movimientos:
@@ -98,7 +125,7 @@ if 'usuario' in st.session_state:
                 for mov in movimientos:
                     # Para movimientos de ingredientes
                     if mov.get('ingrediente_id'):
-                        ingrediente = next((i for i in ingredientes if i['_id'] == mov.get('ingrediente_id')), None)
+                        ingrediente = ingredientes_por_id.get(mov.get('ingrediente_id'))
                         item_name = ingrediente.get('descripcion', 'N/A') if ingrediente else 'N/A'
                         unidad = ingrediente.get('unidad', 'unidad') if ingrediente else 'unidad'
                     # Para movimientos de platos (ventas)
@@ -188,6 +215,7 @@ if 'usuario' in st.session_state:
                         
                         try:
                             db.save(movimiento)
+                            couchdb_utils.registrar_movimientos_inventario(db, [movimiento])
                             st.success("✅ Entrada registrada correctamente!")
                             st.balloons()
                             
@@ -215,7 +243,7 @@ if 'usuario' in st.session_state:
                     # Selección de ingrediente con stock disponible
                     ingredientes_con_stock = []
                     for i in ingredientes:
-                        stock = get_stock_actual(i['_id'])
+                        stock = stocks.get(i['_id'], 0)
                         if stock > 0:
                             ingredientes_con_stock.append({
                                 'id': i['_id'],
@@ -267,6 +295,7 @@ if 'usuario' in st.session_state:
                         
                         try:
                             db.save(movimiento)
+                            couchdb_utils.registrar_movimientos_inventario(db, [movimiento])
                             st.success("✅ Salida registrada correctamente!")
                             
                             # Logging
@@ -287,10 +316,11 @@ if 'usuario' in st.session_state:
         st.subheader("📊 Resumen de Inventario")
         
         ingredientes = get_ingredientes_activos()
+        stocks = couchdb_utils.get_stocks(db)  # Incluye una entrada o salida registrada en esta ejecución
         if ingredientes:
             data = []
             for ingrediente in ingredientes:
-                stock = get_stock_actual(ingrediente['_id'])
+                stock = stocks.get(ingrediente['_id'], 0)
                 data.append({
                     'Ingrediente': ingrediente.get('descripcion', 'Sin descripción'),
                     'Stock Actual': stock,
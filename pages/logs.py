@@ -40,68 +40,17 @@ if 'usuario' in st.session_state:
             # Usar fecha local + 1 día para asegurar que incluya logs de hoy
             end_date = st.date_input("Fecha Fin:", value=fecha_local_hoy + timedelta(days=1), key="log_end_date")
 
-        # Convertir las fechas de entrada a objetos datetime con zona horaria UTC
-        # La fecha de inicio se establece al principio del día
-        start_datetime_utc = datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc)
-        # La fecha de fin se establece al final del día (23:59:59.999999)
-        end_datetime_utc = datetime.combine(end_date, datetime.max.time(), tzinfo=timezone.utc)
-
-
-
-        all_logs_raw = couchdb_utils.get_documents_by_partition(db, couchdb_utils.LOGS_PARTITION_KEY)
-        
-        # Ordenar logs por fecha antes del filtrado (más reciente primero)
-        def get_log_datetime(log):
-            try:
-                fecha_str = log.get('fecha', '')
-                if fecha_str.endswith('Z'):
-                    fecha_str = fecha_str[:-1]
-                return datetime.fromisoformat(fecha_str)
-            except:
-                return datetime.min
-        
-        all_logs_raw.sort(key=get_log_datetime, reverse=True)
-
-        filtered_logs = []
-        for log in all_logs_raw:
-            log_usuario = (log.get('usuario') or '').lower()
-            log_fecha_str = log.get('fecha')
-
-            # Filtrar por usuario
-            user_match = (not filter_user_log) or (log_usuario == filter_user_log.lower())
-
-            # Filtrar por fecha
-            date_match = True
-            if log_fecha_str:
-                try:
-                    # Clean the date string for robust parsing
-                    # Handle the problematic '+00:00Z' format and simple 'Z'
-                    clean_log_fecha_str = log_fecha_str
-                    if log_fecha_str.endswith('+00:00Z'):
-                        clean_log_fecha_str = log_fecha_str.replace('+00:00Z', '+00:00')
-                    elif log_fecha_str.endswith('Z'):
-                        clean_log_fecha_str = log_fecha_str[:-1]
-                    
-                    log_datetime = datetime.fromisoformat(clean_log_fecha_str)
-
-                    # Ensure the datetime object is UTC for consistent comparison
-                    if log_datetime.tzinfo is None:
-                        log_datetime = log_datetime.replace(tzinfo=timezone.utc)
-                    else:
-                        log_datetime = log_datetime.astimezone(timezone.utc)
-
-                    is_after_start = (log_datetime >= start_datetime_utc)
-                    is_before_end = (log_datetime <= end_datetime_utc)
-                    date_match = is_after_start and is_before_end
-
-                except ValueError as e:
-                    st.warning(f"Error al parsear la fecha del log '{log_fecha_str}' (limpiada a '{clean_log_fecha_str}'): {e}. Este registro será omitido.")
-                    date_match = False # If parsing fails, it doesn't match the date filter
-            else:
-                date_match = False # If there's no date field, it doesn't match the date filter
-
-            if user_match and date_match:
-                filtered_logs.append(log)
+        # Resolver el usuario escrito (sin distinguir mayúsculas) al nombre exacto registrado
+        usuario_filtro = None
+        if filter_user_log:
+            usuario_filtro = next(
+                (u.get('usuario') for u in couchdb_utils.get_catalog_documents(db, couchdb_utils.PARTITION_KEY)
+                 if (u.get('usuario') or '').lower() == filter_user_log.lower()),
+                filter_user_log
+            )
+
+        # Las fechas se traducen a un rango de _id (logs:<YYYYMMDDHHMMSSmmm>-...), más recientes primero
+        filtered_logs = couchdb_utils.query_logs(db, desde=start_date, hasta=end_date, usuario=usuario_filtro)
 
 
         if filtered_logs:
@@ -204,7 +204,7 @@ def obtener_promociones_activas_clientes():
         if not db:
             return []
             
-        promociones = couchdb_utils.get_documents_by_partition(db, "promociones")
+        promociones = couchdb_utils.get_catalog_documents(db, "promociones")
         ahora = datetime.now(timezone.utc)
         
         promociones_activas = []
@@ -231,8 +231,8 @@ def verificar_promocion_activa(plato_id):
         if not db:
             return None
             
-        promociones = couchdb_utils.get_documents_by_partition(db, "promociones")
-        platos = couchdb_utils.get_documents_by_partition(db, "platos")
+        promociones = couchdb_utils.get_catalog_documents(db, "promociones")
+        platos = couchdb_utils.get_catalog_documents(db, "platos")
         ahora = datetime.now(timezone.utc)
         
         # Buscar el plato para obtener información adicional
@@ -338,8 +338,8 @@ try:
     
     if db:
         # --- Obtener datos del menú ---
-        todos_menus = get_activos(couchdb_utils.get_documents_by_partition(db, "menus"))
-        platos = get_activos(couchdb_utils.get_documents_by_partition(db, "platos"))
+        todos_menus = get_activos(couchdb_utils.get_catalog_documents(db, "menus"))
+        platos = get_activos(couchdb_utils.get_catalog_documents(db, "platos"))
         
         if not todos_menus or not platos:
             st.error("🚫 No hay menús disponibles en este momento.")
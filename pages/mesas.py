@@ -13,6 +13,8 @@ archivo_actual_relativo = os.path.join(os.path.basename(os.path.dirname(__file__
 
 # Define la clave de partición específica para esta página
 CURRENT_PARTITION_KEY = "mesas"
+# Campos que bastan para contar mesas por área (creación rápida y vista previa)
+MESA_CONTEO_FIELDS = ['area', 'activo']
 
 # Llama a la función de login/menú/validación
 couchdb_utils.generarLogin(archivo_actual_relativo)
@@ -57,7 +59,7 @@ def create_quick_mesa(db, area_seleccionada):
         st.info(f"Creando mesa en {area_seleccionada}...")
         
         # Obtener número de mesas existentes en el área
-        existing_mesas = couchdb_utils.get_documents_by_partition(db, "mesas")
+        existing_mesas = couchdb_utils.get_documents_by_partition(db, "mesas", fields=MESA_CONTEO_FIELDS)
         area_mesas = [m for m in existing_mesas if m.get('area') == area_seleccionada]
         numero_mesa = len(area_mesas) + 1
         
@@ -376,7 +378,7 @@ def render_restaurant_layout(db):
     col1, col2, col3 = st.columns(3)
     
     # Obtener conteo actual de mesas por área para mostrar en botones
-    all_current_mesas = couchdb_utils.get_documents_by_partition(db, CURRENT_PARTITION_KEY)
+    all_current_mesas = couchdb_utils.get_documents_by_partition(db, CURRENT_PARTITION_KEY, fields=MESA_CONTEO_FIELDS)
     area_counts = {}
     for mesa in all_current_mesas:
         if mesa.get('activo', 0) == 1:
@@ -486,7 +488,7 @@ def render_create_mesa_form(db):
             st.subheader("Vista Previa de Ubicación")
             
             # Obtener mesas existentes en el área
-            existing_mesas = couchdb_utils.get_documents_by_partition(db, CURRENT_PARTITION_KEY)
+            existing_mesas = couchdb_utils.get_documents_by_partition(db, CURRENT_PARTITION_KEY, fields=MESA_CONTEO_FIELDS)
             area_mesas = [dict(m) for m in existing_mesas if m.get('area') == area and m.get('activo', 0) == 1]
             
             # Calcular posición de la nueva mesa
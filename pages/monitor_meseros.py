@@ -1,6 +1,8 @@
 # pages/monitor_meseros.py
 import streamlit as st
 import couchdb_utils
+import active_orders
+import order_lifecycle
 import os
 from datetime import datetime, timezone, timedelta
 import pandas as pd
@@ -16,6 +18,9 @@ def get_estado_color(estado):
     """Retorna color según el estado de la orden"""
     colors = {
         'pendiente': '#FFA500',      # Naranja
+        'enviado_cobro': '#9370DB',  # Violeta
+        'en_cobro': '#9370DB',       # Violeta
+        'anulada': '#DC143C',        # Rojo
         'preparando': '#FFD700',     # Dorado
         'listo': '#32CD32',          # Verde lima  
         'entregado': '#4169E1',      # Azul real
@@ -29,6 +34,9 @@ def get_estado_icon(estado):
     """Retorna icono según el estado"""
     icons = {
         'pendiente': '⏳',
+        'enviado_cobro': '💳',
+        'en_cobro': '💳',
+        'anulada': '❌',
         'preparando': '👨‍🍳',
         'listo': '✅',
         'entregado': '🍽️',
@@ -85,7 +93,7 @@ def render_orden_card(orden, mesa, mesero):
     
     # Marca de agua para canceladas
     watermark = ""
-    if estado == 'cancelada':
+    if estado in ('cancelada', order_lifecycle.ANULADA):
         watermark = '''
         <div style="position: absolute; top: 50%; left: 50%; 
                     transform: translate(-50%, -50%) rotate(-45deg);
@@ -147,9 +155,8 @@ if 'usuario' in st.session_state:
         st.markdown("---")
         
         # Obtener datos
-        ordenes = couchdb_utils.get_documents_by_partition(db, "ordenes")
-        usuarios = couchdb_utils.get_documents_by_partition(db, "Usuario")
-        mesas = couchdb_utils.get_documents_by_partition(db, "mesas")
+        usuarios = couchdb_utils.get_catalog_documents(db, "Usuario")
+        mesas = couchdb_utils.get_catalog_documents(db, "mesas")
         
         # Filtrar meseros (rol 3)
         meseros = {u['_id']: u for u in usuarios if u.get('id_rol') == 3}
@@ -166,7 +173,7 @@ if 'usuario' in st.session_state:
                 selected_mesero = st.selectbox("Filtrar por mesero:", ["Todos"] + meseros_nombres)
             
             with col2:
-                estados = ['pendiente', 'preparando', 'listo', 'entregado', 'pagando', 'pagada', 'cancelada']
+                estados = order_lifecycle.ESTADOS
                 selected_estado = st.selectbox("Filtrar por estado:", ["Todos"] + estados)
             
             with col3:
@@ -188,6 +195,19 @@ if 'usuario' in st.session_state:
             elif periodo == "Última semana":
                 fecha_limite = ahora - timedelta(weeks=1)
             
+            # Estado, mesero y período se filtran en CouchDB; de cada orden solo se piden los
+            # campos de resumen y los items que muestra la tarjeta
+            selector_ordenes = {}
+            if selected_estado != "Todos":
+                selector_ordenes['estado'] = selected_estado
+            if selected_mesero != "Todos":
+                selector_ordenes['mesero_id'] = next((mid for mid, m in meseros.items() if m['nombre'] == selected_mesero), None)
+            if selected_estado != "Todos" and selected_estado not in active_orders.ESTADOS_CERRADOS:
+                # Un estado abierto se lee de la vista de órdenes activas en memoria
+                ordenes = couchdb_utils.get_active_orders(db, estados=[selected_estado], mesero_id=selector_ordenes.get('mesero_id'))
+            else:
+                ordenes = couchdb_utils.get_order_summaries(db, selector_ordenes, desde=fecha_limite, campos_extra=['items'])
+            
             ordenes_filtradas = []
             for orden in ordenes:
                 # Filtrar por fecha
@@ -219,12 +239,12 @@ if 'usuario' in st.session_state:
                 st.metric("Total Órdenes", len(ordenes_filtradas))
             
             with col_m2:
-                en_proceso = len([o for o in ordenes_filtradas if o.get('estado') in ['pendiente', 'preparando', 'listo']])
+                en_proceso = len([o for o in ordenes_filtradas if o.get('estado') in order_lifecycle.ESTADOS_ABIERTOS])
                 st.metric("En Proceso", en_proceso)
             
             with col_m3:
-                entregadas = len([o for o in ordenes_filtradas if o.get('estado') == 'entregado'])
-                st.metric("Entregadas", entregadas)
+                pagadas = len([o for o in ordenes_filtradas if o.get('estado') == order_lifecycle.PAGADA])
+                st.metric("Pagadas", pagadas)
             
             with col_m4:
                 total = sum(orden.get('total', 0) for orden in ordenes_filtradas)
@@ -325,8 +345,8 @@ if 'usuario' in st.session_state:
                         'Órdenes': data['ordenes'],
                         'Ventas': f"${data['ventas']:.2f}",
                         'Promedio': f"${data['ventas']/data['ordenes']:.2f}" if data['ordenes'] > 0 else "$0.00",
-                        'En Proceso': sum(data['estados'].get(e, 0) for e in ['preparando', 'listo']),
-                        'Entregadas': data['estados'].get('entregado', 0)
+                        'En Proceso': sum(data['estados'].get(e, 0) for e in order_lifecycle.ESTADOS_ABIERTOS),
+                        'Pagadas': data['estados'].get(order_lifecycle.PAGADA, 0)
                     })
                 
                 df = pd.DataFrame(resumen)
@@ -95,87 +95,6 @@ if 'usuario' in st.session_state:
     db = couchdb_utils.get_database_instance()
     
     if db:
-        # Funcion para obtener bebidas (reutilizando logica de bar.py)
-        def obtener_bebidas_ids():
-            platos = couchdb_utils.get_documents_by_partition(db, "platos")
-            menus = couchdb_utils.get_documents_by_partition(db, "menu")
-            
-            # Encontrar el menu "bar"
-            menu_bar = None
-            for menu in menus:
-                if menu.get('descripcion', '').lower() == 'bar':
-                    menu_bar = menu
-                    break
-            
-            bebidas_ids = []
-            
-            for plato in platos:
-                nombre = plato.get('descripcion', '')
-                categoria = plato.get('categoria', '')
-                menu_id = plato.get('menu_id', '')
-                
-                # Metodos de identificacion (en orden de prioridad):
-                es_bebida_menu = menu_bar and menu_id == menu_bar.get('_id')
-                es_bebida_categoria = any(cat in categoria.lower() for cat in ['bar', 'bebida', 'bebidas', 'drink'])
-                
-                keywords_bebidas = [
-                    'bebida', 'jugo', 'agua', 'gaseosa', 'refresco', 'cocktail', 
-                    'cerveza', 'licor', 'cafe', 'te', 'smoothie', 'cola', 'pepsi',
-                    'cuba', 'libre', 'mojito', 'pina', 'colada', 'margarita',
-                    'daiquiri', 'whisky', 'ron', 'vodka', 'tequila', 'ginebra',
-                    'sangria', 'vino', 'champagne', 'limonada', 'naranjada',
-                    'soda', 'sprite', 'fanta', 'cocacola', 'energetica', 'isotonica',
-                    'pilsener', 'pilsen', 'beer', 'lager'
-                ]
-                es_bebida_keyword = any(keyword in nombre.lower() for keyword in keywords_bebidas)
-                
-                if es_bebida_menu or es_bebida_categoria or es_bebida_keyword:
-                    bebidas_ids.append(plato['_id'])
-            
-            return bebidas_ids
-        
-        # Funcion para obtener platos de cocina (reutilizando logica de cocina.py)
-        def obtener_platos_cocina_ids():
-            platos = couchdb_utils.get_documents_by_partition(db, "platos")
-            menus = couchdb_utils.get_documents_by_partition(db, "menu")
-            
-            # Encontrar el menu "cocina"
-            menu_cocina = None
-            for menu in menus:
-                if menu.get('descripcion', '').lower() == 'cocina':
-                    menu_cocina = menu
-                    break
-            
-            platos_cocina_ids = []
-            
-            for plato in platos:
-                nombre = plato.get('descripcion', '')
-                categoria = plato.get('categoria', '')
-                menu_id = plato.get('menu_id', '')
-                
-                # Metodos de identificacion (en orden de prioridad):
-                es_plato_menu = menu_cocina and menu_id == menu_cocina.get('_id')
-                es_plato_categoria = any(cat in categoria.lower() for cat in ['cocina', 'comida', 'platos', 'food'])
-                
-                keywords_cocina = [
-                    'pollo', 'carne', 'res', 'cerdo', 'pescado', 'mariscos',
-                    'pasta', 'espagueti', 'lasagna', 'pizza', 'hamburguesa',
-                    'ensalada', 'sopa', 'sancocho', 'arroz', 'frijoles',
-                    'tacos', 'quesadilla', 'burrito', 'torta', 'sandwich',
-                    'filete', 'chuleta', 'costilla', 'camarones', 'salmon',
-                    'verduras', 'vegetales', 'guisado', 'estofado', 'asado',
-                    'frito', 'grillado', 'hornado', 'empanada', 'pupusa',
-                    'alitas', 'alita', 'wings', 'wing', 'nuggets', 'pechuga',
-                    'muslo', 'comida', 'plato', 'almuerzo', 'cena', 'desayuno',
-                    'carnita', 'carnitas', 'chicharron'
-                ]
-                es_plato_keyword = any(keyword in nombre.lower() for keyword in keywords_cocina)
-                
-                if es_plato_menu or es_plato_categoria or es_plato_keyword:
-                    platos_cocina_ids.append(plato['_id'])
-            
-            return platos_cocina_ids
-        
         # Funcion para calcular tiempo transcurrido
         def calcular_tiempo_transcurrido(fecha_creacion):
             try:
@@ -198,13 +117,12 @@ if 'usuario' in st.session_state:
         st.markdown("### Monitoreo simultaneo de bebidas y platos por orden")
         st.markdown("---")
         
-        # Obtener todas las ordenes pendientes y en cobro
-        ordenes = couchdb_utils.get_documents_by_partition(db, "ordenes")
-        ordenes_activas = [orden for orden in ordenes if orden.get('estado') in ['pendiente', 'en_cobro']]
+        # Obtener todas las ordenes pendientes y en cobro (vista compartida en memoria)
+        ordenes_activas = couchdb_utils.get_active_orders(db, estados=['pendiente', 'en_cobro'])
         
-        # Obtener IDs de bebidas y platos
-        bebidas_ids = obtener_bebidas_ids()
-        platos_cocina_ids = obtener_platos_cocina_ids()
+        # IDs de bebidas y platos (indice de ruteo precalculado)
+        bebidas_ids = couchdb_utils.get_station_dish_ids(db, "bar")
+        platos_cocina_ids = couchdb_utils.get_station_dish_ids(db, "cocina")
         
         # Procesar ordenes para separar en proceso y completadas
         ordenes_en_proceso = []
@@ -1,6 +1,8 @@
 # pages/ordenar.py
 import streamlit as st
 import couchdb_utils
+import dispatch_events
+import order_lifecycle
 import os
 from datetime import datetime, timezone
 import uuid
@@ -61,9 +63,9 @@ if 'usuario' in st.session_state:
             return [doc for doc in docs if doc.get('activo', 0) == 1]
         meseros = couchdb_utils.get_users_by_role(db, 3)
         # meseros = [doc for doc in couchdb_utils.get_documents_by_partition(db, "usuario") if doc.get('id_rol') == 3]
-        mesas = get_activos(couchdb_utils.get_documents_by_partition(db, "mesas"))
-        menus = get_activos(couchdb_utils.get_documents_by_partition(db, "menus"))
-        platos = get_activos(couchdb_utils.get_documents_by_partition(db, "platos"))
+        mesas = get_activos(couchdb_utils.get_catalog_documents(db, "mesas"))
+        menus = get_activos(couchdb_utils.get_catalog_documents(db, "menus"))
+        platos = get_activos(couchdb_utils.get_catalog_documents(db, "platos"))
         
         # --- Crear estructuras de relación ---
         menu_dict = {menu['_id']: menu for menu in menus}
@@ -198,6 +200,8 @@ if 'usuario' in st.session_state:
             
             if st.button("➕ Agregar a la Orden", type="primary"):
                 nuevo_item = {
+                    'id': dispatch_events.nuevo_item_id(),
+                    'fecha_agregado': datetime.now(timezone.utc).isoformat(),
                     'plato_id': plato['_id'],
                     'nombre': plato.get('descripcion', 'Plato'),
                     'precio_unitario': precio,
@@ -288,12 +292,12 @@ with expander_carrito:
                             orden_doc = {
                                 "_id": f"{CURRENT_PARTITION_KEY}:{str(uuid.uuid4())}",
                                 "type": CURRENT_PARTITION_KEY,
-                                "numero_orden": st.session_state.orden_actual['numero_orden'],
+                                "numero_orden": couchdb_utils.asignar_numero_orden(db),
                                 "mesa_id": st.session_state.orden_actual['mesa'],
                                 "mesero_id": st.session_state.orden_actual['mesero'],
                                 "items": st.session_state.orden_actual['items'],
                                 "comentarios": st.session_state.orden_actual.get('comentarios', ''),
-                                "estado": "pendiente",
+                                **order_lifecycle.campos_orden_nueva(st.session_state.get('user_data', {}).get('usuario')),
                                 "fecha_creacion": datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
                                 "total": sum(item['precio_unitario'] * item['cantidad'] for item in st.session_state.orden_actual['items'])
                             }
@@ -301,6 +305,7 @@ with expander_carrito:
                             try:
                                 # Guardar en la base de datos
                                 db.save(orden_doc)
+                                couchdb_utils.registrar_orden_activa(db, orden_doc)
                                 
                                 # Mostrar confirmación
                                 st.success(f"✅ Orden #{orden_doc['numero_orden']} enviada a cocina exitosamente!")
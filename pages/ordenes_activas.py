@@ -1,10 +1,12 @@
 # pages/ordenes_activas.py
 import streamlit as st
 import couchdb_utils
+import dispatch_events
+import escpos_tickets
+import order_lifecycle
 import os
 from datetime import datetime, timezone
 import uuid
-import base64
 
 # Configuración básica
 archivo_actual_relativo = os.path.join(os.path.basename(os.path.dirname(__file__)), os.path.basename(__file__))
@@ -63,98 +65,9 @@ if 'usuario' in st.session_state:
         # Limpieza automática de estados inconsistentes
         if 'orden_editar' in st.session_state and st.session_state.orden_editar is None:
             del st.session_state.orden_editar
-        # --- Funciones para detectar tipos de items ---
-        def obtener_bebidas_ids():
-            platos = couchdb_utils.get_documents_by_partition(db, "platos")
-            menus = couchdb_utils.get_documents_by_partition(db, "menu")
-            
-            # Encontrar el menú "bar"
-            menu_bar = None
-            for menu in menus:
-                if menu.get('descripcion', '').lower() == 'bar':
-                    menu_bar = menu
-                    break
-            
-            bebidas_ids = []
-            
-            for plato in platos:
-                nombre = plato.get('descripcion', '')
-                categoria = plato.get('categoria', '')
-                menu_id = plato.get('menu_id', '')
-                
-                # Detectar por menú "bar" (PRIORITARIO)
-                es_bebida_menu = False
-                if menu_bar and menu_id == menu_bar.get('_id'):
-                    es_bebida_menu = True
-                
-                # Detectar por categoría
-                es_bebida_categoria = any(cat in categoria.lower() for cat in ['bar', 'bebida', 'bebidas', 'drink'])
-                
-                # Detectar por palabras clave (fallback)
-                keywords_bebidas = [
-                    'bebida', 'jugo', 'agua', 'gaseosa', 'refresco', 'cocktail', 
-                    'cerveza', 'licor', 'café', 'té', 'smoothie', 'cola', 'pepsi',
-                    'cuba', 'libre', 'mojito', 'piña', 'colada', 'margarita',
-                    'daiquiri', 'whisky', 'ron', 'vodka', 'tequila', 'ginebra',
-                    'sangria', 'vino', 'champagne', 'limonada', 'naranjada',
-                    'soda', 'sprite', 'fanta', 'cocacola', 'energética', 'isotónica',
-                    'pilsener', 'pilsen', 'beer', 'lager'
-                ]
-                es_bebida_keyword = any(keyword in nombre.lower() for keyword in keywords_bebidas)
-                
-                if es_bebida_menu or es_bebida_categoria or es_bebida_keyword:
-                    bebidas_ids.append(plato['_id'])
-            
-            return bebidas_ids
-
-        def obtener_platos_cocina_ids():
-            platos = couchdb_utils.get_documents_by_partition(db, "platos")
-            menus = couchdb_utils.get_documents_by_partition(db, "menu")
-            
-            # Encontrar el menú "cocina"
-            menu_cocina = None
-            for menu in menus:
-                if menu.get('descripcion', '').lower() == 'cocina':
-                    menu_cocina = menu
-                    break
-            
-            platos_cocina_ids = []
-            
-            for plato in platos:
-                nombre = plato.get('descripcion', '')
-                categoria = plato.get('categoria', '')
-                menu_id = plato.get('menu_id', '')
-                
-                # Detectar por menú "cocina" (PRIORITARIO)
-                es_plato_menu = False
-                if menu_cocina and menu_id == menu_cocina.get('_id'):
-                    es_plato_menu = True
-                
-                # Detectar por categoría
-                es_plato_categoria = any(cat in categoria.lower() for cat in ['cocina', 'comida', 'platos', 'food'])
-                
-                # Detectar por palabras clave (fallback)
-                keywords_cocina = [
-                    'pollo', 'carne', 'res', 'cerdo', 'pescado', 'mariscos',
-                    'pasta', 'espagueti', 'lasagna', 'pizza', 'hamburguesa',
-                    'ensalada', 'sopa', 'sancocho', 'arroz', 'frijoles',
-                    'tacos', 'quesadilla', 'burrito', 'torta', 'sandwich',
-                    'filete', 'chuleta', 'costilla', 'camarones', 'salmon',
-                    'verduras', 'vegetales', 'guisado', 'estofado', 'asado',
-                    'frito', 'grillado', 'hornado', 'empanada', 'pupusa',
-                    'alitas', 'alita', 'wings', 'wing', 'nuggets', 'pechuga',
-                    'muslo', 'comida', 'plato', 'almuerzo', 'cena', 'desayuno',
-                    'carnita', 'carnitas', 'chicharron'
-                ]
-                es_plato_keyword = any(keyword in nombre.lower() for keyword in keywords_cocina)
-                
-                if es_plato_menu or es_plato_categoria or es_plato_keyword:
-                    platos_cocina_ids.append(plato['_id'])
-            
-            return platos_cocina_ids
-
-        bebidas_ids = obtener_bebidas_ids()
-        platos_cocina_ids = obtener_platos_cocina_ids()
+        # --- IDs de bebidas y platos de cocina (índice de ruteo precalculado) ---
+        bebidas_ids = couchdb_utils.get_station_dish_ids(db, "bar")
+        platos_cocina_ids = couchdb_utils.get_station_dish_ids(db, "cocina")
 
         # --- Obtener información del usuario logueado ---
         user_data = st.session_state.get('user_data', {})
@@ -162,46 +75,29 @@ if 'usuario' in st.session_state:
         user_id = user_data.get('_id')
 
         # --- Obtener datos ---
-        todas_ordenes = couchdb_utils.get_documents_by_partition(db, "ordenes")
-        
-        # Filtrar ordenes segun el rol del usuario
+        # Ordenes pendientes desde la vista compartida en memoria (se omite la que se está editando)
         orden_editar_id = st.session_state.get('orden_editar', {}).get('_id') if st.session_state.get('orden_editar') else None
         
         if user_role == 3:
             # Para meseros (rol 3): solo mostrar sus propias ordenes
-            ordenes_pendientes = [doc for doc in todas_ordenes 
-                                if doc.get('estado') == 'pendiente' and 
-                                doc.get('mesero_id') == user_id and
-                                (not orden_editar_id or doc['_id'] != orden_editar_id)]
+            ordenes_pendientes = couchdb_utils.get_active_orders(db, estados=['pendiente'], mesero_id=user_id)
         else:
             # Para otros roles: mostrar todas las ordenes pendientes
-            ordenes_pendientes = [doc for doc in todas_ordenes 
-                                if doc.get('estado') == 'pendiente' and 
-                                (not orden_editar_id or doc['_id'] != orden_editar_id)]
+            ordenes_pendientes = couchdb_utils.get_active_orders(db, estados=['pendiente'])
+        ordenes_pendientes = [doc for doc in ordenes_pendientes if not orden_editar_id or doc['_id'] != orden_editar_id]
         
         # Obtener datos necesarios
-        mesas = {m['_id']: m for m in couchdb_utils.get_documents_by_partition(db, "mesas")}
+        mesas = {m['_id']: m for m in couchdb_utils.get_catalog_documents(db, "mesas")}
         # Obtener todos los usuarios y filtrar meseros (rol 3)
-        todos_usuarios = couchdb_utils.get_documents_by_partition(db, "Usuario")
+        todos_usuarios = couchdb_utils.get_catalog_documents(db, "Usuario")
         meseros = {m['_id']: m for m in todos_usuarios if m.get('id_rol') == 3}
         
-        # --- Display PDF and Download Button if a ticket was just processed ---
+        # --- Mostrar la orden recién enviada a cobro (el PDF se genera en segundo plano) ---
         if st.session_state.get('just_processed_ticket_display') is not None:
-            info = st.session_state.pop('just_processed_ticket_display')
-            st.success(info['message'])
-            
-            st.download_button(
-                label="📄 Descargar Orden en PDF",
-                data=info['pdf_data'],
-                file_name=info['file_name'],
-                mime="application/pdf"
-            )
-            
-            # Optional: Display PDF directly using base64
-            base64_pdf = base64.b64encode(info['pdf_data']).decode('utf-8')
-            pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="800" type="application/pdf" style="border: none;"></iframe>'
-            st.markdown(pdf_display, unsafe_allow_html=True)
+            couchdb_utils.mostrar_pdf_encolado(db, 'just_processed_ticket_display', "📄 Descargar Orden en PDF")
             st.markdown("---") # Add a separator after displaying PDF
+        # Resultado de los tickets enviados a la impresora térmica (avisa si alguno falló)
+        couchdb_utils.mostrar_impresiones_termicas()
 
         # --- Encabezado ---
         col_title, col_refresh = st.columns([3, 1])
@@ -445,6 +341,9 @@ if 'usuario' in st.session_state:
                                                 </div>
                                                 """, unsafe_allow_html=True)
                                                 st.caption(f"   📍 Enviado al bar para preparación")
+                                                hora_listo = couchdb_utils.estimar_hora_listo(db, orden, item, "bar")
+                                                if hora_listo:
+                                                    st.caption(f"   ⏱️ Listo aprox. a las {hora_listo}")
                                         
                                         elif es_plato_cocina:
                                             # Verificar estado de despacho de plato
@@ -477,6 +376,9 @@ if 'usuario' in st.session_state:
                                                 </div>
                                                 """, unsafe_allow_html=True)
                                                 st.caption(f"   📍 Enviado a cocina para preparación")
+                                                hora_listo = couchdb_utils.estimar_hora_listo(db, orden, item, "cocina")
+                                                if hora_listo:
+                                                    st.caption(f"   ⏱️ Listo aprox. a las {hora_listo}")
                                         
                                         else:
                                             # No es bebida ni plato de cocina, mostrar normal
@@ -573,7 +475,8 @@ if 'usuario' in st.session_state:
                                 with col_active_buttons[0]:
                                     if st.button("➕ Agregar Productos", key=f"add_active_{orden['_id']}", use_container_width=True):
                                         # Load this order into the editing state and redirect to restaurant_main
-                                        st.session_state.orden_editar = orden
+                                        # (los items sin 'id' conservan su id posicional aunque se quiten otros)
+                                        st.session_state.orden_editar = dispatch_events.fijar_ids_items(orden)
                                         st.session_state.plato_seleccionado = None
                                         st.switch_page("pages/restaurant_main.py")
                                 with col_active_buttons[1]:
@@ -586,11 +489,14 @@ if 'usuario' in st.session_state:
                                             # Verificar que haya productos activos para enviar a cobro
                                             if not items_activos:
                                                 st.error("❌ No se puede enviar a cobro: todos los productos han sido anulados.")
+                                            elif not order_lifecycle.puede(orden, "enviar_cobro"):
+                                                st.error(f"❌ No se puede enviar a cobro: la orden está '{orden.get('estado')}'.")
                                             else:
                                                 # 2. Prepare ticket document with only active items
                                                 ticket_doc = {
                                                     "_id": f"tickets:{str(uuid.uuid4())}",
                                                     "type": "tickets",
+                                                    "numero_ticket": couchdb_utils.asignar_numero_ticket(db),
                                                     "orden_id": orden['_id'],
                                                     "numero_orden": orden.get('numero_orden'),
                                                     "mesa_id": orden.get('mesa_id'),
@@ -605,18 +511,29 @@ if 'usuario' in st.session_state:
                                                 db.save(ticket_doc)
                                                 
                                                 # 4. Update order status to "enviado_cobro"
-                                                orden['estado'] = 'enviado_cobro'
-                                                db.save(orden)
+                                                orden_guardada, error_estado = couchdb_utils.transicionar_orden(
+                                                    db, orden['_id'], "enviar_cobro",
+                                                    st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
+                                                )
+                                                if error_estado:
+                                                    raise RuntimeError(error_estado)
+                                                orden = orden_guardada
                                                 
-                                                # 5. Generate PDF and store in session state for display
+                                                # 5. Encolar el PDF (queda como adjunto 'orden.pdf' del ticket) sin esperar a fpdf
                                                 mesa = mesas.get(ticket_doc['mesa_id'], {})
                                                 mesero = meseros.get(ticket_doc['mesero_id'], {})
-                                                pdf_data = couchdb_utils.generar_orden_pdf(ticket_doc, orden, mesa, mesero)
+                                                handle_pdf = couchdb_utils.encolar_pdf(
+                                                    db, ticket_doc['_id'], "orden.pdf",
+                                                    couchdb_utils.generar_orden_pdf, dict(ticket_doc), orden, mesa, mesero
+                                                )
+                                                couchdb_utils.imprimir_ticket_termico(
+                                                    db, escpos_tickets.ticket_orden, dict(ticket_doc), orden, mesa, mesero
+                                                )
                                                 file_name = f"orden_{ticket_doc.get('numero_orden', 'SN')}.pdf"
                                                 
                                                 st.session_state['just_processed_ticket_display'] = {
                                                     'message': f"✅ Orden #{orden.get('numero_orden')} enviada a cobro exitosamente!",
-                                                    'pdf_data': pdf_data,
+                                                    'handle': handle_pdf,
                                                     'file_name': file_name
                                                 }
                                                 
@@ -798,7 +715,7 @@ if 'usuario' in st.session_state:
                 st.rerun()
             
             # Cargar datos frescos para la edición
-            platos = {p['_id']: p for p in couchdb_utils.get_documents_by_partition(db, "platos")}
+            platos = {p['_id']: p for p in couchdb_utils.get_catalog_documents(db, "platos")}
             platos_disponibles = [p for p in platos.values() if p.get('activo', 0) == 1]
             
             st.markdown("---")
@@ -847,6 +764,8 @@ if 'usuario' in st.session_state:
 
                 if st.button("Agregar a la Orden"):
                     nuevo_item = {
+                        'id': dispatch_events.nuevo_item_id(),
+                        'fecha_agregado': datetime.now(timezone.utc).isoformat(),
                         'plato_id': plato_obj['_id'],
                         'nombre': plato_obj.get('descripcion', 'Plato'),
                         'precio_unitario': precio,
@@ -860,6 +779,7 @@ if 'usuario' in st.session_state:
                     
                     try:
                         db.save(orden_a_editar)
+                        couchdb_utils.registrar_orden_activa(db, orden_a_editar)
                         st.success("Producto agregado a la orden!")
                         # No necesitamos borrar la sesión aquí, solo refrescar para ver el item añadido
                         st.rerun()
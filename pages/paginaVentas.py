@@ -49,6 +49,11 @@ def convert_to_local_time(utc_datetime_str):
     except Exception:
         return None
 
+def es_venta_desde(orden, fecha_local):
+    """True si la orden se pagó (o se creó, si no tiene fecha de pago) en fecha_local o después."""
+    local_dt = convert_to_local_time(orden.get('fecha_pago', orden.get('fecha_creacion')))
+    return local_dt is not None and local_dt.date() >= fecha_local
+
 # --- Funciones de Reportes ---
 def generar_reporte_excel_completo(ordenes_pagadas, ordenes_anuladas, mesas, meseros, tickets, periodo_nombre, start_date=None, end_date=None, resumen_stats=None):
     """Genera un reporte completo en Excel con órdenes pagadas, anuladas y estadísticas"""
@@ -111,7 +116,7 @@ def generar_reporte_excel_completo(ordenes_pagadas, ordenes_anuladas, mesas, mes
         mesero_nombre = meseros.get(orden.get('mesero_id'), {}).get('nombre', 'N/A')
         
         # Buscar el ticket correspondiente para obtener método de pago
-        ticket_orden = next((ticket for ticket in tickets if ticket.get('orden_id') == orden.get('_id')), {})
+        ticket_orden = tickets.get(orden.get('_id'), {})
         pago_info = ticket_orden.get('pago_info', {})
         metodo_pago = pago_info.get('metodo', 'No especificado')
         
@@ -163,7 +168,7 @@ def generar_reporte_excel_completo(ordenes_pagadas, ordenes_anuladas, mesas, mes
         fecha_str = fecha_venta.strftime('%d/%m/%Y %H:%M') if fecha_venta else 'N/A'
         
         # Buscar el ticket correspondiente para obtener método de pago
-        ticket_orden = next((ticket for ticket in tickets if ticket.get('orden_id') == orden.get('_id')), {})
+        ticket_orden = tickets.get(orden.get('_id'), {})
         pago_info = ticket_orden.get('pago_info', {})
         metodo_pago = pago_info.get('metodo', 'No especificado')
         
@@ -326,7 +331,7 @@ def generar_reporte_excel(ordenes, mesas, meseros, tickets, periodo_nombre, star
         mesero_nombre = meseros.get(orden.get('mesero_id'), {}).get('nombre', 'N/A')
         
         # Buscar el ticket correspondiente para obtener método de pago
-        ticket_orden = next((ticket for ticket in tickets if ticket.get('orden_id') == orden.get('_id')), {})
+        ticket_orden = tickets.get(orden.get('_id'), {})
         pago_info = ticket_orden.get('pago_info', {})
         metodo_pago = pago_info.get('metodo', 'No especificado')
         
@@ -391,7 +396,7 @@ def generar_reporte_excel(ordenes, mesas, meseros, tickets, periodo_nombre, star
         fecha_str = fecha_venta.strftime('%d/%m/%Y %H:%M') if fecha_venta else 'N/A'
         
         # Buscar el ticket correspondiente para obtener método de pago
-        ticket_orden = next((ticket for ticket in tickets if ticket.get('orden_id') == orden.get('_id')), {})
+        ticket_orden = tickets.get(orden.get('_id'), {})
         pago_info = ticket_orden.get('pago_info', {})
         metodo_pago = pago_info.get('metodo', 'No especificado')
         
@@ -554,7 +559,7 @@ def generar_reporte_pdf_completo(ordenes_pagadas, ordenes_anuladas, mesas, meser
             fecha_str = fecha_venta.strftime('%d/%m/%Y') if fecha_venta else 'N/A'
             mesero_nombre = meseros.get(orden.get('mesero_id'), {}).get('nombre', 'N/A')[:15]
             
-            ticket_orden = next((ticket for ticket in tickets if ticket.get('orden_id') == orden.get('_id')), {})
+            ticket_orden = tickets.get(orden.get('_id'), {})
             metodo_pago = ticket_orden.get('pago_info', {}).get('metodo', 'N/E')
             
             for item in orden.get('items', []):
@@ -686,7 +691,7 @@ def generar_reporte_pdf(ordenes, mesas, meseros, tickets, periodo_nombre, start_
         mesero_nombre = limpiar_texto_pdf(meseros.get(orden.get('mesero_id'), {}).get('nombre', 'N/A'))[:15]
         
         # Buscar el ticket correspondiente para obtener método de pago
-        ticket_orden = next((ticket for ticket in tickets if ticket.get('orden_id') == orden.get('_id')), {})
+        ticket_orden = tickets.get(orden.get('_id'), {})
         pago_info = ticket_orden.get('pago_info', {})
         metodo_pago = pago_info.get('metodo', 'N/A')
         
@@ -772,7 +777,7 @@ def generar_reporte_pdf(ordenes, mesas, meseros, tickets, periodo_nombre, start_
         fecha_str = fecha_venta.strftime('%d/%m/%Y') if fecha_venta else 'N/A'
         
         # Buscar el ticket correspondiente para obtener método de pago
-        ticket_orden = next((ticket for ticket in tickets if ticket.get('orden_id') == orden.get('_id')), {})
+        ticket_orden = tickets.get(orden.get('_id'), {})
         pago_info = ticket_orden.get('pago_info', {})
         metodo_pago = pago_info.get('metodo', 'N/A')
         
@@ -837,10 +842,21 @@ if 'usuario' in st.session_state:
         st.title("📊 Reportes de Ventas")
 
         # --- Obtener datos base ---
-        all_orders = couchdb_utils.get_documents_by_partition(db, "ordenes")
-        all_tickets = couchdb_utils.get_documents_by_partition(db, "tickets")
-        mesas = {m['_id']: m for m in couchdb_utils.get_documents_by_partition(db, "mesas")}
-        meseros = {m['_id']: m for m in couchdb_utils.get_documents_by_partition(db, "Usuario") if m.get('id_rol') == 3}
+        # Las pestañas muestran ventas del mes/semana en curso, órdenes en proceso y anuladas:
+        # se recorre la partición por páginas y las órdenes pagadas anteriores no se conservan.
+        hoy_local = datetime.now(get_timezone()).date()
+        inicio_ventas_recientes = min(hoy_local.replace(day=1), hoy_local - timedelta(days=hoy_local.weekday()))
+        all_orders = [
+            orden for orden in couchdb_utils.iter_partition(db, "ordenes")
+            if orden.get('estado') != 'pagada' or es_venta_desde(orden, inicio_ventas_recientes)
+        ]
+        # De los tickets solo se usa el método de pago: se traen solo los de las órdenes pagadas cargadas,
+        # como {orden_id: ticket}
+        all_tickets = couchdb_utils.get_tickets_por_orden(
+            db, [orden['_id'] for orden in all_orders if orden.get('estado') == 'pagada'], fields=['pago_info']
+        )
+        mesas = {m['_id']: m for m in couchdb_utils.get_catalog_documents(db, "mesas")}
+        meseros = {m['_id']: m for m in couchdb_utils.get_catalog_documents(db, "Usuario") if m.get('id_rol') == 3}
 
         # --- Layout Principal: Columnas para Pestañas y Resumen ---
         col_tabs, col_summary = st.columns([2, 1])
@@ -907,7 +923,7 @@ if 'usuario' in st.session_state:
                     st.markdown("---")
                     for orden in ordenes_pagadas_hoy:
                         # Buscar método de pago para mostrar en el título
-                        ticket_orden = next((ticket for ticket in all_tickets if ticket.get('orden_id') == orden.get('_id')), {})
+                        ticket_orden = all_tickets.get(orden.get('_id'), {})
                         pago_info = ticket_orden.get('pago_info', {})
                         metodo_pago = pago_info.get('metodo', 'No especificado')
                         
@@ -1292,9 +1308,11 @@ if 'usuario' in st.session_state:
             with col_date_end:
                 end_date = st.date_input("Fecha Fin", value=local_today)
 
-            # Filter paid orders by the selected date range
+            # Filter paid and cancelled orders by the selected date range
+            # (se recorre aparte porque el rango puede ser anterior a las órdenes de all_orders)
             ordenes_resumen = []
-            for orden in all_orders:
+            ordenes_anuladas_resumen = []
+            for orden in couchdb_utils.iter_partition(db, "ordenes", selector={"estado": {"$in": ["pagada", "anulada"]}}):
                 if orden.get('estado') == 'pagada':
                     date_to_check_str = orden.get('fecha_pago', orden.get('fecha_creacion'))
                     try:
@@ -1306,11 +1324,7 @@ if 'usuario' in st.session_state:
                                 ordenes_resumen.append(orden)
                     except:
                         continue
-            
-            # Filter cancelled orders by the selected date range
-            ordenes_anuladas_resumen = []
-            for orden in all_orders:
-                if orden.get('estado') == 'anulada':
+                elif orden.get('estado') == 'anulada':
                     date_to_check_str = orden.get('fecha_anulacion_completa', orden.get('fecha_creacion'))
                     try:
                         # Convert to local time to get the correct date
@@ -1368,8 +1382,11 @@ if 'usuario' in st.session_state:
                             'ventas_netas': total_ventas_resumen - total_perdido_anulaciones
                         }
                         
+                        tickets_resumen = couchdb_utils.get_tickets_por_orden(
+                            db, [orden['_id'] for orden in ordenes_resumen + ordenes_anuladas_resumen], fields=['pago_info']
+                        )
                         excel_data = generar_reporte_excel_completo(
-                            ordenes_resumen, ordenes_anuladas_resumen, mesas, meseros, all_tickets,
+                            ordenes_resumen, ordenes_anuladas_resumen, mesas, meseros, tickets_resumen,
                             f"Resumen de Ventas",
                             start_date, end_date,
                             resumen_stats
@@ -1394,8 +1411,11 @@ if 'usuario' in st.session_state:
                             'ventas_netas': total_ventas_resumen - total_perdido_anulaciones
                         }
                         
+                        tickets_resumen = couchdb_utils.get_tickets_por_orden(
+                            db, [orden['_id'] for orden in ordenes_resumen + ordenes_anuladas_resumen], fields=['pago_info']
+                        )
                         pdf_data = generar_reporte_pdf_completo(
-                            ordenes_resumen, ordenes_anuladas_resumen, mesas, meseros, all_tickets,
+                            ordenes_resumen, ordenes_anuladas_resumen, mesas, meseros, tickets_resumen,
                             f"Resumen de Ventas",
                             start_date, end_date,
                             resumen_stats
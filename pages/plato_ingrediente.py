@@ -53,7 +53,19 @@ if 'usuario' in st.session_state:
             return [i for i in ingredientes if i.get('activo', 0) == 1]
 
         def get_plato_ingredientes():
-            return couchdb_utils.get_documents_by_partition(db, CURRENT_PARTITION_KEY)
+            return couchdb_utils.get_catalog_documents(db, CURRENT_PARTITION_KEY)
+
+        def get_componentes(plato_id):
+            """Ingredientes activos y, como sub-recetas, los demás platos activos (la receta compilada expande las de esos platos)."""
+            componentes = get_ingredientes_activos()
+            for p in get_platos_activos():
+                if p['_id'] != plato_id:
+                    componentes.append({
+                        '_id': p['_id'],
+                        'descripcion': f"{p.get('descripcion', 'Sin descripción')} (sub-receta)",
+                        'unidad': 'plato',
+                    })
+            return componentes
 
         # Inicializar estado de la sesión
         if 'plato_seleccionado' not in st.session_state:
@@ -96,9 +108,10 @@ if 'usuario' in st.session_state:
                
                 
                 if ingredientes_existentes:
+                    componentes = get_componentes(selected_plato_id)
                     data = []
                     for rel in ingredientes_existentes:
-                        ingrediente = next((i for i in get_ingredientes_activos() if i['_id'] == rel.get('ingrediente_id')), None)
+                        ingrediente = next((i for i in componentes if i['_id'] == rel.get('ingrediente_id')), None)
                         if ingrediente:
                             data.append({
                                 'Ingrediente ID': rel.get('ingrediente_id'),
@@ -126,14 +139,14 @@ if 'usuario' in st.session_state:
             if plato_seleccionado:
                 st.subheader(f"Plato: {plato_seleccionado.get('descripcion', 'N/A')}")
                 
-                # Selección de ingredientes para agregar
-                ingredientes = get_ingredientes_activos()
+                # Selección de ingredientes (o de otros platos como sub-receta) para agregar
+                ingredientes = get_componentes(st.session_state.plato_seleccionado)
                 ingredientes_disponibles = [i for i in ingredientes if i['_id'] not in st.session_state.ingredientes_agregados['Ingrediente ID'].values]
                 
                 col3, col4, col5, col6 = st.columns([2, 2, 1, 1])
                 with col3:
                     selected_ingrediente_id = st.selectbox(
-                        "Seleccionar Ingrediente:",
+                        "Seleccionar Ingrediente o Sub-receta:",
                         options=[i['_id'] for i in ingredientes_disponibles],
                         format_func=lambda x: next((i.get('descripcion', 'Sin descripción') for i in ingredientes if i['_id'] == x), ''),
                         key="select_ingrediente"
@@ -308,14 +321,10 @@ if 'usuario' in st.session_state:
                                 st.error("No hay ingredientes para guardar")
                             else:
                                 try:
-                                    # Eliminar relaciones existentes para este plato
+                                    # Reemplazar las relaciones existentes de este plato en una sola escritura,
+                                    # para que la receta compilada nunca quede a medio actualizar
                                     relaciones_existentes = [r for r in get_plato_ingredientes() if r.get('plato_id') == st.session_state.plato_seleccionado]
-                                    for rel in relaciones_existentes:
-                                        try:
-                                            db.delete(rel)
-                                        except Exception as e:
-                                            st.error(f"Error al eliminar relación existente: {str(e)}")
-                                            continue
+                                    cambios = [dict(rel, _deleted=True) for rel in relaciones_existentes]
 
                                     # Crear nuevas relaciones
                                     success = True
@@ -328,7 +337,7 @@ if 'usuario' in st.session_state:
                                                 success = False
                                                 continue
 
-                                            nueva_relacion = {
+                                            cambios.append({
                                                 "_id": f"{CURRENT_PARTITION_KEY}:{str(uuid.uuid4())}",
                                                 "plato_id": st.session_state.plato_seleccionado,
                                                 "plato_descripcion": plato_seleccionado.get('descripcion', 'N/A'),
@@ -338,12 +347,17 @@ if 'usuario' in st.session_state:
                                                 "unidad": str(row['Unidad']),
                                                 "fecha_creacion": datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
                                                 "type": CURRENT_PARTITION_KEY
-                                            }
-                                            db.save(nueva_relacion)
+                                            })
                                         except Exception as e:
-                                            st.error(f"Error al guardar relación para ingrediente {row.get('Ingrediente ID', 'N/A')}: {str(e)}")
+                                            st.error(f"Error al preparar relación para ingrediente {row.get('Ingrediente ID', 'N/A')}: {str(e)}")
                                             success = False
 
+                                    if success:
+                                        for resultado in couchdb_utils.save_documents_bulk(db, cambios):
+                                            if not resultado['ok']:
+                                                st.error(f"Error al guardar relación {resultado['id']}: {resultado['error']}")
+                                                success = False
+
                                     if success:
                                         st.success("Relación plato-ingrediente guardada exitosamente!")
                                         
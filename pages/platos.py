@@ -12,6 +12,10 @@ archivo_actual_relativo = os.path.join(os.path.basename(os.path.dirname(__file__
 # Define la clave de partición específica para esta página
 CURRENT_PARTITION_KEY = "platos"
 
+# Opciones de estación de despacho ("Automática" deja que el ruteo la deduzca del menú, categoría o nombre)
+ESTACION_AUTOMATICA = "Automática"
+ESTACION_OPCIONES = [ESTACION_AUTOMATICA, "cocina", "bar", "otros"]
+
 # Llama a la función de login/menú/validación
 couchdb_utils.generarLogin(archivo_actual_relativo)
 
@@ -58,6 +62,7 @@ if 'usuario' in st.session_state:
                     format_func=lambda x: x,
                     key="dialog_new_plato_menu"
                 )
+                new_plato_estacion = st.selectbox("Estación de despacho:", options=ESTACION_OPCIONES, key="dialog_new_plato_estacion")
                 new_plato_usa_ingrediente = st.checkbox("Usa Ingrediente", value=True, key="dialog_new_plato_usa_ingrediente")
                 new_plato_precio_normal = st.number_input("Precio Normal:", min_value=0.0, step=0.5, key="dialog_new_plato_precio_normal")
                 new_plato_precio_oferta = st.number_input("Precio Oferta (opcional):", min_value=0.0, step=0.5, key="dialog_new_plato_precio_oferta")
@@ -86,6 +91,8 @@ if 'usuario' in st.session_state:
                             "activo": 1 if new_plato_activo else 0,
                             "fecha_creacion": datetime.now(timezone.utc).isoformat(timespec='milliseconds')
                         }
+                        if new_plato_estacion != ESTACION_AUTOMATICA:
+                            new_plato_doc["estacion"] = new_plato_estacion
                         if couchdb_utils.save_document_with_partition(db, new_plato_doc, CURRENT_PARTITION_KEY, 'descripcion'):
                             st.success(f"Plato '{new_plato_descripcion}' creado exitosamente.")
                             
@@ -172,6 +179,13 @@ if 'usuario' in st.session_state:
                     key="edit_plato_menu"
                 )
                 
+                current_estacion = plato_to_edit.get('estacion', ESTACION_AUTOMATICA)
+                edited_estacion = st.selectbox(
+                    "Estación de despacho:",
+                    options=ESTACION_OPCIONES,
+                    index=ESTACION_OPCIONES.index(current_estacion) if current_estacion in ESTACION_OPCIONES else 0,
+                    key="edit_plato_estacion"
+                )
                 edited_usa_ingrediente = st.checkbox("Usa Ingrediente", value=bool(plato_to_edit.get("usa_ingrediente", 0)), key="edit_plato_usa_ingrediente")
                 edited_precio_normal = st.number_input("Precio Normal:", min_value=0.0, step=0.5, value=float(plato_to_edit.get("precio_normal", 0)), key="edit_plato_precio_normal")
                 edited_precio_oferta = st.number_input("Precio Oferta (opcional):", min_value=0.0, step=0.5, value=float(plato_to_edit.get("precio_oferta", 0)) if plato_to_edit.get("precio_oferta") else st.number_input("Precio Oferta (opcional):", min_value=0.0, step=0.5, key="edit_plato_precio_oferta"))
@@ -193,6 +207,10 @@ if 'usuario' in st.session_state:
                     plato_to_edit["descripcion"] = edited_descripcion
                     plato_to_edit["id_menu"] = menu_options[edited_menu_name]
                     plato_to_edit["nombre_menu"] = edited_menu_name
+                    if edited_estacion == ESTACION_AUTOMATICA:
+                        plato_to_edit.pop("estacion", None)
+                    else:
+                        plato_to_edit["estacion"] = edited_estacion
                     plato_to_edit["usa_ingrediente"] = 1 if edited_usa_ingrediente else 0
                     plato_to_edit["precio_normal"] = float(edited_precio_normal)
                     plato_to_edit["precio_oferta"] = float(edited_precio_oferta) if edited_precio_oferta else None
@@ -88,6 +88,9 @@ def convert_to_local_time(utc_datetime):
     local_tz = get_timezone()
     return utc_datetime.astimezone(local_tz)
 
+# Campos de las órdenes pagadas que usan los reportes de ventas, márgenes, meseros y propinas
+ORDER_REPORT_FIELDS = ['numero_orden', 'estado', 'fecha_creacion', 'fecha_pago', 'items', 'mesa_id', 'mesero_id', 'total']
+
 def format_currency(amount):
     """Formatear cantidad como moneda"""
     return f"${amount:,.2f}"
@@ -222,10 +225,11 @@ if 'usuario' in st.session_state:
                 st.markdown('</div>', unsafe_allow_html=True)
             
             # Obtener datos de base de datos
-            all_orders = couchdb_utils.get_documents_by_partition(db, "ordenes")
-            all_mesas = couchdb_utils.get_documents_by_partition(db, "mesas")
-            all_meseros = couchdb_utils.get_documents_by_partition(db, "Usuario")
-            all_tickets = couchdb_utils.get_documents_by_partition(db, "tickets")
+            # Los reportes solo trabajan con órdenes pagadas y sus tickets cobrados
+            # Solo se descargan los campos que usan los reportes
+            all_orders = list(couchdb_utils.iter_partition(db, "ordenes", selector={"estado": "pagada"}, fields=ORDER_REPORT_FIELDS))
+            all_mesas = couchdb_utils.get_catalog_documents(db, "mesas")
+            all_meseros = couchdb_utils.get_catalog_documents(db, "Usuario")
             
             # Crear diccionarios de mapeo
             mesas_dict = {mesa['_id']: mesa for mesa in all_mesas}
@@ -247,6 +251,9 @@ if 'usuario' in st.session_state:
                         except:
                             continue
             
+            # Solo los tickets de las órdenes del período, como {orden_id: ticket} (método de pago)
+            tickets_por_orden = couchdb_utils.get_tickets_por_orden(db, [orden['_id'] for orden in filtered_orders], fields=['pago_info'])
+            
             if filtered_orders:
                 # M�tricas generales
                 st.subheader("📈 Resumen General")
@@ -277,7 +284,7 @@ if 'usuario' in st.session_state:
                     mesero_nombre = mesero_info.get('nombre', f"Mesero {order.get('mesero_id', 'N/A')}")
                     
                     # Buscar información del ticket para método de pago
-                    ticket_info = next((ticket for ticket in all_tickets if ticket.get('orden_id') == order.get('_id')), {})
+                    ticket_info = tickets_por_orden.get(order.get('_id'), {})
                     metodo_pago = ticket_info.get('pago_info', {}).get('metodo', 'No especificado')
                     
                     if show_details and 'items' in order and order['items']:
@@ -427,7 +434,7 @@ if 'usuario' in st.session_state:
                 st.markdown('</div>', unsafe_allow_html=True)
             
             # Obtener datos de platos para precios de compra
-            all_platos = couchdb_utils.get_documents_by_partition(db, "platos")
+            all_platos = couchdb_utils.get_catalog_documents(db, "platos")
             platos_dict = {plato.get('descripcion', ''): plato for plato in all_platos if plato.get('descripcion')}
             
             # Filtrar órdenes pagadas del período usando zona horaria local
@@ -871,7 +878,8 @@ if 'usuario' in st.session_state:
                 st.markdown('</div>', unsafe_allow_html=True)
             
             # Obtener datos de compras
-            all_compras = couchdb_utils.get_documents_by_partition(db, "compras")
+            # Recorrer compras por páginas; solo se conservan las del período
+            all_compras = couchdb_utils.iter_partition(db, "compras")
             
             
             filtered_compras = filter_by_date_range(all_compras, start_date_compras, end_date_compras, date_field='fecha_compra')
@@ -1000,11 +1008,14 @@ if 'usuario' in st.session_state:
             st.header(" Reporte de Inventario")
             
             # Obtener datos de inventario
-            all_inventory = couchdb_utils.get_documents_by_partition(db, "inventario")
+            # Recorrer movimientos por páginas con los campos del reporte (no se guardan los documentos)
+            all_inventory = couchdb_utils.iter_partition(
+                db, "inventario", fields=['ingrediente_id', 'fecha_creacion', 'tipo', 'cantidad', 'motivo', 'comentarios', 'usuario']
+            )
             
             # Obtener ingredientes y platos para mapear nombres
-            ingredientes = couchdb_utils.get_documents_by_partition(db, "ingredientes")
-            platos = couchdb_utils.get_documents_by_partition(db, "platos")
+            ingredientes = couchdb_utils.get_catalog_documents(db, "ingredientes")
+            platos = couchdb_utils.get_catalog_documents(db, "platos")
             
             # Crear diccionarios de mapeo
             ingredientes_dict = {ing['_id']: ing.get('descripcion', 'Ingrediente desconocido') for ing in ingredientes}
@@ -1165,7 +1176,7 @@ if 'usuario' in st.session_state:
             st.header("=d Reporte de Usuarios del Sistema")
             
             # Obtener usuarios
-            all_users = couchdb_utils.get_documents_by_partition(db, "Usuario")
+            all_users = couchdb_utils.get_catalog_documents(db, "Usuario")
             
             if all_users:
                 # Procesar datos de usuarios
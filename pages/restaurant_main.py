@@ -1,6 +1,8 @@
 # pages/restaurant_main.py (or modify pages/ordenar.py)
 import streamlit as st
 import couchdb_utils
+import dispatch_events
+import order_lifecycle
 import os
 from datetime import datetime, timezone
 import uuid
@@ -237,7 +239,7 @@ if 'usuario' in st.session_state:
             """Obtiene promociones activas para un tipo de menu especifico"""
             try:
                 from datetime import datetime, timezone
-                promociones = couchdb_utils.get_documents_by_partition(db, "promociones")
+                promociones = couchdb_utils.get_catalog_documents(db, "promociones")
                 ahora = datetime.now(timezone.utc)
                 
                 promociones_activas = []
@@ -276,7 +278,7 @@ if 'usuario' in st.session_state:
             meseros_list = couchdb_utils.get_users_by_role(db, 3)
             meseros = {m['_id']: m for m in meseros_list}
 
-            mesas_list = get_activos(couchdb_utils.get_documents_by_partition(db, "mesas"))
+            mesas_list = get_activos(couchdb_utils.get_catalog_documents(db, "mesas"))
             mesas = {m['_id']: m for m in mesas_list}
 
             # --- Mesa y Mesero Selection ---
@@ -329,7 +331,7 @@ if 'usuario' in st.session_state:
             st.subheader("🍽️ Menú de Platos")
             
             # Obtener menus y filtrar segun el rol del usuario
-            todos_menus = get_activos(couchdb_utils.get_documents_by_partition(db, "menus"))
+            todos_menus = get_activos(couchdb_utils.get_catalog_documents(db, "menus"))
             
             if user_role == 3:
                 # Para meseros (rol 3): filtrar menus de bebidas y comida
@@ -346,7 +348,7 @@ if 'usuario' in st.session_state:
                 # Para otros roles: mostrar todos los menus
                 menus = todos_menus
             
-            platos = get_activos(couchdb_utils.get_documents_by_partition(db, "platos"))
+            platos = get_activos(couchdb_utils.get_catalog_documents(db, "platos"))
             
             menu_dict = {menu['_id']: menu for menu in menus}
             plato_dict = {plato['_id']: plato for plato in platos}
@@ -500,6 +502,8 @@ if 'usuario' in st.session_state:
                                 tipo_precio = 'Oferta' if precio_oferta and precio_oferta < precio_normal else 'Normal'
                                 
                                 nuevo_item = {
+                                    'id': dispatch_events.nuevo_item_id(),
+                                    'fecha_agregado': datetime.now(timezone.utc).isoformat(),
                                     'plato_id': plato_actual['_id'],
                                     'nombre': plato_actual.get('descripcion', 'Bebida'),
                                     'precio_unitario': precio_final,
@@ -554,7 +558,7 @@ if 'usuario' in st.session_state:
                         promociones_todas = []
                         try:
                             from datetime import datetime, timezone
-                            promociones_todas = couchdb_utils.get_documents_by_partition(db, "promociones")
+                            promociones_todas = couchdb_utils.get_catalog_documents(db, "promociones")
                             st.write(f"**Total promociones en DB:** {len(promociones_todas)}")
                             if promociones_todas:
                                 st.write("**Todas las promociones:**")
@@ -749,6 +753,8 @@ if 'usuario' in st.session_state:
                                 tipo_precio = 'Oferta' if precio_oferta and precio_oferta < precio_normal else 'Normal'
                                 
                                 nuevo_item = {
+                                    'id': dispatch_events.nuevo_item_id(),
+                                    'fecha_agregado': datetime.now(timezone.utc).isoformat(),
                                     'plato_id': plato_actual['_id'],
                                     'nombre': plato_actual.get('descripcion', 'Plato'),
                                     'precio_unitario': precio_final,
@@ -915,6 +921,8 @@ if 'usuario' in st.session_state:
                     with col_add:
                         if st.button("✅ Agregar al Carrito", type="primary", key="add_promo_desplegado"):
                             nuevo_item = {
+                                'id': dispatch_events.nuevo_item_id(),
+                                'fecha_agregado': datetime.now(timezone.utc).isoformat(),
                                 'plato_id': promo_actual['_id'],
                                 'nombre': promo_actual.get('descripcion', 'Promoción'),
                                 'precio_unitario': precio_final,
@@ -996,6 +1004,8 @@ if 'usuario' in st.session_state:
                                 precio_a_usar = precio_final
                             
                             nuevo_item = {
+                                'id': dispatch_events.nuevo_item_id(),
+                                'fecha_agregado': datetime.now(timezone.utc).isoformat(),
                                 'plato_id': plato_id_real,
                                 'nombre': nombre_item,
                                 'precio_unitario': precio_a_usar,
@@ -1051,7 +1061,7 @@ if 'usuario' in st.session_state:
                 st.info(f"🆕 Nueva Orden #{current_order_display.get('numero_orden', 'N/A')}")
             
             # Definir mesas para uso en la sección del carrito
-            mesas_cart = {m['_id']: m for m in couchdb_utils.get_documents_by_partition(db, "mesas")}
+            mesas_cart = {m['_id']: m for m in couchdb_utils.get_catalog_documents(db, "mesas")}
             
             if not items_to_display:
                 st.info("El carrito está vacío. Selecciona platos del menú para agregar.")
@@ -1150,12 +1160,12 @@ if 'usuario' in st.session_state:
                                 order_to_save = {
                                     "_id": f"ordenes:{str(uuid.uuid4())}",
                                     "type": "ordenes",
-                                    "numero_orden": st.session_state.orden_actual['numero_orden'],
+                                    "numero_orden": couchdb_utils.asignar_numero_orden(db),
                                     "mesa_id": st.session_state.orden_actual['mesa'],
                                     "mesero_id": st.session_state.orden_actual['mesero'],
                                     "items": items_to_display,
                                     "comentarios": current_comments,
-                                    "estado": "pendiente",
+                                    **order_lifecycle.campos_orden_nueva(st.session_state.get('user_data', {}).get('usuario')),
                                     "fecha_creacion": datetime.now(timezone.utc).isoformat(),
                                     "total": current_subtotal
                                 }
@@ -1163,6 +1173,7 @@ if 'usuario' in st.session_state:
                             
                             try:
                                 db.save(order_to_save)
+                                couchdb_utils.registrar_orden_activa(db, order_to_save)
                                 st.success(message_success)
                                 logged_in_user = st.session_state.get('user_data', {}).get('usuario', 'Desconocido')
                                 couchdb_utils.log_action(db, logged_in_user, f"Orden #{order_to_save['numero_orden']} guardada")
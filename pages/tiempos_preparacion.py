@@ -0,0 +1,117 @@
+# pages/tiempos_preparacion.py
+import streamlit as st
+import couchdb_utils
+import prep_times
+import os
+from datetime import datetime, timedelta
+import pandas as pd
+import plotly.express as px
+
+# --- Configuración Inicial ---
+st.set_page_config(layout="wide", page_title="Tiempos de Preparación", page_icon="../assets/LOGO.png")
+archivo_actual_relativo = os.path.join(os.path.basename(os.path.dirname(__file__)), os.path.basename(__file__))
+couchdb_utils.generarLogin(archivo_actual_relativo)
+
+# --- Funciones auxiliares ---
+def formatear_minutos(segundos):
+    """Convierte segundos a minutos con un decimal (None si no hay dato)"""
+    return round(segundos / 60, 1) if segundos is not None else None
+
+# --- Lógica Principal ---
+if 'usuario' in st.session_state:
+    db = couchdb_utils.get_database_instance()
+
+    if db:
+        st.title("⏱️ Tiempos de Preparación - Cocina y Bar")
+        st.caption("Tiempo entre la creación de la orden y el despacho de cada item, por plato, día y hora.")
+        st.markdown("---")
+
+        stats = couchdb_utils.get_prep_time_stats(db)
+        platos = {p['_id']: p.get('descripcion', p['_id']) for p in couchdb_utils.get_catalog_documents(db, "platos")}
+
+        # Filtros
+        col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
+        with col1:
+            estacion = st.selectbox("Estación:", ["cocina", "bar"], format_func=str.capitalize)
+        with col2:
+            dias_sel = st.multiselect("Días de la semana:", prep_times.DIAS_SEMANA, placeholder="Todos")
+        with col3:
+            hora_desde, hora_hasta = st.slider("Horas (hora local de la orden):", 0, 23, (0, 23))
+        with col4:
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("🔄 Actualizar", use_container_width=True):
+                stats.invalidar()
+                st.rerun()
+
+        dias = [prep_times.DIAS_SEMANA.index(d) for d in dias_sel] or None
+        horas = list(range(hora_desde, hora_hasta + 1)) if (hora_desde, hora_hasta) != (0, 23) else None
+
+        try:
+            resumen = stats.percentiles(estacion, dias=dias, horas=horas)
+            tabla = stats.tabla_platos(estacion, dias=dias, horas=horas)
+        except Exception as e:
+            st.error(f"Error al leer los tiempos de preparación: {e}")
+            st.stop()
+
+        # Métricas de la estación
+        col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+        with col_m1:
+            st.metric("Items medidos", resumen['muestras'])
+        with col_m2:
+            st.metric("p50 (min)", formatear_minutos(resumen['p50']))
+        with col_m3:
+            st.metric("p90 (min)", formatear_minutos(resumen['p90']))
+        with col_m4:
+            st.metric("p99 (min)", formatear_minutos(resumen['p99']))
+
+        if not tabla:
+            st.info("No hay despachos registrados para los filtros seleccionados.")
+        else:
+            # Platos ordenados por p90: los primeros son los que frenan la estación
+            st.subheader("🐢 Platos más lentos (ordenados por p90)")
+            df = pd.DataFrame([{
+                'Plato': platos.get(fila['plato_id'], fila['plato_id']),
+                'Items': fila['muestras'],
+                'p50 (min)': formatear_minutos(fila['p50']),
+                'p90 (min)': formatear_minutos(fila['p90']),
+                'p99 (min)': formatear_minutos(fila['p99']),
+            } for fila in tabla])
+
+            fig = px.bar(df.head(15), x='Plato', y=['p50 (min)', 'p90 (min)'], barmode='group',
+                         title="Tiempos de preparación por plato (15 más lentos)")
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(df, use_container_width=True, hide_index=True)
+
+        # Rendimiento: items despachados por hora
+        st.markdown("---")
+        st.subheader("📈 Rendimiento (items despachados por hora)")
+        hoy = datetime.now(prep_times.ZONA_HORARIA).date()
+        rango = st.date_input("Período:", (hoy - timedelta(days=6), hoy), key="rango_rendimiento")
+        if isinstance(rango, (list, tuple)) and len(rango) == 2:
+            try:
+                filas = prep_times.rendimiento(db, estacion, rango[0], rango[1])
+            except Exception as e:
+                st.error(f"Error al leer el rendimiento: {e}")
+                filas = []
+
+            if not filas:
+                st.info("No hay despachos en el período seleccionado.")
+            else:
+                df_rend = pd.DataFrame(filas)
+                por_hora = df_rend.groupby('hora', as_index=False)['items'].mean()
+                fig_rend = px.bar(por_hora, x='hora', y='items',
+                                  labels={'hora': 'Hora', 'items': 'Items por hora (promedio)'},
+                                  title=f"Promedio de items despachados por hora - {estacion.capitalize()}")
+                st.plotly_chart(fig_rend, use_container_width=True)
+
+                col_r1, col_r2 = st.columns(2)
+                with col_r1:
+                    st.metric("Total despachado", int(df_rend['items'].sum()))
+                with col_r2:
+                    pico = df_rend.loc[df_rend['items'].idxmax()]
+                    st.metric("Hora pico", f"{pico['fecha']} {int(pico['hora']):02d}:00", f"{int(pico['items'])} items")
+
+    else:
+        st.error("No se pudo conectar a la base de datos.")
+else:
+    st.info("Por favor, inicia sesión para acceder a esta página.")
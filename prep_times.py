@@ -0,0 +1,226 @@
+# prep_times.py
+"""
+Tiempos de preparación de cocina y bar: percentiles (p50/p90/p99) por plato,
+estación, día de la semana y hora, rendimiento (items despachados por hora) y
+hora estimada en que estará listo un item pendiente.
+
+Cada evento de despacho (dispatch_events) guarda su muestra: segundos entre el
+momento en que el item se agregó a la orden ('fecha_agregado' del item, o la
+creación de la orden en items anteriores sin ella) y el despacho, y el día/hora
+local de ese momento. Las vistas
+'_design/prep' de la partición 'despachos' (db_bootstrap.DESIGN_DOCS) las agregan
+en histogramas por cubetas de ANCHO_CUBETA_SEGUNDOS; CouchDB las actualiza de forma
+incremental con cada evento nuevo, así que las consultas nunca recorren las órdenes
+históricas.
+
+Se obtiene con couchdb_utils.get_prep_time_stats(db).
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+import pytz
+
+DESPACHOS_PARTITION_KEY = "despachos"
+
+# Zona horaria con la que se agrupan las muestras por día de la semana y hora
+ZONA_HORARIA = pytz.timezone('America/El_Salvador')
+
+# Resolución del histograma y tiempo máximo considerado (las muestras mayores caen en la última cubeta)
+ANCHO_CUBETA_SEGUNDOS = 30
+MAX_SEGUNDOS = 4 * 3600
+
+PERCENTILES = (50, 90, 99)
+
+# Muestras mínimas en una franja (día y hora) para usarla en la estimación; si no, se usa el total del plato
+MIN_MUESTRAS_FRANJA = 5
+
+# Cada cuánto se vuelven a leer los histogramas de CouchDB
+VIGENCIA_SEGUNDOS = 300
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+VISTA_HISTOGRAMA = f'_partition/{DESPACHOS_PARTITION_KEY}/_design/prep/_view/histograma'
+VISTA_RENDIMIENTO = f'_partition/{DESPACHOS_PARTITION_KEY}/_design/prep/_view/rendimiento'
+
+
+def _parse_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor
+    try:
+        return datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+
+
+def inicio_item(fecha_orden, fecha_agregado=None):
+    """
+    Momento desde el que se mide la preparación de un item: cuando se agregó a la orden
+    ('fecha_agregado'), o la creación de la orden si el item no la tiene. Un item agregado
+    al carrito antes de enviar la orden se mide desde la creación de la orden. None si no
+    hay ninguna fecha válida.
+    """
+    fechas = [f for f in (_parse_fecha(fecha_orden), _parse_fecha(fecha_agregado)) if f is not None and f.tzinfo is not None]
+    return max(fechas) if fechas else None
+
+
+def campos_muestra(plato_id, fecha_orden, fecha_despacho, fecha_agregado=None):
+    """
+    Campos de la muestra de tiempo de preparación que se guardan en el evento de despacho.
+    Sin una fecha de orden ni de item válida solo se incluyen los campos de rendimiento.
+    """
+    fin = _parse_fecha(fecha_despacho)
+    if fin is None or fin.tzinfo is None:
+        return {}
+    fin_local = fin.astimezone(ZONA_HORARIA)
+    campos = {
+        "plato_id": plato_id,
+        # Para el rendimiento (items despachados por hora local)
+        "fecha_local_despacho": fin_local.strftime('%Y-%m-%d'),
+        "hora_despacho": fin_local.hour,
+    }
+    inicio = inicio_item(fecha_orden, fecha_agregado)
+    if inicio is not None:
+        inicio_local = inicio.astimezone(ZONA_HORARIA)
+        campos.update({
+            "fecha_inicio": inicio.isoformat(),
+            "segundos_preparacion": max(int((fin - inicio).total_seconds()), 0),
+            "dia_semana": inicio_local.weekday(),  # 0 = lunes
+            "hora": inicio_local.hour,
+        })
+    return campos
+
+
+def percentiles_histograma(cubetas, percentiles=PERCENTILES):
+    """
+    Calcula percentiles (en segundos, centro de la cubeta) a partir de {cubeta: cantidad}.
+    Retorna {'muestras': n, 'p50': s, ...}; los percentiles son None si no hay muestras.
+    """
+    total = sum(cubetas.values())
+    resultado = {'muestras': total}
+    orden = sorted(cubetas.items())
+    for p in percentiles:
+        valor = None
+        if total:
+            objetivo = p / 100 * total
+            acumulado = 0
+            for cubeta, cantidad in orden:
+                acumulado += cantidad
+                if acumulado >= objetivo:
+                    valor = min((cubeta + 0.5) * ANCHO_CUBETA_SEGUNDOS, MAX_SEGUNDOS)
+                    break
+        resultado[f'p{p}'] = valor
+    return resultado
+
+
+def _sumar(destino, origen):
+    for cubeta, cantidad in origen.items():
+        destino[cubeta] = destino.get(cubeta, 0) + cantidad
+
+
+class TiemposPreparacion:
+    """
+    Histogramas de tiempos de preparación leídos de la vista 'histograma' (una petición agrupada)
+    y renovados cada VIGENCIA_SEGUNDOS, acumulados por franja (estacion, plato_id, dia_semana, hora),
+    por plato y por estación.
+    """
+
+    def __init__(self, db, vigencia=VIGENCIA_SEGUNDOS):
+        self._db = db
+        self._vigencia = vigencia
+        self._lock = threading.Lock()
+        self._datos_cache = ({}, {}, {})
+        self._leido = 0
+
+    def _cargar(self):
+        """Retorna los histogramas por franja, por plato y por estación."""
+        por_franja, por_plato, por_estacion = {}, {}, {}
+        for row in self._db.view(VISTA_HISTOGRAMA, group_level=5):
+            estacion, plato_id, dia, hora, cubeta = row.key
+            por_franja.setdefault((estacion, plato_id, dia, hora), {})[cubeta] = row.value
+            for acumulado in (por_plato.setdefault((estacion, plato_id), {}), por_estacion.setdefault(estacion, {})):
+                acumulado[cubeta] = acumulado.get(cubeta, 0) + row.value
+        return por_franja, por_plato, por_estacion
+
+    def _datos(self):
+        with self._lock:
+            if time.time() - self._leido > self._vigencia:
+                self._datos_cache = self._cargar()
+                self._leido = time.time()
+            return self._datos_cache
+
+    def invalidar(self):
+        """Obliga a releer los histogramas en la próxima consulta."""
+        with self._lock:
+            self._leido = 0
+
+    def _histograma(self, estacion, plato_id=None, dias=None, horas=None):
+        cubetas = {}
+        for (est, plato, dia, hora), histograma in self._datos()[0].items():
+            if est != estacion or (plato_id is not None and plato != plato_id):
+                continue
+            if (dias is not None and dia not in dias) or (horas is not None and hora not in horas):
+                continue
+            _sumar(cubetas, histograma)
+        return cubetas
+
+    def percentiles(self, estacion, plato_id=None, dias=None, horas=None):
+        """Percentiles de la estación (o de un plato), opcionalmente limitados a días (0 = lunes) y horas."""
+        return percentiles_histograma(self._histograma(estacion, plato_id, dias, horas))
+
+    def tabla_platos(self, estacion, dias=None, horas=None):
+        """
+        Una fila por plato con {'plato_id', 'muestras', 'p50', 'p90', 'p99'} (segundos),
+        ordenada de mayor a menor p90: los primeros son los que frenan la estación.
+        """
+        por_plato = {}
+        for (est, plato, dia, hora), histograma in self._datos()[0].items():
+            if est != estacion:
+                continue
+            if (dias is not None and dia not in dias) or (horas is not None and hora not in horas):
+                continue
+            _sumar(por_plato.setdefault(plato, {}), histograma)
+        filas = [dict(percentiles_histograma(cubetas), plato_id=plato) for plato, cubetas in por_plato.items()]
+        return sorted(filas, key=lambda f: f['p90'] or 0, reverse=True)
+
+    def segundos_esperados(self, estacion, plato_id, momento, percentil=50):
+        """
+        Tiempo de preparación esperado (segundos) de un plato pedido en `momento`:
+        el de su misma franja (día y hora) si tiene muestras suficientes, si no el del plato
+        y, como último recurso, el de la estación. None si no hay ninguna muestra.
+        """
+        por_franja, por_plato, por_estacion = self._datos()
+        local = momento.astimezone(ZONA_HORARIA)
+        candidatos = [
+            (por_franja.get((estacion, plato_id, local.weekday(), local.hour), {}), MIN_MUESTRAS_FRANJA),
+            (por_plato.get((estacion, plato_id), {}), 1),
+            (por_estacion.get(estacion, {}), 1),
+        ]
+        for cubetas, minimo in candidatos:
+            if sum(cubetas.values()) >= minimo:
+                return percentiles_histograma(cubetas, (percentil,))[f'p{percentil}']
+        return None
+
+    def estimar_listo(self, orden, item, estacion, percentil=50):
+        """Hora (datetime con zona) en que se espera tener listo el item, o None si no hay datos."""
+        inicio = inicio_item(orden.get('fecha_creacion'), item.get('fecha_agregado'))
+        if inicio is None:
+            return None
+        segundos = self.segundos_esperados(estacion, item.get('plato_id'), inicio, percentil)
+        if segundos is None:
+            return None
+        return inicio + timedelta(seconds=segundos)
+
+
+def rendimiento(db, estacion, desde, hasta):
+    """
+    Items despachados por hora en la estación entre dos fechas locales (date), ambas inclusive.
+    Retorna una lista de dicts {'fecha', 'hora', 'items'} ordenada por fecha y hora.
+    """
+    rows = db.view(
+        VISTA_RENDIMIENTO,
+        startkey=[estacion, desde.strftime('%Y-%m-%d')],
+        endkey=[estacion, hasta.strftime('%Y-%m-%d'), {}],
+        group_level=3,
+    )
+    return [{'fecha': row.key[1], 'hora': row.key[2], 'items': row.value} for row in rows]
@@ -0,0 +1,138 @@
+# recipe_engine.py
+"""
+Recetas compiladas (lista de materiales) de los platos, compartidas por todas las
+sesiones del proceso.
+
+Se arman a partir de las relaciones de la partición 'plato_ingrediente' (página
+Plato - Ingrediente) que están en la caché de catálogos: cada plato queda como una
+tupla de (ingrediente_id, cantidad) en la unidad del ingrediente, con las
+sub-recetas (relaciones cuyo ingrediente_id es otro plato) ya expandidas. Se
+recompilan solo cuando cambian las relaciones o los ingredientes, así que el
+descuento de inventario de una venta es una búsqueda en un diccionario.
+
+Se obtiene con couchdb_utils.get_recipe_engine(db).
+"""
+
+import threading
+
+PARTICION_RELACIONES = "plato_ingrediente"
+PARTICION_PLATOS = "platos"
+
+# Particiones de catálogo de las que dependen las recetas
+PARTICIONES_RECETAS = {PARTICION_RELACIONES, "ingredientes"}
+
+# Equivalencias entre unidades: 1 <unidad> = N <otra unidad> (la misma tabla de las páginas de ingredientes)
+UNIDADES_CONVERSION = {
+    "botella": {"shot": 24, "unidad": 1},
+    "litro": {"shot": 36, "unidad": 1},
+    "medio litro": {"shot": 18, "unidad": 1},
+}
+
+
+def convertir_unidad(cantidad, unidad_origen, unidad_base):
+    """
+    Convierte `cantidad` de unidad_origen a unidad_base (p. ej. 12 shot -> 0.5 botella).
+    Sin unidad en alguno de los lados, o con la misma, la cantidad no cambia.
+    Retorna None si no hay equivalencia entre las dos unidades.
+    """
+    if not unidad_origen or not unidad_base or unidad_origen == unidad_base:
+        return cantidad
+    if unidad_origen in UNIDADES_CONVERSION.get(unidad_base, {}):
+        return cantidad / UNIDADES_CONVERSION[unidad_base][unidad_origen]
+    if unidad_base in UNIDADES_CONVERSION.get(unidad_origen, {}):
+        return cantidad * UNIDADES_CONVERSION[unidad_origen][unidad_base]
+    return None
+
+
+def compilar_recetas(relaciones, ingredientes):
+    """
+    Retorna {plato_id: ((ingrediente_id, cantidad), ...)} con las cantidades por unidad
+    de plato en la unidad de cada ingrediente.
+    relaciones: documentos de 'plato_ingrediente'; ingredientes: documentos de 'ingredientes'.
+    Una relación que apunta a un plato se expande con la receta de ese plato; los ciclos
+    y las relaciones a ingredientes inexistentes o sin equivalencia de unidad se ignoran.
+    """
+    unidades = {ing['_id']: ing.get('unidad') for ing in ingredientes}
+    por_plato = {}
+    for rel in relaciones:
+        if rel.get('plato_id') and rel.get('ingrediente_id'):
+            por_plato.setdefault(rel['plato_id'], []).append(rel)
+
+    compiladas = {}
+
+    def expandir(plato_id, en_curso):
+        if plato_id in compiladas:
+            return compiladas[plato_id]
+        if plato_id in en_curso:
+            print(f"Receta circular en '{plato_id}': se ignora la sub-receta")
+            return {}
+        en_curso.add(plato_id)
+        consumo = {}
+        for rel in por_plato.get(plato_id, []):
+            componente = rel['ingrediente_id']
+            cantidad = float(rel.get('cantidad') or 0)
+            if componente.startswith(f"{PARTICION_PLATOS}:"):
+                for ingrediente_id, por_unidad in expandir(componente, en_curso).items():
+                    consumo[ingrediente_id] = consumo.get(ingrediente_id, 0) + por_unidad * cantidad
+                continue
+            if componente not in unidades:
+                continue
+            cantidad = convertir_unidad(cantidad, rel.get('unidad'), unidades[componente])
+            if cantidad is None:
+                print(f"Sin equivalencia de '{rel.get('unidad')}' a '{unidades[componente]}' en la relación {rel.get('_id')}")
+                continue
+            consumo[componente] = consumo.get(componente, 0) + cantidad
+        en_curso.discard(plato_id)
+        compiladas[plato_id] = consumo
+        return consumo
+
+    for plato_id in por_plato:
+        expandir(plato_id, set())
+    return {plato_id: tuple(consumo.items()) for plato_id, consumo in compiladas.items() if consumo}
+
+
+class MotorRecetas:
+    """
+    Recetas compiladas sobre la caché de catálogos (catalog_cache.CatalogoCache).
+    Se recompilan en el hilo del feed cuando cambian las relaciones plato-ingrediente
+    o los ingredientes.
+    """
+
+    def __init__(self, catalogo):
+        self._catalogo = catalogo
+        self._lock = threading.Lock()
+        self._recetas = {}
+        self._version = 0
+        self._recompilar()
+        catalogo.suscribir(self._catalogo_modificado)
+
+    def receta(self, plato_id):
+        """Tupla de (ingrediente_id, cantidad) por unidad del plato; None si el plato no tiene receta."""
+        return self._recetas.get(plato_id)
+
+    def consumo(self, platos_vendidos):
+        """Consumo total {ingrediente_id: cantidad} de [(plato_id, cantidad_vendida)] con receta."""
+        recetas = self._recetas
+        total = {}
+        for plato_id, cantidad_vendida in platos_vendidos:
+            for ingrediente_id, por_unidad in recetas.get(plato_id, ()):
+                total[ingrediente_id] = total.get(ingrediente_id, 0) + por_unidad * cantidad_vendida
+        return total
+
+    def version(self):
+        """Contador que aumenta cada vez que se recompilan las recetas."""
+        return self._version
+
+    def _recompilar(self):
+        recetas = compilar_recetas(
+            self._catalogo.obtener(PARTICION_RELACIONES),
+            self._catalogo.obtener("ingredientes"),
+        )
+        with self._lock:
+            # Se reemplaza el mapa completo: los lectores nunca ven uno a medio compilar
+            self._recetas = recetas
+            self._version += 1
+
+    def _catalogo_modificado(self, particiones):
+        if PARTICIONES_RECETAS & set(particiones):
+            self._recompilar()
@@ -0,0 +1,151 @@
+# render_queue.py
+"""
+Generación de PDFs (tickets de cobro, órdenes enviadas a caja, cierres X/Z) en
+un grupo de hilos del proceso, fuera del script de Streamlit.
+
+La página encola el trabajo con encolar() y recibe de inmediato un identificador
+('<doc_id>/<nombre_adjunto>'); el PDF terminado se guarda como adjunto del
+documento (ticket o cierre), por lo que cobrar una cuenta o enviar una orden a
+caja nunca espera a que fpdf arme el documento. Con el identificador, la página
+consulta estado() y obtiene los bytes con resultado(), que también sirve para
+reimprimir leyendo el adjunto cuando el trabajo ya no está en memoria.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import couchdb
+
+# Estados de un trabajo
+PENDIENTE = "pendiente"
+LISTO = "listo"
+ERROR = "error"
+
+TIPO_PDF = "application/pdf"
+
+# Hilos que generan PDFs en paralelo
+HILOS = 2
+
+# Trabajos terminados que se conservan en memoria (los más viejos se leen del adjunto)
+MAX_TRABAJOS = 200
+
+# Reintentos al guardar el adjunto ante conflictos de _rev
+MAX_REINTENTOS = 5
+
+
+def handle(doc_id, nombre):
+    """Identificador del trabajo: el documento y el nombre del adjunto donde queda el PDF."""
+    return f"{doc_id}/{nombre}"
+
+
+def _partes(handle_trabajo):
+    doc_id, _, nombre = handle_trabajo.rpartition('/')
+    return doc_id, nombre
+
+
+class ColaRender:
+    """Cola de generación de PDFs atendida por un grupo de hilos y guardada como adjuntos en CouchDB."""
+
+    def __init__(self, db, hilos=HILOS, max_trabajos=MAX_TRABAJOS):
+        self._db = db
+        self._executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="render")
+        self._max_trabajos = max_trabajos
+        self._trabajos = OrderedDict()  # handle -> {'estado', 'pdf', 'error'}
+        self._lock = threading.Lock()
+        self.generados = 0
+        self.ultimo_error = None
+
+    def encolar(self, doc_id, nombre, generador, *args, **kwargs):
+        """
+        Encola generador(*args, **kwargs) -> bytes y retorna el identificador del trabajo sin esperar.
+        El resultado se guarda como adjunto `nombre` del documento `doc_id` (que ya debe existir).
+        """
+        clave = handle(doc_id, nombre)
+        with self._lock:
+            self._trabajos[clave] = {'estado': PENDIENTE, 'pdf': None, 'error': None}
+            self._trabajos.move_to_end(clave)
+            while len(self._trabajos) > self._max_trabajos:
+                self._trabajos.popitem(last=False)
+        self._executor.submit(self._ejecutar, clave, generador, args, kwargs)
+        return clave
+
+    def estado(self, handle_trabajo):
+        """PENDIENTE, LISTO o ERROR. Un trabajo que ya no está en memoria está LISTO si existe su adjunto."""
+        with self._lock:
+            trabajo = self._trabajos.get(handle_trabajo)
+        if trabajo is not None:
+            return trabajo['estado']
+        return LISTO if self._leer_adjunto(handle_trabajo) is not None else ERROR
+
+    def error(self, handle_trabajo):
+        """Mensaje de error del trabajo (None si no falló)."""
+        with self._lock:
+            trabajo = self._trabajos.get(handle_trabajo)
+        return trabajo['error'] if trabajo else None
+
+    def resultado(self, handle_trabajo):
+        """Bytes del PDF si está listo (de memoria o del adjunto del documento); None si no."""
+        with self._lock:
+            trabajo = self._trabajos.get(handle_trabajo)
+        if trabajo is not None:
+            return trabajo['pdf']
+        return self._leer_adjunto(handle_trabajo)
+
+    def _leer_adjunto(self, handle_trabajo):
+        doc_id, nombre = _partes(handle_trabajo)
+        try:
+            adjunto = self._db.get_attachment(doc_id, nombre)
+            return adjunto.read() if adjunto is not None else None
+        except Exception as e:
+            print(f"Error al leer el adjunto '{handle_trabajo}': {e}")
+            return None
+
+    def _guardar_adjunto(self, handle_trabajo, pdf):
+        doc_id, nombre = _partes(handle_trabajo)
+        for intento in range(MAX_REINTENTOS):
+            doc = self._db.get(doc_id)
+            if doc is None:
+                raise ValueError(f"No existe el documento '{doc_id}' para guardar el PDF")
+            try:
+                self._db.put_attachment(doc, pdf, nombre, TIPO_PDF)
+                return
+            except couchdb.http.ResourceConflict:
+                # Otra terminal modificó el documento: se vuelve a leer su _rev
+                time.sleep(random.uniform(0, 0.02 * (intento + 1)))
+        raise RuntimeError(f"No se pudo guardar el adjunto '{handle_trabajo}' tras {MAX_REINTENTOS} intentos")
+
+    def _ejecutar(self, handle_trabajo, generador, args, kwargs):
+        try:
+            pdf = bytes(generador(*args, **kwargs))
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"Error al generar el PDF '{handle_trabajo}': {e}")
+            self._actualizar(handle_trabajo, estado=ERROR, error=str(e))
+            return
+
+        # El PDF queda disponible para la página antes de terminar de subirlo a CouchDB
+        self._actualizar(handle_trabajo, estado=LISTO, pdf=pdf)
+        self.generados += 1
+        try:
+            self._guardar_adjunto(handle_trabajo, pdf)
+        except Exception as e:
+            self.ultimo_error = str(e)
+            print(f"Error al guardar el PDF '{handle_trabajo}' como adjunto: {e}")
+
+    def _actualizar(self, handle_trabajo, **campos):
+        with self._lock:
+            trabajo = self._trabajos.get(handle_trabajo)
+            if trabajo is not None:
+                trabajo.update(campos)
+
+    def info(self):
+        """Información de diagnóstico de la cola."""
+        with self._lock:
+            pendientes = sum(1 for t in self._trabajos.values() if t['estado'] == PENDIENTE)
+        return {
+            'pendientes': pendientes,
+            'generados': self.generados,
+            'ultimo_error': self.ultimo_error,
+        }
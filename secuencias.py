@@ -0,0 +1,149 @@
+# secuencias.py
+"""
+Numeración correlativa de órdenes, tickets, Cierres X y Cierres Z.
+
+Cada secuencia vive en un único documento contador ('secuencias:<nombre>') que se
+incrementa con control optimista por '_rev': si dos terminales piden número al
+mismo tiempo, una recibe 409 y reintenta con el valor nuevo, así que un número
+nunca se entrega dos veces y cada asignación cuesta una lectura y una escritura.
+"""
+
+import random
+import threading
+import time
+import couchdb
+
+SECUENCIAS_PARTITION_KEY = "secuencias"
+
+# Secuencias conocidas y la clave de configuración con su número inicial (si existe)
+SECUENCIAS = {
+    "ordenes": "numero_orden_inicial",
+    "tickets": "numero_ticket_inicial",
+    "cierres_x": None,
+    "cierres_z": None,
+}
+
+# Reintentos ante conflictos de _rev antes de rendirse
+MAX_REINTENTOS = 25
+
+# Tamaño de bloque preasignado por proceso (1 = sin preasignación, numeración estrictamente continua).
+# Con bloques > 1 cada proceso reserva varios números de una vez; un reinicio deja huecos.
+TAMANO_BLOQUE = {
+    "ordenes": 1,
+    "tickets": 1,
+    "cierres_x": 1,
+    "cierres_z": 1,
+}
+
+# Bloques reservados por este proceso: secuencia -> [siguiente, ultimo_reservado]
+_bloques = {}
+_bloques_lock = threading.Lock()
+
+
+def _contador_id(secuencia):
+    return f"{SECUENCIAS_PARTITION_KEY}:{secuencia}"
+
+
+def _max_vista_ordenes(db):
+    rows = db.view('_partition/ordenes/_design/orders/_view/by_order_number', limit=1, descending=True).rows
+    return int(rows[0].key) if rows else 0
+
+
+def _max_campo_indexado(db, particion, campo):
+    query = {
+        "selector": {campo: {"$gt": None}},
+        "fields": [campo],
+        "sort": [{campo: "desc"}],
+        "limit": 1,
+    }
+    _, _, data = db.resource('_partition', particion, '_find').post_json(body=query)
+    docs = data.get('docs', [])
+    return int(docs[0][campo]) if docs else 0
+
+
+def _max_campo_particion(db, particion, campo):
+    maximo = 0
+    for row in db.view(f'_partition/{particion}/_all_docs', include_docs=True):
+        numero = row.doc.get(campo, 0)
+        if isinstance(numero, int) and numero > maximo:
+            maximo = numero
+    return maximo
+
+
+def _ultimo_numero_existente(db, secuencia):
+    """Último número ya usado en los documentos, para sembrar un contador que aún no existe."""
+    if secuencia == "ordenes":
+        return _max_vista_ordenes(db)
+    if secuencia == "tickets":
+        return _max_campo_indexado(db, "tickets", "numero_ticket")
+    if secuencia == "cierres_x":
+        return _max_campo_particion(db, "cierres_x", "numero_cierre_x")
+    if secuencia == "cierres_z":
+        return _max_campo_particion(db, "cierres_z", "numero_cierre_z")
+    return 0
+
+
+def _leer_contador(db, secuencia):
+    contador = db.get(_contador_id(secuencia))
+    if contador is None:
+        contador = {
+            "_id": _contador_id(secuencia),
+            "type": SECUENCIAS_PARTITION_KEY,
+            "secuencia": secuencia,
+            "ultimo": _ultimo_numero_existente(db, secuencia),
+        }
+    return contador
+
+
+def _reservar(db, secuencia, cantidad, inicial):
+    """
+    Incrementa el contador en `cantidad` y retorna el primer número reservado.
+    El primer número nunca es menor que `inicial`.
+    """
+    for intento in range(MAX_REINTENTOS):
+        contador = _leer_contador(db, secuencia)
+        primero = max(int(contador.get('ultimo', 0)) + 1, inicial)
+        contador['ultimo'] = primero + cantidad - 1
+        contador['fecha_modificacion'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        try:
+            db.save(contador)
+            return primero
+        except couchdb.http.ResourceConflict:
+            # Otra terminal tomó un número: esperar un poco y volver a leer
+            time.sleep(random.uniform(0, 0.02 * (intento + 1)))
+    raise RuntimeError(f"No se pudo asignar un número de '{secuencia}' tras {MAX_REINTENTOS} intentos")
+
+
+def siguiente_numero(db, secuencia, inicial=1):
+    """
+    Asigna y retorna el siguiente número de la secuencia (no se repite entre terminales).
+    inicial: número mínimo configurado (numero_orden_inicial / numero_ticket_inicial).
+    """
+    tamano = TAMANO_BLOQUE.get(secuencia, 1)
+    if tamano <= 1:
+        return _reservar(db, secuencia, 1, inicial)
+
+    with _bloques_lock:
+        bloque = _bloques.get(secuencia)
+        if bloque is None or bloque[0] > bloque[1] or bloque[0] < inicial:
+            primero = _reservar(db, secuencia, tamano, inicial)
+            bloque = [primero, primero + tamano - 1]
+            _bloques[secuencia] = bloque
+        numero = bloque[0]
+        bloque[0] += 1
+        return numero
+
+
+def proximo_numero(db, secuencia, inicial=1):
+    """Número que recibiría la próxima asignación, sin reservarlo (solo para mostrar)."""
+    with _bloques_lock:
+        bloque = _bloques.get(secuencia)
+        if bloque is not None and bloque[0] <= bloque[1]:
+            return max(bloque[0], inicial)
+    contador = _leer_contador(db, secuencia)
+    return max(int(contador.get('ultimo', 0)) + 1, inicial)
+
+
+def ultimo_numero(db, secuencia):
+    """Último número asignado de la secuencia."""
+    return int(_leer_contador(db, secuencia).get('ultimo', 0))
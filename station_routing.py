@@ -0,0 +1,151 @@
+# station_routing.py
+"""
+Índice plato -> estación de despacho (cocina, bar u otros), compartido por todas
+las sesiones del proceso.
+
+Se calcula a partir de los catálogos en memoria (platos y menús) y se recalcula
+solo cuando alguno de ellos cambia, así que cocina, bar y los monitores deciden a
+qué estación va cada item con una búsqueda en un diccionario.
+
+Se obtiene con couchdb_utils.get_station_router(db).
+"""
+
+import threading
+
+ESTACION_COCINA = "cocina"
+ESTACION_BAR = "bar"
+ESTACION_OTROS = "otros"
+ESTACIONES = [ESTACION_COCINA, ESTACION_BAR, ESTACION_OTROS]
+
+# Particiones de catálogo de las que depende el ruteo
+PARTICIONES_RUTEO = {"platos", "menu", "menus"}
+
+# Categorías que identifican cada estación
+CATEGORIAS_BAR = ['bar', 'bebida', 'bebidas', 'drink']
+CATEGORIAS_COCINA = ['cocina', 'comida', 'platos', 'food']
+
+# Palabras clave en la descripción del plato (último recurso)
+PALABRAS_BAR = [
+    'bebida', 'jugo', 'agua', 'gaseosa', 'refresco', 'cocktail',
+    'cerveza', 'licor', 'café', 'té', 'smoothie', 'cola', 'pepsi',
+    'cuba', 'libre', 'mojito', 'piña', 'colada', 'margarita',
+    'daiquiri', 'whisky', 'ron', 'vodka', 'tequila', 'ginebra',
+    'sangria', 'vino', 'champagne', 'limonada', 'naranjada',
+    'soda', 'sprite', 'fanta', 'cocacola', 'energética', 'isotónica',
+    'pilsener', 'pilsen', 'beer', 'lager'
+]
+PALABRAS_COCINA = [
+    'pollo', 'carne', 'res', 'cerdo', 'pescado', 'mariscos',
+    'pasta', 'espagueti', 'lasagna', 'pizza', 'hamburguesa',
+    'ensalada', 'sopa', 'sancocho', 'arroz', 'frijoles',
+    'tacos', 'quesadilla', 'burrito', 'torta', 'sandwich',
+    'filete', 'chuleta', 'costilla', 'camarones', 'salmon',
+    'verduras', 'vegetales', 'guisado', 'estofado', 'asado',
+    'frito', 'grillado', 'hornado', 'empanada', 'pupusa',
+    'alitas', 'alita', 'wings', 'wing', 'nuggets', 'pechuga',
+    'muslo', 'comida', 'plato', 'almuerzo', 'cena', 'desayuno',
+    'carnita', 'carnitas', 'chicharron'
+]
+
+
+def _nombres_menu(menus):
+    """Mapa _id -> nombre en minúsculas, para menús de 'menus' (nombre) y 'menu' (descripcion)."""
+    return {
+        menu['_id']: (menu.get('nombre') or menu.get('descripcion') or '').strip().lower()
+        for menu in menus
+    }
+
+
+def clasificar_plato(plato, nombres_menu):
+    """
+    Retorna la estación de un plato. En orden de prioridad:
+    1. Campo 'estacion' del plato (asignación manual desde la página de platos)
+    2. Menú del plato llamado "bar" o "cocina"
+    3. Categoría del plato
+    4. Palabras clave en la descripción (las de bar primero: 'refresco' contiene 'res')
+    """
+    estacion = plato.get('estacion')
+    if estacion in ESTACIONES:
+        return estacion
+
+    menu = nombres_menu.get(plato.get('id_menu') or plato.get('menu_id'), '')
+    if menu in (ESTACION_BAR, ESTACION_COCINA):
+        return menu
+
+    categoria = (plato.get('categoria') or '').lower()
+    if any(cat in categoria for cat in CATEGORIAS_BAR):
+        return ESTACION_BAR
+    if any(cat in categoria for cat in CATEGORIAS_COCINA):
+        return ESTACION_COCINA
+
+    nombre = (plato.get('descripcion') or '').lower()
+    if any(palabra in nombre for palabra in PALABRAS_BAR):
+        return ESTACION_BAR
+    if any(palabra in nombre for palabra in PALABRAS_COCINA):
+        return ESTACION_COCINA
+    return ESTACION_OTROS
+
+
+def clasificar_catalogo(platos, menus):
+    """Retorna {plato_id: estacion} para todos los platos dados."""
+    nombres_menu = _nombres_menu(menus)
+    return {plato['_id']: clasificar_plato(plato, nombres_menu) for plato in platos}
+
+
+class RuteoEstaciones:
+    """
+    Índice plato_id -> estación sobre la caché de catálogos (catalog_cache.CatalogoCache).
+    Se recalcula en el hilo del feed cuando cambian platos o menús y avisa a los
+    suscriptores registrados con al_cambiar().
+    """
+
+    def __init__(self, catalogo):
+        self._catalogo = catalogo
+        self._lock = threading.RLock()
+        self._por_plato = {}
+        self._por_estacion = {estacion: frozenset() for estacion in ESTACIONES}
+        self._version = 0
+        self._suscriptores = []
+        self._recalcular()
+        catalogo.suscribir(self._catalogo_modificado)
+
+    def estacion(self, plato_id):
+        """Estación del plato; None si el plato no existe en el catálogo."""
+        return self._por_plato.get(plato_id)
+
+    def platos(self, estacion):
+        """Conjunto (inmutable) de plato_id que se despachan en la estación."""
+        return self._por_estacion.get(estacion, frozenset())
+
+    def version(self):
+        """Contador que aumenta cada vez que se recalcula el índice."""
+        return self._version
+
+    def al_cambiar(self, callback):
+        """Registra `callback()` para después de cada recálculo. Corre en el hilo del feed."""
+        with self._lock:
+            self._suscriptores.append(callback)
+
+    def _recalcular(self):
+        por_plato = clasificar_catalogo(
+            self._catalogo.obtener("platos"),
+            self._catalogo.obtener("menus") + self._catalogo.obtener("menu"),
+        )
+        por_estacion = {estacion: set() for estacion in ESTACIONES}
+        for plato_id, estacion in por_plato.items():
+            por_estacion[estacion].add(plato_id)
+        with self._lock:
+            # Se reemplazan los índices completos: los lectores nunca ven uno a medio construir
+            self._por_plato = por_plato
+            self._por_estacion = {estacion: frozenset(ids) for estacion, ids in por_estacion.items()}
+            self._version += 1
+            return list(self._suscriptores)
+
+    def _catalogo_modificado(self, particiones):
+        if not PARTICIONES_RUTEO & set(particiones):
+            return
+        for callback in self._recalcular():
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error en suscriptor del ruteo de estaciones: {e}")
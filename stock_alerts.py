@@ -0,0 +1,128 @@
+# stock_alerts.py
+"""
+Alertas de stock bajo mantenidas por eventos, compartidas por todas las sesiones
+del proceso.
+
+El conjunto de alertas vigentes se calcula una vez y después solo se vuelven a
+evaluar los ingredientes que toca cada movimiento de inventario (avisos del libro
+de inventario). Un cambio en los ingredientes o en los límites de
+'alertas_stock' (documento de configuración en la caché de catálogos) reevalúa
+todo el conjunto. El dashboard, la página de configuración y caja leen las
+alertas de memoria.
+
+Se obtiene con couchdb_utils.get_stock_alerts(db).
+"""
+
+import threading
+
+# Límite mínimo para los ingredientes sin alerta configurada
+MINIMO_POR_DEFECTO = 10
+
+# Fracción del límite desde la que una alerta de stock bajo pasa a crítica
+FRACCION_CRITICA = 0.3
+
+CONFIGURACION_PARTITION_KEY = "configuracion"
+
+# Particiones de catálogo que obligan a reevaluar todas las alertas
+PARTICIONES_ALERTAS = {"ingredientes", CONFIGURACION_PARTITION_KEY}
+
+
+def evaluar(ingrediente, cantidad, limite_minimo):
+    """
+    Alerta del ingrediente para su stock y límite, o None si el stock es suficiente.
+    Un stock negativo (se vendió más de lo registrado) cuenta como agotado.
+    """
+    cantidad = max(float(cantidad), 0)
+    nombre = ingrediente.get('descripcion', 'Ingrediente sin nombre')
+    unidad = ingrediente.get('unidad', 'unidad')
+    alerta = {
+        'ingrediente_id': ingrediente['_id'],
+        'nombre': nombre,
+        'unidad': unidad,
+        'cantidad': cantidad,
+        'limite_configurado': limite_minimo,
+    }
+    if cantidad == 0:
+        return dict(alerta, tipo='critico', nivel='error',
+                    mensaje=f"🚨 CRÍTICO: {nombre} está AGOTADO (0 {unidad})")
+    if cantidad > limite_minimo:
+        return None
+    if cantidad <= limite_minimo * FRACCION_CRITICA:
+        return dict(alerta, tipo='critico', nivel='error',
+                    mensaje=f"🚨 CRÍTICO: Quedan solo {cantidad:.1f} {unidad} de {nombre} (límite: {limite_minimo})")
+    return dict(alerta, tipo='advertencia', nivel='warning',
+                mensaje=f"⚠️ STOCK BAJO: Quedan {cantidad:.1f} {unidad} de {nombre} (límite: {limite_minimo})")
+
+
+def limites_configurados(configuracion):
+    """{ingrediente_id: mínimo} de 'alertas_stock' en el documento de configuración del sistema."""
+    return {
+        ingrediente_id: alerta.get('minimo', MINIMO_POR_DEFECTO)
+        for ingrediente_id, alerta in (configuracion or {}).get('alertas_stock', {}).items()
+    }
+
+
+class AlertasStock:
+    """
+    Alertas vigentes {ingrediente_id: alerta} de los ingredientes activos, sobre el libro
+    de inventario (inventory_ledger.LibroInventario) y la caché de catálogos.
+    """
+
+    def __init__(self, libro, catalogo):
+        self._libro = libro
+        self._catalogo = catalogo
+        self._lock = threading.Lock()
+        self._alertas = {}
+        self._ingredientes = {}
+        self._limites = {}
+        self._reevaluar_todo()
+        catalogo.suscribir(self._catalogo_modificado)
+        libro.al_cambiar(self.reevaluar)
+
+    def alertas(self):
+        """Alertas vigentes, las críticas primero y luego por nombre."""
+        with self._lock:
+            alertas = list(self._alertas.values())
+        return sorted((dict(a) for a in alertas), key=lambda a: (a['tipo'] != 'critico', a['nombre']))
+
+    def alerta(self, ingrediente_id):
+        """Alerta vigente del ingrediente, o None."""
+        with self._lock:
+            alerta = self._alertas.get(ingrediente_id)
+        return dict(alerta) if alerta else None
+
+    def limite(self, ingrediente_id):
+        """Límite mínimo del ingrediente (el configurado o MINIMO_POR_DEFECTO)."""
+        return self._limites.get(ingrediente_id, MINIMO_POR_DEFECTO)
+
+    def reevaluar(self, ingrediente_ids):
+        """Vuelve a evaluar solo los ingredientes indicados (los que tocó un movimiento)."""
+        saldos = self._libro.saldos(ingrediente_ids)
+        with self._lock:
+            for ingrediente_id, cantidad in saldos.items():
+                ingrediente = self._ingredientes.get(ingrediente_id)
+                alerta = evaluar(ingrediente, cantidad, self.limite(ingrediente_id)) if ingrediente else None
+                if alerta:
+                    self._alertas[ingrediente_id] = alerta
+                else:
+                    self._alertas.pop(ingrediente_id, None)
+
+    def _reevaluar_todo(self):
+        ingredientes = {i['_id']: i for i in self._catalogo.obtener("ingredientes") if i.get('activo', 0) == 1}
+        # Como obtener_configuracion_sistema(), vale el primer documento de configuración
+        configuraciones = self._catalogo.obtener(CONFIGURACION_PARTITION_KEY)
+        limites = limites_configurados(configuraciones[0] if configuraciones else None)
+        saldos = self._libro.saldos(ingredientes)
+        alertas = {}
+        for ingrediente_id, ingrediente in ingredientes.items():
+            alerta = evaluar(ingrediente, saldos[ingrediente_id], limites.get(ingrediente_id, MINIMO_POR_DEFECTO))
+            if alerta:
+                alertas[ingrediente_id] = alerta
+        with self._lock:
+            self._ingredientes = ingredientes
+            self._limites = limites
+            self._alertas = alertas
+
+    def _catalogo_modificado(self, particiones):
+        if PARTICIONES_ALERTAS & set(particiones):
+            self._reevaluar_todo()